@@ -1,3 +1,36 @@
+import argparse
+import json
+import math
+import os
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from copy import deepcopy
+
+from .evaluation import evaluation_function, compile_task, copy_parameters, determine_context
+from .context.physical_quantity import default_parameters as quantity_default_parameters
+from .utility.expression_utilities import (
+    override_parsing_params,
+    parse_cache,
+    canonical_form_cache,
+    substitute,
+    substitution_trie_cache,
+    substitutions_sort_key,
+    elementary_functions_names,
+    special_symbols_names,
+    protect_elementary_functions_substitutions,
+    transform_unicode_greek_symbols,
+)
+from .utility.physical_quantity_utilities import (
+    SLR_quantity_parser,
+    SLR_quantity_parsing,
+    quantity_parsing_params_cache,
+    quantity_symbols_cache,
+)
+from .utility.tracing_utilities import evaluation_stages, record_stage_times
+
 benchmarks = [
     {
         "response": "2a",
@@ -55,3 +88,507 @@ benchmarks = [
         "params": {"strict_syntax": False}
     },
 ]
+
+
+
+def compiled_task_benchmark(cases=None, repetitions=5):
+    """
+        Compares the time needed to evaluate a response with evaluation_function
+        (cold path, everything is recomputed for each response) and with a task
+        that has been compiled once using compile_task (per-response path).
+        Returns a list with one dictionary per case, times are given in milliseconds.
+    """
+    if cases is None:
+        cases = benchmarks
+    results = []
+    for case in cases:
+        start = time.perf_counter()
+        for _ in range(repetitions):
+            evaluation_function(case["response"], case["answer"], deepcopy(case["params"]))
+        cold = (time.perf_counter()-start)/repetitions
+
+        start = time.perf_counter()
+        task = compile_task(case["answer"], deepcopy(case["params"]))
+        compile_time = time.perf_counter()-start
+
+        start = time.perf_counter()
+        for _ in range(repetitions):
+            task.evaluate(case["response"])
+        per_response = (time.perf_counter()-start)/repetitions
+
+        results.append(
+            {
+                "response": case["response"],
+                "answer": case["answer"],
+                "cold_ms": 1000*cold,
+                "compile_ms": 1000*compile_time,
+                "per_response_ms": 1000*per_response,
+            }
+        )
+    return results
+
+
+def measure(procedure, repetitions):
+    """
+        Returns the average time (in milliseconds) for one call of procedure
+        and the peak amount of memory (in kilobytes) allocated during one call.
+    """
+    start = time.perf_counter()
+    for _ in range(repetitions):
+        procedure()
+    duration = (time.perf_counter()-start)/repetitions
+    tracemalloc.start()
+    procedure()
+    allocated = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return 1000*duration, allocated/1024
+
+
+def parameter_plumbing_benchmark(cases=None, repetitions=20, parsing_parameters_copies=4):
+    """
+        Compares the parameter handling done for each request when everything is
+        deep-copied (the parameters, the context and, once for each criterion check,
+        the parsing parameters) with copying only what is changed during evaluation
+        and overriding single values in the frozen parsing parameters.
+        Returns a list with one dictionary per case, times are given in milliseconds
+        and allocations in kilobytes.
+    """
+    if cases is None:
+        cases = benchmarks
+    results = []
+    for case in cases:
+        task = compile_task(case["answer"], deepcopy(case["params"]))
+        parameters = {**case["params"], "reserved_expressions_strings": {"learner": {}, "task": {}}}
+        parsing_parameters = task.parsing_parameters
+        mutable_parsing_parameters = dict(parsing_parameters)
+
+        def deep_copies():
+            deepcopy(task.params)
+            deepcopy(task.context)
+            for _ in range(parsing_parameters_copies):
+                copied = deepcopy(mutable_parsing_parameters)
+                copied.update({"simplify": False, "evaluate": False})
+
+        def frozen():
+            copy_parameters(task.params)
+            determine_context(parameters)
+            for _ in range(parsing_parameters_copies):
+                override_parsing_params(parsing_parameters, simplify=False, evaluate=False)
+
+        deep_copy_ms, deep_copy_kb = measure(deep_copies, repetitions)
+        frozen_ms, frozen_kb = measure(frozen, repetitions)
+        results.append(
+            {
+                "response": case["response"],
+                "answer": case["answer"],
+                "deepcopy_ms": deep_copy_ms,
+                "deepcopy_kb": deep_copy_kb,
+                "frozen_ms": frozen_ms,
+                "frozen_kb": frozen_kb,
+            }
+        )
+    return results
+
+
+def criteria_graph_serialisation_benchmark(cases=None, repetitions=10):
+    """
+        Estimates how much of the time for a request is spent serialising the
+        criteria graphs (as json and mermaid diagrams) by comparing the time needed
+        to evaluate a response with and without test data using a compiled task.
+        The criteria graphs are only serialised when test data is requested.
+        Returns a list with one dictionary per case, times are given in milliseconds.
+    """
+    if cases is None:
+        cases = benchmarks
+    results = []
+    for case in cases:
+        task = compile_task(case["answer"], deepcopy(case["params"]))
+        task.evaluate(case["response"])
+        without_test_data = []
+        with_test_data = []
+        for _ in range(repetitions):
+            start = time.perf_counter()
+            task.evaluate(case["response"])
+            without_test_data.append(time.perf_counter()-start)
+            start = time.perf_counter()
+            task.evaluate(case["response"], include_test_data=True)
+            with_test_data.append(time.perf_counter()-start)
+        request_time = statistics.median(with_test_data)
+        serialisation_time = max(0.0, request_time-statistics.median(without_test_data))
+        results.append(
+            {
+                "response": case["response"],
+                "answer": case["answer"],
+                "request_ms": 1000*request_time,
+                "serialisation_ms": 1000*serialisation_time,
+                "serialisation_share": serialisation_time/request_time,
+            }
+        )
+    return results
+
+
+def substitution_benchmark(lengths=(100, 1000, 10000), repetitions=20):
+    """
+        Times `substitute` on long responses with the substitutions used when
+        elementary functions and all Greek letter aliases are enabled.
+        The first call includes building the trie for the substitutions,
+        later calls use the cached trie. Times are given in milliseconds.
+    """
+    names = [name for (name, aliases) in elementary_functions_names+special_symbols_names]
+    aliases = [alias for (name, alias_list) in elementary_functions_names+special_symbols_names for alias in alias_list]
+    all_names = " ".join(names+aliases)
+    substitutions = list(set(protect_elementary_functions_substitutions(all_names)+transform_unicode_greek_symbols(all_names)))
+    substitutions.sort(key=substitutions_sort_key)
+    term = "sin(alpha*x)+arccos(β*y)*exp(z)-ln(theta)/Gamma "
+    results = []
+    for length in lengths:
+        response = (term*(length//len(term)+1))[:length]
+        substitution_trie_cache.clear()
+        start = time.perf_counter()
+        substitute(response, substitutions)
+        first_call = time.perf_counter()-start
+        durations = []
+        for _ in range(repetitions):
+            start = time.perf_counter()
+            substitute(response, substitutions)
+            durations.append(time.perf_counter()-start)
+        results.append(
+            {
+                "length": length,
+                "substitutions": len(substitutions),
+                "first_call_ms": 1000*first_call,
+                "per_call_ms": 1000*statistics.median(durations),
+            }
+        )
+    return results
+
+
+def quantity_construction_benchmark(quantities=("1.24 mile/hour", "9.81 m/s^2", "2 kN*m"), repetitions=20):
+    """
+        Times the construction of a physical quantity (i.e. of the response or the
+        answer) when the parsing parameters and unit names are rebuilt for each
+        quantity, as was done before they were shared, and when they are shared.
+        Times are given in milliseconds.
+    """
+    parameters = {**quantity_default_parameters, "strict_syntax": False}
+    parser = SLR_quantity_parser(parameters)
+    results = []
+    for quantity in quantities:
+        SLR_quantity_parsing(quantity, parameters, parser, "response")
+
+        def rebuilt():
+            quantity_symbols_cache.clear()
+            quantity_parsing_params_cache.clear()
+            SLR_quantity_parsing(quantity, parameters, parser, "response")
+
+        def shared():
+            SLR_quantity_parsing(quantity, parameters, parser, "response")
+
+        rebuilt_ms, _ = measure(rebuilt, repetitions)
+        shared_ms, _ = measure(shared, repetitions)
+        results.append({"quantity": quantity, "rebuilt_ms": rebuilt_ms, "shared_ms": shared_ms})
+    return results
+
+
+def long_polynomial_cases(degrees=(10, 20, 40)):
+    cases = []
+    for degree in degrees:
+        terms = [f"{k+1}*x**{k}" for k in range(degree+1)]
+        cases.append(
+            {
+                "family": "long_polynomial",
+                "response": "+".join(reversed(terms)),
+                "answer": "+".join(terms),
+                "params": {"strict_syntax": False},
+            }
+        )
+    return cases
+
+
+def nested_trigonometry_cases(depths=(2, 3, 4)):
+    cases = []
+    for depth in depths:
+        inner = "x"
+        for k in range(depth):
+            inner = ("sin" if k % 2 == 0 else "cos")+"("+inner+")"
+        cases.append(
+            {
+                "family": "nested_trigonometry",
+                "response": f"2*sin({inner})*cos({inner})",
+                "answer": f"sin(2*{inner})",
+                "params": {"strict_syntax": False, "elementary_functions": True},
+            }
+        )
+    return cases
+
+
+def multiple_answers_cases(sizes=(3, 6, 10)):
+    cases = []
+    for size in sizes:
+        answers = [f"x**{k}+{k}" for k in range(1, size+1)]
+        cases.append(
+            {
+                "family": "multiple_answers",
+                "response": "{"+", ".join(reversed(answers))+"}",
+                "answer": "{"+", ".join(answers)+"}",
+                "params": {"strict_syntax": False},
+            }
+        )
+    return cases
+
+
+def imperial_quantity_cases():
+    params = {"strict_syntax": False, "physical_quantity": True, "units_string": "SI common imperial"}
+    pairs = [
+        ("3 foot/second", "0.9144 metre/second"),
+        ("2 mile", "3.218688 kilometre"),
+        ("5 pound", "2.26796185 kilogram"),
+        ("12 inch", "1 foot"),
+    ]
+    return [{"family": "imperial_quantity", "response": response, "answer": answer, "params": dict(params)} for (response, answer) in pairs]
+
+
+def latex_cases():
+    params = {"strict_syntax": False, "is_latex": True, "elementary_functions": True}
+    pairs = [
+        (r"\frac{x^{2}}{2}", "x**2/2"),
+        (r"\sin(x)^{2}+\cos(x)^{2}", "1"),
+        (r"\sqrt{x^{2}+2x+1}", "sqrt((x+1)**2)"),
+    ]
+    return [{"family": "latex", "response": response, "answer": answer, "params": dict(params)} for (response, answer) in pairs]
+
+
+def stage_benchmark_cases():
+    """
+        Returns the cases in `benchmarks` together with generated families of cases.
+    """
+    cases = [{"family": "benchmarks", **case} for case in benchmarks]
+    cases += long_polynomial_cases()
+    cases += nested_trigonometry_cases()
+    cases += multiple_answers_cases()
+    cases += imperial_quantity_cases()
+    cases += latex_cases()
+    return cases
+
+
+def clear_caches():
+    parse_cache.clear()
+    canonical_form_cache.clear()
+
+
+def percentile(values, fraction):
+    """
+        Returns the given percentile (given as a fraction) of values using the nearest-rank method.
+    """
+    ordered = sorted(values)
+    rank = max(1, math.ceil(fraction*len(ordered)))
+    return ordered[rank-1]
+
+
+def summarise(durations):
+    return {
+        "mean": statistics.fmean(durations),
+        "p50": percentile(durations, 0.5),
+        "p90": percentile(durations, 0.9),
+        "p99": percentile(durations, 0.99),
+        "max": max(durations),
+        "count": len(durations),
+    }
+
+
+def stage_benchmark(cases=None, repetitions=5, use_caches=False):
+    """
+        Evaluates each case the given number of times and records the time spent in each
+        stage of the evaluation pipeline (see `evaluation_stages`). Unless use_caches is
+        True, the parse and canonical form caches are cleared before each evaluation.
+        Returns a dictionary with percentiles (in milliseconds) for each stage, both
+        for all cases together and for each family of cases.
+    """
+    if cases is None:
+        cases = stage_benchmark_cases()
+    stages = evaluation_stages+["total"]
+    durations = {stage_name: [] for stage_name in stages}
+    family_durations = dict()
+    for case in cases:
+        family = family_durations.setdefault(case.get("family", "other"), {stage_name: [] for stage_name in stages})
+        for _ in range(repetitions):
+            if not use_caches:
+                clear_caches()
+            with record_stage_times() as stage_times:
+                start = time.perf_counter()
+                evaluation_function(case["response"], case["answer"], deepcopy(case["params"]))
+                total = time.perf_counter()-start
+            stage_times["total"] = total
+            for stage_name in stages:
+                durations[stage_name].append(1000*stage_times.get(stage_name, 0.0))
+                family[stage_name].append(1000*stage_times.get(stage_name, 0.0))
+    return {
+        "repetitions": repetitions,
+        "cases": len(cases),
+        "stages": {stage_name: summarise(durations[stage_name]) for stage_name in stages},
+        "families": {
+            name: {stage_name: summarise(values[stage_name]) for stage_name in stages}
+            for (name, values) in family_durations.items()
+        },
+    }
+
+
+def compare_to_baseline(results, baseline, threshold=0.25, statistic="p50", minimum_difference_ms=1.0):
+    """
+        Compares the stage times in results with the stage times in baseline (both on the
+        form returned by stage_benchmark). A stage has regressed if the chosen statistic
+        has increased by more than threshold (relative to the baseline) and by more than
+        minimum_difference_ms (so that noise in very short stages is ignored).
+        Returns a list of regressions.
+    """
+    regressions = []
+    groups = [("all", results["stages"], baseline.get("stages", {}))]
+    groups += [(name, stages, baseline.get("families", {}).get(name, {})) for (name, stages) in results["families"].items()]
+    for (group, stages, baseline_stages) in groups:
+        for (stage_name, summary) in stages.items():
+            if stage_name not in baseline_stages.keys():
+                continue
+            old = baseline_stages[stage_name][statistic]
+            new = summary[statistic]
+            if new-old > minimum_difference_ms and new > old*(1+threshold):
+                regressions.append(
+                    {
+                        "group": group,
+                        "stage": stage_name,
+                        "baseline_ms": old,
+                        "current_ms": new,
+                        "change": (new-old)/old if old > 0 else math.inf,
+                    }
+                )
+    return regressions
+
+
+def run_stage_benchmark(arguments=None):
+    """
+        Command line interface for the stage benchmark, returns the exit code
+        (1 if any stage has regressed compared to the baseline, otherwise 0).
+    """
+    parser = argparse.ArgumentParser(prog="python -m app.benchmarking stages", description="Times each stage of the evaluation pipeline.")
+    parser.add_argument("--repetitions", "-r", type=int, default=5)
+    parser.add_argument("--output", "-o", default=None, help="file that the results are written to (as JSON)")
+    parser.add_argument("--baseline", "-b", default=None, help="JSON file with results from an earlier run to compare with")
+    parser.add_argument("--save-baseline", action="store_true", help="write the results to the baseline file instead of comparing")
+    parser.add_argument("--threshold", type=float, default=0.25, help="largest allowed relative increase compared to the baseline")
+    parser.add_argument("--statistic", default="p50", choices=["mean", "p50", "p90", "p99", "max"])
+    parser.add_argument("--use-caches", action="store_true", help="do not clear the parse and canonical form caches between evaluations")
+    arguments = parser.parse_args(arguments)
+    if arguments.save_baseline and arguments.baseline is None:
+        parser.error("--save-baseline requires --baseline")
+
+    results = stage_benchmark(repetitions=arguments.repetitions, use_caches=arguments.use_caches)
+    if arguments.output is not None:
+        with open(arguments.output, "w", encoding="utf-8") as output_file:
+            json.dump(results, output_file, indent=2)
+    for (stage_name, summary) in results["stages"].items():
+        print(f"{stage_name:<20} p50: {summary['p50']:9.2f} ms   p90: {summary['p90']:9.2f} ms   p99: {summary['p99']:9.2f} ms")
+
+    if arguments.baseline is None:
+        return 0
+    if arguments.save_baseline:
+        with open(arguments.baseline, "w", encoding="utf-8") as baseline_file:
+            json.dump(results, baseline_file, indent=2)
+        return 0
+    with open(arguments.baseline, "r", encoding="utf-8") as baseline_file:
+        baseline = json.load(baseline_file)
+    regressions = compare_to_baseline(results, baseline, threshold=arguments.threshold, statistic=arguments.statistic)
+    for regression in regressions:
+        print(f"REGRESSION {regression['group']}/{regression['stage']}: {regression['baseline_ms']:.2f} ms -> {regression['current_ms']:.2f} ms ({100*regression['change']:+.0f}%)")
+    return 1 if len(regressions) > 0 else 0
+
+
+def parse_import_times(output):
+    """
+        Parses the output of `python -X importtime` and returns a dictionary
+        with the self time and cumulative time (in milliseconds) for each module.
+    """
+    import_times = dict()
+    for line in output.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:"):].split("|")
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue
+        import_times[fields[2].strip()] = {
+            "self_ms": int(fields[0])/1000,
+            "cumulative_ms": int(fields[1])/1000,
+        }
+    return import_times
+
+
+def import_time_benchmark(modules=None, repetitions=5, slowest=10):
+    """
+        Measures how long it takes to import each module in a new interpreter.
+        Returns, for each module, the percentiles of the import time, whether
+        latex2sympy2 was imported and the dependencies with the largest self time.
+    """
+    if modules is None:
+        modules = [__package__+".evaluation", __package__+".preview"]
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    results = dict()
+    for module in modules:
+        durations = []
+        for _ in range(repetitions):
+            process = subprocess.run(
+                [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                cwd=root,
+                capture_output=True,
+                text=True,
+                check=True,
+            )
+            import_times = parse_import_times(process.stderr)
+            durations.append(import_times[module]["cumulative_ms"])
+        slowest_imports = sorted(import_times.items(), key=lambda item: item[1]["self_ms"], reverse=True)[:slowest]
+        results[module] = {
+            **summarise(durations),
+            "imports_latex2sympy": "latex2sympy2" in import_times.keys(),
+            "slowest_imports": {name: times["self_ms"] for (name, times) in slowest_imports},
+        }
+    return results
+
+
+def run_import_time_benchmark(arguments=None):
+    """
+        Command line interface for the import time benchmark, returns the exit code
+        (1 if the median import time of any module is larger than --max-ms, otherwise 0).
+    """
+    parser = argparse.ArgumentParser(prog="python -m app.benchmarking imports", description="Measures the time needed to import the evaluation and preview functions.")
+    parser.add_argument("modules", nargs="*", default=None)
+    parser.add_argument("--repetitions", "-r", type=int, default=5)
+    parser.add_argument("--output", "-o", default=None, help="file that the results are written to (as JSON)")
+    parser.add_argument("--max-ms", type=float, default=None, help="largest allowed median import time")
+    arguments = parser.parse_args(arguments)
+
+    results = import_time_benchmark(modules=arguments.modules or None, repetitions=arguments.repetitions)
+    if arguments.output is not None:
+        with open(arguments.output, "w", encoding="utf-8") as output_file:
+            json.dump(results, output_file, indent=2)
+    exit_code = 0
+    for (module, result) in results.items():
+        print(f"{module:<20} p50: {result['p50']:9.2f} ms   max: {result['max']:9.2f} ms   latex2sympy2 imported: {result['imports_latex2sympy']}")
+        for (name, self_ms) in result["slowest_imports"].items():
+            print(f"    {name:<40} {self_ms:9.2f} ms")
+        if arguments.max_ms is not None and result["p50"] > arguments.max_ms:
+            exit_code = 1
+    return exit_code
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "stages":
+        sys.exit(run_stage_benchmark(sys.argv[2:]))
+    if len(sys.argv) > 1 and sys.argv[1] == "imports":
+        sys.exit(run_import_time_benchmark(sys.argv[2:]))
+    for result in compiled_task_benchmark():
+        print(f"{result['answer'][:40]:<40} cold: {result['cold_ms']:9.2f} ms   compile: {result['compile_ms']:9.2f} ms   per response: {result['per_response_ms']:9.2f} ms")
+    for result in parameter_plumbing_benchmark():
+        print(f"{result['answer'][:40]:<40} deepcopy: {result['deepcopy_ms']:7.3f} ms {result['deepcopy_kb']:8.1f} kB   frozen: {result['frozen_ms']:7.3f} ms {result['frozen_kb']:8.1f} kB")
+    for result in criteria_graph_serialisation_benchmark():
+        print(f"{result['answer'][:40]:<40} request: {result['request_ms']:9.2f} ms   graph serialisation: {result['serialisation_ms']:7.2f} ms ({100*result['serialisation_share']:4.1f}%)")
+    for result in quantity_construction_benchmark():
+        print(f"quantity {result['quantity']:<30} rebuilt parsing parameters: {result['rebuilt_ms']:8.3f} ms   shared: {result['shared_ms']:8.3f} ms")
+    for result in substitution_benchmark():
+        print(f"substitute, {result['length']:6d} characters, {result['substitutions']} substitutions   first call: {result['first_call_ms']:8.2f} ms   per call: {result['per_call_ms']:8.2f} ms")
@@ -0,0 +1,68 @@
+"""
+    Build step that computes the parsing tables for the grammars used by the
+    evaluation function and saves them to `utility/slr_tables.json`, so that
+    new processes can load the tables instead of computing them.
+
+    The tables are stored together with a hash of each grammar (see `grammar_hash`
+    in `utility/slr_parsing_utilities.py`). When a parser is created for a grammar
+    that does not match any stored hash, e.g. after the grammar has been changed or
+    when the file was built with another Python version, the tables are computed
+    as usual. The file should be rebuilt whenever a grammar is changed.
+
+    Usage:
+        python -m app.build_slr_tables [--output path]
+"""
+import argparse
+
+from .context.physical_quantity import generate_criteria_parser as generate_quantity_criteria_parser
+from .utility.criteria_parsing import generate_criteria_parser
+from .utility.expression_utilities import SLR_implicit_multiplication_convention_parser
+from .utility.physical_quantity_utilities import create_SLR_quantity_parser
+from .utility.slr_parsing_utilities import save_persisted_tables, set_persisted_tables, slr_tables_path
+
+# Reserved expressions used when the criteria parsers are created during evaluation
+reserved_expressions = {
+    "learner": {"response": None},
+    "task": {"answer": None},
+}
+
+
+def default_parsers():
+    """
+        Creates the parsers used by the evaluation and preview functions.
+    """
+    parsers = [
+        generate_criteria_parser(reserved_expressions),
+        generate_quantity_criteria_parser(reserved_expressions),
+    ]
+    for strictness in ["strict", "natural"]:
+        parsers.append(create_SLR_quantity_parser("SI common imperial", strictness))
+    for convention in ["equal_precedence", "implicit_higher_precedence"]:
+        parsers.append(SLR_implicit_multiplication_convention_parser(convention))
+    return parsers
+
+
+def build_tables(path=None):
+    """
+        Computes the parsing tables for the default parsers (ignoring any tables that
+        are already persisted) and writes them to path. Returns the number of grammars.
+    """
+    set_persisted_tables(dict())
+    try:
+        parsers = {parser.grammar_hash: parser for parser in default_parsers()}
+    finally:
+        set_persisted_tables(None)
+    save_persisted_tables(parsers.values(), path)
+    return len(parsers)
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description="Compute and save the parsing tables for the grammars used by the evaluation function.")
+    parser.add_argument("--output", "-o", default=slr_tables_path, help="file that the tables are written to")
+    arguments = parser.parse_args(arguments)
+    number_of_grammars = build_tables(arguments.output)
+    print(f"Saved parsing tables for {number_of_grammars} grammars to {arguments.output}")
+
+
+if __name__ == "__main__":
+    main()
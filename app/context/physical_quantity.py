@@ -14,6 +14,9 @@ from ..utility.expression_utilities import default_parameters as symbolic_defaul
 from ..utility.expression_utilities import (
     substitute_input_symbols,
     create_sympy_parsing_params,
+    override_parsing_params,
+    canonical_form,
+    traced_simplify,
     compute_relative_tolerance_from_significant_decimals,
     parse_expression
 )
@@ -96,7 +99,7 @@ def generate_criteria_parser(reserved_expressions):
         ("answer",       "QUANTITY"),
         ("INPUT",        "INPUT", catch_undefined),
     ]
-    token_list += [(" *"+x+" *", " "+x+" ") for x in criteria_operations]
+    token_list += [(" *"+x+" *", " "+x+" ") for x in sorted(criteria_operations)]
 
     productions = [
         ("START",     "BOOL", create_node),
@@ -129,7 +132,7 @@ def comparison_function(comparison_operator):
         local_substitutions = [(key, none_placeholder) if expr is None else (key, expr) for (key, expr) in substitutions]
         expr0 = lhs.subs(local_substitutions)
         expr1 = rhs.subs(local_substitutions)
-        result = comparison((expr0-expr1).cancel().simplify().simplify(), 0)
+        result = comparison(canonical_form(expr0-expr1), 0)
         return result
     return comparison_function_inner
 
@@ -139,13 +142,12 @@ def comparison_base_graph(criterion, parameters, comparison_operator="=", label=
     END = CriteriaGraph.END
     graph.add_node(END)
     reserved_expressions = parameters["reserved_expressions"].items()
-    parsing_params = deepcopy(parameters["parsing_parameters"])
+    parsing_params = override_parsing_params(parameters["parsing_parameters"], simplify=False, evaluate=False)
     if parameters.get('atol', 0) == 0 and parameters.get('rtol', 0) == 0:
         ans = parameters["reserved_expressions"]["answer"]["quantity"].value
         if ans is not None:
             rtol = compute_relative_tolerance_from_significant_decimals(ans.content_string())
-            parsing_params.update({'rtol': rtol})
-    parsing_params.update({"simplify": False, "evaluate": False})
+            parsing_params = parsing_params.override(rtol=rtol)
 
     if label is None:
         label = criterion.content_string()
@@ -217,13 +219,12 @@ def criterion_match_node(criterion, parameters, label=None):
     END = CriteriaGraph.END
     graph.add_node(END)
     reserved_expressions = parameters["reserved_expressions"].items()
-    parsing_params = deepcopy(parameters["parsing_parameters"])
+    parsing_params = override_parsing_params(parameters["parsing_parameters"], simplify=False, evaluate=False)
     if parameters.get('atol', 0) == 0 and parameters.get('rtol', 0) == 0:
         ans = parameters["reserved_expressions"]["answer"]["quantity"].value
         if ans is not None:
             rtol = compute_relative_tolerance_from_significant_decimals(ans.content_string())
-            parsing_params.update({'rtol': rtol})
-    parsing_params.update({"simplify": False, "evaluate": False})
+            parsing_params = parsing_params.override(rtol=rtol)
 
     if label is None:
         label = criterion.content_string()
@@ -236,21 +237,36 @@ def criterion_match_node(criterion, parameters, label=None):
 
     is_equal = comparison_function("=")
 
+    # If both sides of the criterion are reserved expressions, their units can
+    # be compared using exponent vectors and scales (see `unit_vector`)
+    unit_vectors = None
+    if lhs_string in parameters["reserved_expressions"].keys() and rhs_string in parameters["reserved_expressions"].keys():
+        lhs_quantity = parameters["reserved_expressions"][lhs_string]["quantity"]
+        rhs_quantity = parameters["reserved_expressions"][rhs_string]["quantity"]
+        if lhs_quantity.unit_vector is not None and rhs_quantity.unit_vector is not None:
+            unit_vectors = (lhs_quantity.unit_vector, rhs_quantity.unit_vector)
+
+    # If both quantities have values that are plain numbers, the values can be
+    # compared using exact arithmetic (see `PhysicalQuantity._exact_value`)
+    exact_values = None
+    if unit_vectors is not None and lhs_quantity.exact_value is not None and rhs_quantity.exact_value is not None:
+        exact_values = {lhs_string: lhs_quantity.exact_value, rhs_string: rhs_quantity.exact_value}
+
     def is_proportional(lhs, rhs, substitutions):
         none_placeholder = Symbol('NONE_PLACEHOLDER')
         local_substitutions = [(key, none_placeholder) if expr is None else (key, expr) for (key, expr) in substitutions]
         expr0 = lhs.subs(local_substitutions)
         expr1 = rhs.subs(local_substitutions)
-        if expr0.cancel().simplify().simplify() != 0:
-            result = (expr0/expr1).cancel().simplify().is_constant()
+        if canonical_form(expr0) != 0:
+            result = canonical_form(expr0/expr1, simplifications=1).is_constant()
             ratio = expr0/expr1
-        elif expr0.cancel().simplify().simplify() != 0:
-            result = (expr1/expr0).cancel().simplify().is_constant()
+        elif canonical_form(expr0) != 0:
+            result = canonical_form(expr1/expr0, simplifications=1).is_constant()
             ratio = expr1/expr0
         else:
             result = False
         if result is True:
-            ratio = float(ratio.cancel().simplify())
+            ratio = float(canonical_form(ratio, simplifications=1))
         else:
             ratio = None
         return result, ratio
@@ -271,16 +287,28 @@ def criterion_match_node(criterion, parameters, label=None):
             if res_unit is not None and ans_unit is None:
                 return {label+"_UNEXPECTED_UNIT": {"lhs": lhs_string, "rhs": rhs_string}}
 
-        substitutions = [(key, expr["standard"]["value"]) for (key, expr) in reserved_expressions]
-        value_match = is_equal(lhs, rhs, substitutions)
-
-        if value_match is False:
+        if exact_values is not None:
+            value_match = exact_values[lhs_string] == exact_values[rhs_string]
+        else:
+            substitutions = [(key, expr["standard"]["value"]) for (key, expr) in reserved_expressions]
+            value_match = is_equal(lhs, rhs, substitutions)
+
+        if value_match is False and exact_values is not None:
+            if (parsing_params.get('rtol', 0) > 0 or parsing_params.get('atol', 0) > 0) and set(exact_values.keys()) == {"answer", "response"}:
+                ans = exact_values["answer"]
+                res = exact_values["response"]
+                if parsing_params.get('rtol', 0) > 0 and (ans != 0):
+                    value_match = bool(abs(float((ans-res)/ans)) < parsing_params['rtol'])
+                elif parsing_params.get('atol', 0) > 0 or (ans == 0):
+                    answer_unit_factor = float(parameters["reserved_expressions"]["answer"]["quantity"].unit_vector[1])
+                    value_match = bool(abs(float(ans-res)) < parsing_params['atol']*answer_unit_factor)
+        elif value_match is False:
             # TODO: better analysis of where `answer` is found in the criteria so that
             #       numerical tolerances can be applied appropriately
             if parsing_params.get('rtol', 0) > 0 or parsing_params.get('atol', 0) > 0:
                 if (lhs_string == 'answer' and rhs_string == 'response') or (lhs_string == 'response' and rhs_string == 'answer'):
-                    ans = parameters["reserved_expressions"]["answer"]["standard"]["value"].simplify()
-                    res = parameters["reserved_expressions"]["response"]["standard"]["value"].simplify()
+                    ans = traced_simplify(parameters["reserved_expressions"]["answer"]["standard"]["value"])
+                    res = traced_simplify(parameters["reserved_expressions"]["response"]["standard"]["value"])
                 if (ans is not None and ans.is_constant()) and (res is not None and res.is_constant()):
                     if parsing_params.get('rtol', 0) > 0 and (ans != 0):
                         value_match = bool(abs(float((ans-res)/ans)) < parsing_params['rtol'])
@@ -288,8 +316,12 @@ def criterion_match_node(criterion, parameters, label=None):
                         answer_unit_factor = float(parameters["reserved_expressions"]["answer"]["quantity"].converted_unit_factor)
                         value_match = bool(abs(float(ans-res)) < parsing_params['atol']*answer_unit_factor)
 
-        substitutions = [(key, expr["standard"]["unit"]) for (key, expr) in reserved_expressions]
-        unit_match = is_equal(lhs, rhs, substitutions)
+        if unit_vectors is not None and lhs_quantity.value is not None and rhs_quantity.value is not None:
+            # When both quantities have values the standard units do not have a scale
+            unit_match = unit_vectors[0][0] == unit_vectors[1][0]
+        else:
+            substitutions = [(key, expr["standard"]["unit"]) for (key, expr) in reserved_expressions]
+            unit_match = is_equal(lhs, rhs, substitutions)
 
         output_tags = None
         if value_match is True and unit_match is True:
@@ -304,8 +336,11 @@ def criterion_match_node(criterion, parameters, label=None):
         return output_tags
 
     def dimension_match(unused_inputs):
-        substitutions = [(key, expr["dimension"]) for (key, expr) in reserved_expressions]
-        dimension_match, _ = is_proportional(lhs, rhs, substitutions)
+        if unit_vectors is not None:
+            dimension_match = unit_vectors[0][0] == unit_vectors[1][0]
+        else:
+            substitutions = [(key, expr["dimension"]) for (key, expr) in reserved_expressions]
+            dimension_match, _ = is_proportional(lhs, rhs, substitutions)
 
         output_tags = None
         if dimension_match is True:
@@ -326,8 +361,12 @@ def criterion_match_node(criterion, parameters, label=None):
                 label+"_UNIT_COMPARISON"+"_IDENTICAL": None
             }
         else:
-            local_substitutions = [(key, expr["quantity"].expanded_unit) for (key, expr) in reserved_expressions]
-            result, ratio = is_proportional(lhs, rhs, local_substitutions)
+            if unit_vectors is not None:
+                result = unit_vectors[0][0] == unit_vectors[1][0]
+                ratio = float(unit_vectors[0][1]/unit_vectors[1][1]) if result else None
+            else:
+                local_substitutions = [(key, expr["quantity"].expanded_unit) for (key, expr) in reserved_expressions]
+                result, ratio = is_proportional(lhs, rhs, local_substitutions)
             if result is True and ratio >= 1000:
                 output_tags = {
                     label+"_UNIT_COMPARISON"+"_PREFIX_IS_LARGE": None
@@ -1,4 +1,3 @@
-from copy import deepcopy
 from sympy import Add, Pow, Mul, Equality, pi, im, I, N, oo
 from sympy import re as real_part
 
@@ -6,7 +5,10 @@ from ..utility.expression_utilities import (
     default_parameters,
     parse_expression,
     create_sympy_parsing_params,
+    override_parsing_params,
     preprocess_expression,
+    canonical_form,
+    traced_simplify,
 )
 
 from ..preview_implementations.symbolic_preview import preview_function
@@ -17,6 +19,7 @@ from ..utility.syntactical_comparison_utilities import generate_arbitrary_number
 
 from ..utility.criteria_parsing import generate_criteria_parser
 from ..utility.criteria_graph_utilities import CriteriaGraph
+from ..utility.numerical_comparison_utilities import numeric_probe
 
 
 def expression_preprocess(name, expr, parameters):
@@ -32,8 +35,7 @@ default_criteria = ["response = answer"]
 
 def check_criterion(criterion, parameters_dict, generate_feedback=True):
     label = criterion.label.strip()
-    parsing_params = deepcopy(parameters_dict["parsing_parameters"])
-    parsing_params.update({"simplify": False})
+    parsing_params = override_parsing_params(parameters_dict["parsing_parameters"], simplify=False)
     if label in {"EQUALITY", "WRITTEN_AS"}:
         result = check_equality(criterion, parameters_dict)
     elif label == "ORDER":
@@ -61,22 +63,21 @@ def check_criterion(criterion, parameters_dict, generate_feedback=True):
 
 
 def create_expressions_for_comparison(criterion, parameters_dict, local_substitutions=[]):
-    parsing_params = deepcopy(parameters_dict["parsing_parameters"])
+    parsing_params = parameters_dict["parsing_parameters"]
     reserved_expressions = list(parameters_dict["reserved_expressions"].items())
-    parsing_params.update(
-        {
-            "simplify": False,
-            "evaluate": False,
-            "unsplittable_symbols": parsing_params["unsplittable_symbols"]+list((parameters_dict["reserved_expressions"].keys())),
-        }
+    parsing_params = override_parsing_params(
+        parsing_params,
+        simplify=False,
+        evaluate=False,
+        unsplittable_symbols=parsing_params["unsplittable_symbols"]+list((parameters_dict["reserved_expressions"].keys())),
     )
     lhs = criterion.children[0].content_string()
     rhs = criterion.children[1].content_string()
     lhs_expr = parse_expression(lhs, parsing_params).subs(local_substitutions).subs(reserved_expressions).subs(local_substitutions)
     rhs_expr = parse_expression(rhs, parsing_params).subs(local_substitutions).subs(reserved_expressions).subs(local_substitutions)
     if parsing_params.get("complexNumbers", False):
-        simplified_lhs_expr = lhs_expr.cancel().simplify()
-        simplified_rhs_expr = rhs_expr.cancel().simplify()
+        simplified_lhs_expr = canonical_form(lhs_expr, simplifications=1)
+        simplified_rhs_expr = canonical_form(rhs_expr, simplifications=1)
         if (im(lhs_expr) != 0) or (im(lhs_expr) != 0):
             lhs_expr = real_part(simplified_lhs_expr) + I*im(simplified_lhs_expr)
             rhs_expr = real_part(simplified_rhs_expr) + I*im(simplified_rhs_expr)
@@ -101,11 +102,11 @@ def do_comparison_infinite(comparison_symbol, lhs_expr, rhs_expr):
 
 def do_comparison(comparison_symbol, expression):
     comparisons = {
-        "=": lambda expr: bool(expression.cancel().simplify().simplify() == 0),
-        ">": lambda expr: bool(expression.cancel().simplify().simplify() > 0),
-        ">=": lambda expr: bool(expression.cancel().simplify().simplify() >= 0),
-        "<": lambda expr: bool(expression.cancel().simplify().simplify() < 0),
-        "<=": lambda expr: bool(expression.cancel().simplify().simplify() <= 0),
+        "=": lambda expr: bool(canonical_form(expr) == 0),
+        ">": lambda expr: bool(canonical_form(expr) > 0),
+        ">=": lambda expr: bool(canonical_form(expr) >= 0),
+        "<": lambda expr: bool(canonical_form(expr) < 0),
+        "<=": lambda expr: bool(canonical_form(expr) <= 0),
     }
     comparison = comparisons[comparison_symbol.strip()]
     try:
@@ -126,19 +127,45 @@ def check_equality(criterion, parameters_dict, local_substitutions=[]):
             either_is_infinite = lhs_expr.is_infinite or rhs_expr.is_infinite
         except (KeyError, TypeError):
             either_is_infinite = False
+        numeric_probe_result = None
         if either_is_infinite:
             result = do_comparison_infinite(criterion.content, lhs_expr, rhs_expr)
+            decided_by = "INFINITE_COMPARISON"
         else:
-            result = do_comparison(criterion.content, lhs_expr-rhs_expr)
+            # Evaluating both sides in a few random points is much cheaper than simplification,
+            # if the sides are clearly different there is no need to try to simplify the difference.
+            if parameters_dict.get("numeric_probe", True) is True and criterion.content.strip() == "=":
+                numeric_probe_result = numeric_probe(
+                    lhs_expr,
+                    rhs_expr,
+                    number_of_points=parameters_dict.get("numeric_probe_points", 5),
+                    complex_numbers=parameters_dict["parsing_parameters"].get("complexNumbers", False),
+                )
+            if numeric_probe_result is False:
+                result = False
+                decided_by = "NUMERIC_PROBE_MISMATCH"
+            else:
+                result = do_comparison(criterion.content, lhs_expr-rhs_expr)
+                if numeric_probe_result is True:
+                    decided_by = "NUMERIC_PROBE_MATCH_SYMBOLIC_CONFIRMATION"
+                else:
+                    decided_by = "SYMBOLIC"
         # There are some types of expression, e.g. those containing hyperbolic trigonometric functions, that can behave
         # unpredictably when simplification is applied. For that reason we check several different combinations of
         # simplifications here in order to reduce the likelihood of false negatives.
-        if result is False:
-            result = do_comparison(criterion.content, lhs_expr-rhs_expr.simplify())
-        if result is False:
-            result = do_comparison(criterion.content, lhs_expr.simplify()-rhs_expr)
-        if result is False:
-            result = do_comparison(criterion.content, lhs_expr.simplify()-rhs_expr.simplify())
+        # All combinations are only tried when the numeric probe was not used or was inconclusive. If the probe
+        # found a match, only the combination where both sides are simplified is tried.
+        if result is False and numeric_probe_result is None:
+            result = do_comparison(criterion.content, lhs_expr-traced_simplify(rhs_expr))
+            if result is False:
+                result = do_comparison(criterion.content, traced_simplify(lhs_expr)-rhs_expr)
+            if result is False:
+                result = do_comparison(criterion.content, traced_simplify(lhs_expr)-traced_simplify(rhs_expr))
+            decided_by = "SYMBOLIC"
+        elif result is False and numeric_probe_result is True:
+            result = do_comparison(criterion.content, traced_simplify(lhs_expr)-traced_simplify(rhs_expr))
+        if result is not True and numeric_probe_result is True:
+            decided_by = "NUMERIC_PROBE_MATCH_NOT_CONFIRMED"
 
         # TODO: Make numerical comparison its own context
         if result is False:
@@ -178,6 +205,11 @@ def check_equality(criterion, parameters_dict, local_substitutions=[]):
                     result = False
                 elif error_below_atol is True and error_below_rtol is True:
                     result = True
+                    decided_by = "TOLERANCE"
+
+        evaluation_result = parameters_dict.get("evaluation_result", None)
+        if evaluation_result is not None:
+            evaluation_result.add_test_data_tag(criterion.content_string()+"_DECIDED_BY_"+decided_by)
 
     return result
 
@@ -191,10 +223,10 @@ def check_order(criterion, parameters_dict, local_substitutions=[]):
 def check_proportionality(criterion, parameters_dict, local_substitutions=[]):
     lhs_expr, rhs_expr = create_expressions_for_comparison(criterion, parameters_dict, local_substitutions)
     result = None
-    if lhs_expr.cancel().simplify().simplify() != 0:
-        result = (rhs_expr/lhs_expr).cancel().simplify()
-    elif rhs_expr.cancel().simplify().simplify() != 0:
-        result = (lhs_expr/rhs_expr).cancel().simplify()
+    if canonical_form(lhs_expr) != 0:
+        result = canonical_form(rhs_expr/lhs_expr, simplifications=1)
+    elif canonical_form(rhs_expr) != 0:
+        result = canonical_form(lhs_expr/rhs_expr, simplifications=1)
     if result == 0 or result is None:
         result = False
     else:
@@ -339,12 +371,12 @@ def criterion_equality_node(criterion, parameters_dict, label=None):
 
         # TODO: Remove when criteria for checking proportionality is implemented
         if isinstance(res, Equality) and isinstance(ans, Equality):
-            if (res.args[0]-res.args[1]).simplify() == 0:
-                symbols_in_equality_ratio = (ans.args[0]-ans.args[1]).simplify().free_symbols
-            elif (ans.args[0]-ans.args[1]).simplify() == 0:
-                symbols_in_equality_ratio = (res.args[0]-res.args[1]).simplify().free_symbols
+            if canonical_form(res.args[0]-res.args[1], cancel=False, simplifications=1) == 0:
+                symbols_in_equality_ratio = canonical_form(ans.args[0]-ans.args[1], cancel=False, simplifications=1).free_symbols
+            elif canonical_form(ans.args[0]-ans.args[1], cancel=False, simplifications=1) == 0:
+                symbols_in_equality_ratio = canonical_form(res.args[0]-res.args[1], cancel=False, simplifications=1).free_symbols
             else:
-                symbols_in_equality_ratio = ((res.args[0]-res.args[1])/(ans.args[0]-ans.args[1])).simplify().free_symbols
+                symbols_in_equality_ratio = canonical_form((res.args[0]-res.args[1])/(ans.args[0]-ans.args[1]), cancel=False, simplifications=1).free_symbols
             result = {str(s) for s in symbols_in_equality_ratio}.issubset(parameters_dict["parsing_parameters"]["constants"])
         if result is True:
             return {
@@ -362,13 +394,12 @@ def criterion_equality_node(criterion, parameters_dict, label=None):
     rhs = criterion.children[1].content_string()
 
     def same_symbols(unused_input):
-        parsing_params = deepcopy(parameters_dict["parsing_parameters"])
+        parsing_params = parameters_dict["parsing_parameters"]
         local_substitutions = list(parameters_dict["reserved_expressions"].items())
-        parsing_params.update(
-            {
-                "simplify": False,
-                "unsplittable_symbols": parsing_params["unsplittable_symbols"]+list((parameters_dict["reserved_expressions"].keys())),
-            }
+        parsing_params = override_parsing_params(
+            parsing_params,
+            simplify=False,
+            unsplittable_symbols=parsing_params["unsplittable_symbols"]+list((parameters_dict["reserved_expressions"].keys())),
         )
         lsym = parse_expression(lhs, parsing_params).subs(local_substitutions)
         rsym = parse_expression(rhs, parsing_params).subs(local_substitutions)
@@ -726,12 +757,12 @@ def criterion_where_node(criterion, parameters_dict, label=None):
                 "details": lambda expression, variations: "The following expressions are checked: "+", ".join([str(e) for e in variations]),
             }
         }
-        value = expression_to_vary.subs(local_subs).simplify()
+        value = traced_simplify(expression_to_vary.subs(local_subs))
         values_and_expressions = {str(value): set([expression_to_vary])}
         values_and_variations_group = {str(value): set(["UNKNOWN"])}
         for (group_label, info) in variation_groups.items():
             for variation in info["variations"]:
-                value = variation.subs(local_subs).simplify()
+                value = traced_simplify(variation.subs(local_subs))
                 values_and_expressions.update({str(value): values_and_expressions.get(str(value), set()).union(set([variation]))})
                 if value != expression_to_vary.subs(local_subs):
                     values_and_variations_group.update({str(value): values_and_variations_group.get(str(value), set()).union(set([group_label]))})
@@ -838,12 +869,14 @@ def criterion_eval_node(criterion, parameters_dict, generate_feedback=True):
         feedback_string_generator=symbolic_feedback_string_generators["GENERIC"]("FALSE")
     )
     graph.attach(label+"_FALSE", END.label)
+    # The criterion is bound to the feedback string generator for the unknown outcome
+    # so that feedback can be generated also when the evaluation node is cancelled
     graph.attach(
         label,
         label+"_UNKNOWN",
         summary="True",
         details=label+" is false.",
-        feedback_string_generator=symbolic_feedback_string_generators["GENERIC"]("FALSE")
+        feedback_string_generator=lambda inputs: symbolic_feedback_string_generators["GENERIC"]("FALSE")({**feedback_string_generator_inputs, **inputs})
     )
     graph.attach(label+"_UNKNOWN", END.label)
     return graph
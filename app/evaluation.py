@@ -1,7 +1,10 @@
 from copy import deepcopy
 
 from .utility.evaluation_result_utilities import EvaluationResult
+from .utility.expression_utilities import freeze_parsing_params, traced_simplify
 from .utility.preview_utilities import parse_latex
+from .utility.time_budget_utilities import TimeBudget
+from .utility.tracing_utilities import stage, span, collect_spans, summarise_spans, tracing_enabled
 from .context.symbolic import context as symbolic_context
 from .context.physical_quantity import context as quantity_context
 from .feedback.symbolic import feedback_generators as symbolic_feedback_string_generators
@@ -37,11 +40,25 @@ class FrozenValuesDictionary(dict):
             self[k] = v
 
 
+def copy_parameters(parameters):
+    """
+        Returns a copy of the parameters that can be changed without changing the
+        original. Only the input symbol definitions are changed in place during
+        evaluation, so they are the only values that are copied, all other values
+        (including the context and the parsing parameters) are shared.
+    """
+    parameters = dict(parameters)
+    for key in ("symbols", "input_symbols"):
+        if key in parameters:
+            parameters[key] = deepcopy(parameters[key])
+    return parameters
+
+
 def determine_context(parameters):
     if parameters.get("physical_quantity", False) is True:
-        context = deepcopy(quantity_context)
+        context = dict(quantity_context)
     else:
-        context = deepcopy(symbolic_context)
+        context = dict(symbolic_context)
 
     input_symbols_reserved_codes = list(parameters.get("symbols", dict()))
     input_symbols_reserved_aliases = []
@@ -106,7 +123,7 @@ def parse_reserved_expressions(reserved_expressions, parameters, result):
     """
     parse = parameters["context"]["expression_parse"]
     preprocess = parameters["context"]["expression_preprocess"]
-    parsing_parameters = deepcopy(parameters["parsing_parameters"])
+    parsing_parameters = parameters["parsing_parameters"]
     symbolic_comparison_internal_messages = symbolic_feedback_string_generators["INTERNAL"]
     reserved_expressions_dict = FrozenValuesDictionary()
     success = True
@@ -114,7 +131,8 @@ def parse_reserved_expressions(reserved_expressions, parameters, result):
         reserved_expressions_dict.update({key: FrozenValuesDictionary()})
         for (label, expr) in reserved_expressions[key].items():
             expr_parsed = None
-            preprocess_success, expr, preprocess_feedback = preprocess(key, expr, parameters)
+            with stage("preprocess"):
+                preprocess_success, expr, preprocess_feedback = preprocess(key, expr, parameters)
             if preprocess_success is False:
                 if key == "learner":
                     result.add_feedback(preprocess_feedback)
@@ -137,7 +155,8 @@ def parse_reserved_expressions(reserved_expressions, parameters, result):
                 success = False
             else:
                 try:
-                    expr_parsed = parse(label, expr, parsing_parameters, result)
+                    with stage("parse"):
+                        expr_parsed = parse(label, expr, parsing_parameters, result)
                 except Exception as e:
                     result.is_correct = False
                     success = False
@@ -206,10 +225,17 @@ def generate_feedback(main_criteria, criteria_graphs, evaluation_parameters):
     criteria_feedback = set()
     is_correct = True
     custom_feedback = evaluation_parameters.get("custom_feedback",{})
-    for (criterion_identifier, graph) in criteria_graphs.items():
+    time_budget = evaluation_parameters.get("time_budget", None)
+    time_budget_feedback = evaluation_parameters.get("time_budget_feedback", None)
+    for (index, (criterion_identifier, graph)) in enumerate(criteria_graphs.items()):
         # TODO: Find better way to identify main criteria for criteria graph
         main_criteria = criterion_identifier+"_TRUE"
-        criteria_feedback = graph.generate_feedback(response, main_criteria)
+        if time_budget is None:
+            criteria_feedback = graph.generate_feedback(response, main_criteria)
+        else:
+            # Each remaining criteria graph gets an equal share of the remaining time
+            graph_time_budget = time_budget.share(len(criteria_graphs)-index)
+            criteria_feedback = graph.generate_feedback(response, main_criteria, time_budget=graph_time_budget, time_budget_feedback=time_budget_feedback)
 
         # TODO: Implement way to define completeness of task other than "all main criteria satisfied"
         is_correct = is_correct and main_criteria in criteria_feedback
@@ -225,127 +251,265 @@ def generate_feedback(main_criteria, criteria_graphs, evaluation_parameters):
     return
 
 
-def evaluation_function(response, answer, params, include_test_data=False) -> dict:
+class CompiledTask:
     """
-    Function that allows for various types of comparison of various kinds of expressions.
-    Supported input parameters:
-    strict_SI_syntax:
-        - if set to True, use basic dimensional analysis functionality.
+        Holds everything that only depends on the answer and the parameters
+        (context, parameters, parsing parameters, parsed answer and criteria)
+        so that many responses can be evaluated against the same task
+        without repeating that work for every response.
     """
 
-    if "relative_tolerance" in params:
-        params["rtol"] = params["relative_tolerance"]
+    def __init__(self, answer, params):
+        if "relative_tolerance" in params:
+            params["rtol"] = params["relative_tolerance"]
 
-    if "absolute_tolerance" in params:
-        params["atol"] = params["absolute_tolerance"]
+        if "absolute_tolerance" in params:
+            params["atol"] = params["absolute_tolerance"]
 
-    evaluation_result = EvaluationResult()
-    evaluation_result.is_correct = False
-
-    symbolic_comparison_internal_messages = symbolic_feedback_string_generators["INTERNAL"]
+        self.answer = answer
+        self.params = params
 
-    parameters = deepcopy(params)
+        parameters = copy_parameters(params)
 
-    reserved_expressions_strings = {
-        "learner": {
-            "response": response
-        },
-        "task": {
-            "answer": answer
-        }
-    }
-    parameters.update({"reserved_expressions_strings": reserved_expressions_strings})
-    context = determine_context(parameters)
-    default_parameters = context["default_parameters"]
-    for (key, value) in default_parameters.items():
-        if key not in parameters.keys():
-            parameters.update({key: value})
-    if "criteria" not in parameters.keys():
-        parameters.update({"criteria": ",".join(context["default_criteria"])})
-
-    reserved_expressions_keys = list(reserved_expressions_strings["learner"].keys())+list(reserved_expressions_strings["task"].keys())
-    parameters.update(
-        {
-            "context": context,
-            "reserved_keywords": context["reserved_keywords"]+reserved_expressions_keys,
-        }
-    )
-    parsing_parameters = context["parsing_parameters_generator"](parameters, unsplittable_symbols=reserved_expressions_keys) 
-    parameters.update(
-        {
-            "parsing_parameters": parsing_parameters,
+        reserved_expressions_strings = {
+            "learner": {
+                "response": ""
+            },
+            "task": {
+                "answer": answer
+            }
         }
-    )
+        parameters.update({"reserved_expressions_strings": reserved_expressions_strings})
+        context = determine_context(parameters)
+        default_parameters = context["default_parameters"]
+        for (key, value) in default_parameters.items():
+            if key not in parameters.keys():
+                parameters.update({key: value})
+        if "criteria" not in parameters.keys():
+            parameters.update({"criteria": ",".join(context["default_criteria"])})
+
+        reserved_expressions_keys = list(reserved_expressions_strings["learner"].keys())+list(reserved_expressions_strings["task"].keys())
+        parameters.update(
+            {
+                "context": context,
+                "reserved_keywords": context["reserved_keywords"]+reserved_expressions_keys,
+            }
+        )
+        parsing_parameters = freeze_parsing_params(
+            context["parsing_parameters_generator"](parameters, unsplittable_symbols=reserved_expressions_keys)
+        )
+        parameters.update(
+            {
+                "parsing_parameters": parsing_parameters,
+            }
+        )
 
-    # CONSIDER: Can this be moved into the preprocessing procedures in a consistent way?
-    # Can it be turned into its own context? Or moved into the determine_context procedure?
-    # What solution will be most consistently reusable?
-    if parameters.get("is_latex", False):
-        parameters["reserved_expressions_strings"]["learner"].update(
+        self.context = context
+        self.parameters = parameters
+        self.parsing_parameters = parsing_parameters
+
+        # The answer is parsed once, feedback produced while parsing it is
+        # stored so that it can be added to the result for each response
+        answer_result = EvaluationResult()
+        answer_strings = {"task": reserved_expressions_strings["task"]}
+        _, parsed_answer = parse_reserved_expressions(answer_strings, parameters, answer_result)
+        self.answer_string = answer_strings["task"]["answer"]
+        self.parsed_answer = parsed_answer["task"]
+        self.answer_feedback = answer_result.get_feedback_items()
+
+        self._criteria = None
+
+    def criteria(self):
+        """
+            Parses the criteria the first time they are needed, the criteria
+            only depends on the names of the reserved expressions so the same
+            criteria can be used for all responses.
+        """
+        if self._criteria is None:
+            reserved_expressions = {
+                "learner": {"response": None},
+                "task": self.parsed_answer,
+            }
+            with stage("criteria_parsing"):
+                criteria_parser = self.context["generate_criteria_parser"](reserved_expressions)
+                self._criteria = create_criteria_dict(criteria_parser, self.parameters)
+        return self._criteria
+
+    def evaluate(self, response, include_test_data=False) -> dict:
+        """
+            Evaluates a response against the compiled task, the returned
+            dictionary is identical to the output of evaluation_function.
+        """
+        with collect_spans() as spans:
+            with span("evaluate", category="evaluation"):
+                result = self._evaluate(response, include_test_data)
+        return attach_trace(result, spans, include_test_data)
+
+    def _evaluate(self, response, include_test_data):
+        evaluation_result = EvaluationResult()
+        evaluation_result.is_correct = False
+
+        symbolic_comparison_internal_messages = symbolic_feedback_string_generators["INTERNAL"]
+
+        context = self.context
+        parameters = copy_parameters(self.parameters)
+
+        time_budget = None
+        if parameters.get("time_budget_ms", None) is not None:
+            time_budget = TimeBudget(parameters["time_budget_ms"])
+
+        reserved_expressions_strings = {
+            "learner": {
+                "response": response
+            },
+            "task": {
+                "answer": self.answer_string
+            }
+        }
+        parameters.update({"reserved_expressions_strings": reserved_expressions_strings})
+
+        # CONSIDER: Can this be moved into the preprocessing procedures in a consistent way?
+        # Can it be turned into its own context? Or moved into the determine_context procedure?
+        # What solution will be most consistently reusable?
+        if parameters.get("is_latex", False):
+            with stage("preprocess"), span("latex_conversion", category="parse"):
+                latex_response = parse_latex(response, parameters.get("symbols", {}), False, parameters=parameters)
+            parameters["reserved_expressions_strings"]["learner"].update(
+                {
+                    "response": latex_response,
+                }
+            )
+
+        # FIXME: Move this into expression_utilities
+        if self.params.get("strict_syntax", False):
+            if "^" in response:
+                evaluation_result.add_feedback(("NOTATION_WARNING_EXPONENT", symbolic_comparison_internal_messages("NOTATION_WARNING_EXPONENT")(dict())))
+            if "!" in response:
+                evaluation_result.add_feedback(("NOTATION_WARNING_FACTORIAL", symbolic_comparison_internal_messages("NOTATION_WARNING_FACTORIAL")(dict())))
+
+        if "!!!" in response:
+            evaluation_result.add_feedback(
+                ("NOTATION_WARNING_TRIPLE_FACTORIAL", symbolic_comparison_internal_messages("NOTATION_WARNING_TRIPLE_FACTORIAL")(dict())))
+
+        learner_strings = {"learner": reserved_expressions_strings["learner"]}
+        reserved_expressions_success, parsed_response = parse_reserved_expressions(learner_strings, parameters, evaluation_result)
+        for feedback_item in self.answer_feedback:
+            evaluation_result.add_feedback(feedback_item)
+        if reserved_expressions_success is False:
+            return evaluation_result.serialise(include_test_data)
+        reserved_expressions = FrozenValuesDictionary(
             {
-                "response": parse_latex(response, parameters.get("symbols", {}), False, parameters=parameters),
+                "learner": parsed_response["learner"],
+                "task": self.parsed_answer,
             }
         )
+        reserved_expressions_parsed = {**reserved_expressions["learner"], **reserved_expressions["task"]}
 
-    # FIXME: Move this into expression_utilities
-    if params.get("strict_syntax", False):
-        if "^" in response:
-            evaluation_result.add_feedback(("NOTATION_WARNING_EXPONENT", symbolic_comparison_internal_messages("NOTATION_WARNING_EXPONENT")(dict())))
-        if "!" in response:
-            evaluation_result.add_feedback(("NOTATION_WARNING_FACTORIAL", symbolic_comparison_internal_messages("NOTATION_WARNING_FACTORIAL")(dict())))
-
-    if "!!!" in response:
-        evaluation_result.add_feedback(
-            ("NOTATION_WARNING_TRIPLE_FACTORIAL", symbolic_comparison_internal_messages("NOTATION_WARNING_TRIPLE_FACTORIAL")(dict())))
-
-    reserved_expressions_success, reserved_expressions = parse_reserved_expressions(reserved_expressions_strings, parameters, evaluation_result)
-    if reserved_expressions_success is False:
-        return evaluation_result.serialise(include_test_data)
-    reserved_expressions_parsed = {**reserved_expressions["learner"], **reserved_expressions["task"]}
-
-    try:
-        preview = context["expression_preview"](response, deepcopy(parameters))["preview"]
-    except Exception:
-        evaluation_result.latex = response
-        evaluation_result.simplified = response
-    else:
-        evaluation_result.latex = preview["latex"]
-        parsed_response = reserved_expressions["learner"]["response"]
-        if isinstance(parsed_response, list) or isinstance(parsed_response, set):
-            evaluation_result.simplified = ", ".join([str(ex.simplify()) for ex in parsed_response])
-        else:
+        with stage("preview"):
             try:
-                evaluation_result.simplified = str(parsed_response.simplify())
+                preview = context["expression_preview"](response, copy_parameters(parameters))["preview"]
             except Exception:
+                evaluation_result.latex = response
                 evaluation_result.simplified = response
+            else:
+                evaluation_result.latex = preview["latex"]
+                parsed_response = reserved_expressions["learner"]["response"]
+                if isinstance(parsed_response, list) or isinstance(parsed_response, set):
+                    evaluation_result.simplified = ", ".join([str(traced_simplify(ex)) for ex in parsed_response])
+                else:
+                    try:
+                        evaluation_result.simplified = str(traced_simplify(parsed_response))
+                    except Exception:
+                        evaluation_result.simplified = response
 
-    criteria_parser = context["generate_criteria_parser"](reserved_expressions)
-    criteria = create_criteria_dict(criteria_parser, parameters)
+        criteria = self.criteria()
 
-    evaluation_parameters = FrozenValuesDictionary(
-        {
-            "reserved_expressions_strings": reserved_expressions_strings,
-            "reserved_expressions": reserved_expressions_parsed,
-            "criteria": criteria,
-            "disabled_evaluation_nodes": parameters.get("disabled_evaluation_nodes", set()),
-            "parsing_parameters": parsing_parameters,
-            "evaluation_result": evaluation_result,
-            "syntactical_comparison": parameters.get("syntactical_comparison", False),
-            "multiple_answers_criteria": parameters.get("multiple_answers_criteria", "all"),
-            "numerical": parameters.get("numerical", False),
-            "atol": parameters.get("atol", 0),
-            "rtol": parameters.get("rtol", 0),
-            "custom_feedback": parameters.get("custom_feedback",{}),
-        }
-    )
+        evaluation_parameters = FrozenValuesDictionary(
+            {
+                "reserved_expressions_strings": reserved_expressions_strings,
+                "reserved_expressions": reserved_expressions_parsed,
+                "criteria": criteria,
+                "disabled_evaluation_nodes": parameters.get("disabled_evaluation_nodes", set()),
+                "parsing_parameters": self.parsing_parameters,
+                "evaluation_result": evaluation_result,
+                "syntactical_comparison": parameters.get("syntactical_comparison", False),
+                "multiple_answers_criteria": parameters.get("multiple_answers_criteria", "all"),
+                "numerical": parameters.get("numerical", False),
+                "numeric_probe": parameters.get("numeric_probe", True),
+                "numeric_probe_points": parameters.get("numeric_probe_points", 5),
+                "atol": parameters.get("atol", 0),
+                "rtol": parameters.get("rtol", 0),
+                "custom_feedback": parameters.get("custom_feedback",{}),
+                "time_budget": time_budget,
+                "time_budget_feedback": symbolic_comparison_internal_messages("TIME_BUDGET_EXCEEDED"),
+            }
+        )
 
-    # Performs evaluation of response
-    feedback_procedures = parameters["context"]["feedback_procedure_generator"](evaluation_parameters)
-    generate_feedback(criteria, feedback_procedures, evaluation_parameters)
+        # Performs evaluation of response
+        with stage("graph_construction"):
+            feedback_procedures = context["feedback_procedure_generator"](evaluation_parameters)
+        with stage("graph_evaluation"):
+            generate_feedback(criteria, feedback_procedures, evaluation_parameters)
 
-    result = evaluation_result.serialise(include_test_data)
+        result = evaluation_result.serialise(include_test_data)
 
-    if parameters.get("feedback_for_incorrect_response", None) is not None:
-        result["feedback"] = parameters["feedback_for_incorrect_response"]
+        if parameters.get("feedback_for_incorrect_response", None) is not None:
+            result["feedback"] = parameters["feedback_for_incorrect_response"]
 
+        return result
+
+
+def attach_trace(result, spans, include_test_data):
+    """
+        Adds the spans recorded during the evaluation to the result
+        if tracing is enabled and test data is requested.
+    """
+    if include_test_data is True and tracing_enabled():
+        result["trace"] = {"spans": list(spans), "summary": summarise_spans(spans)}
     return result
+
+
+def compile_task(answer, params) -> CompiledTask:
+    """
+    Prepares everything needed to evaluate responses to a task with the given answer and parameters.
+    Use the evaluate method of the returned object to evaluate responses, e.g.
+        task = compile_task(answer, params)
+        results = [task.evaluate(response) for response in responses]
+    gives the same results as calling evaluation_function(response, answer, params) for each response.
+    """
+    return CompiledTask(answer, params)
+
+
+def evaluation_function(response, answer, params, include_test_data=False) -> dict:
+    """
+    Function that allows for various types of comparison of various kinds of expressions.
+    Supported input parameters:
+    strict_SI_syntax:
+        - if set to True, use basic dimensional analysis functionality.
+    """
+    # Same as compile_task(answer, params).evaluate(response, include_test_data), but
+    # the spans are collected once and include the time needed to compile the task
+    with collect_spans() as spans:
+        with span("evaluation_function", category="evaluation"):
+            result = compile_task(answer, params)._evaluate(response, include_test_data)
+    return attach_trace(result, spans, include_test_data)
+
+
+def evaluation_function_batch(responses, answer, params, include_test_data=False) -> list:
+    """
+    Evaluates a list of responses against the same answer and parameters.
+    The task is compiled once and each distinct response is only evaluated once,
+    duplicates get a copy of the result. Responses are grouped on the raw string,
+    since parts of the result (e.g. `response_latex`, `response_simplified` and
+    notation warnings) depend on how the response was written, so responses that
+    are only equal after preprocessing can get different results.
+    Returns a list with the results, in the same order as the responses.
+    """
+    task = compile_task(answer, params)
+    results = {}
+    batch = []
+    for response in responses:
+        if response not in results:
+            results.update({response: task.evaluate(response, include_test_data)})
+        batch.append(deepcopy(results[response]))
+    return batch
@@ -0,0 +1,257 @@
+import multiprocessing
+import os
+import queue
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+# Tasks used to warm up new worker processes, running them once makes sure that all
+# modules (sympy, latex2sympy, the parsers etc.) are imported and initialised
+warm_up_tasks = [
+    ("evaluation_function", ("2x", "2*x", {"strict_syntax": False, "elementary_functions": True}), {}),
+    ("evaluation_function", ("1.24 mile/hour", "1.24 mile/hour", {"strict_syntax": False, "physical_quantity": True}), {}),
+    ("preview_function", ("x^{2}", {"is_latex": True}), {}),
+    ("warm_up_quantity_parsers", (), {}),
+]
+
+
+class WorkerTimeoutError(Exception):
+    """
+        Raised when a worker process does not finish its task before the deadline.
+        The worker process is killed and replaced when this happens.
+    """
+    pass
+
+
+class WorkerError(Exception):
+    """
+        Raised when the function called in a worker process raises an exception,
+        or when the worker process stops unexpectedly.
+    """
+    def __init__(self, message, worker_traceback=None):
+        super().__init__(message)
+        self.worker_traceback = worker_traceback
+
+
+def worker_functions():
+    from .evaluation import evaluation_function
+    from .preview import preview_function
+    from .utility.physical_quantity_utilities import warm_up_quantity_parsers
+    return {
+        "evaluation_function": evaluation_function,
+        "preview_function": preview_function,
+        "warm_up_quantity_parsers": warm_up_quantity_parsers,
+    }
+
+
+def set_memory_limit(memory_limit_mb):
+    try:
+        import resource
+    except ImportError:
+        return
+    limit = int(memory_limit_mb)*1024*1024
+    resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+def worker_main(connection, memory_limit_mb=None):
+    """
+        Main loop for worker processes. Receives messages on the form
+        (function name, arguments, keyword arguments) and sends back
+        ("result", result) or ("error", (message, traceback)).
+        A message that is None stops the worker.
+    """
+    if memory_limit_mb is not None:
+        set_memory_limit(memory_limit_mb)
+    functions = worker_functions()
+    for (name, args, kwargs) in warm_up_tasks:
+        try:
+            functions[name](*args, **kwargs)
+        except Exception:
+            pass
+    connection.send(("ready", None))
+    while True:
+        try:
+            message = connection.recv()
+        except (EOFError, OSError):
+            break
+        if message is None:
+            break
+        (name, args, kwargs) = message
+        try:
+            result = functions[name](*args, **kwargs)
+        except BaseException as exc:
+            reply = ("error", (type(exc).__name__+": "+str(exc), traceback.format_exc()))
+        else:
+            reply = ("result", result)
+        try:
+            connection.send(reply)
+        except Exception as exc:
+            connection.send(("error", ("Result could not be sent: "+str(exc), traceback.format_exc())))
+    connection.close()
+
+
+class Worker:
+    """
+        A worker process together with the connection used to communicate with it.
+    """
+
+    def __init__(self, context, memory_limit_mb=None):
+        self.connection, child_connection = context.Pipe()
+        self.process = context.Process(target=worker_main, args=(child_connection, memory_limit_mb), daemon=True)
+        self.process.start()
+        child_connection.close()
+        self.ready = False
+        self.completed_tasks = 0
+
+    def wait_until_ready(self, timeout):
+        if self.ready:
+            return
+        if not self.connection.poll(timeout):
+            raise WorkerTimeoutError("Worker process was not ready within "+str(timeout)+" seconds.")
+        status, _ = self.connection.recv()
+        self.ready = status == "ready"
+
+    def call(self, name, args, kwargs, timeout):
+        self.connection.send((name, args, kwargs))
+        if not self.connection.poll(timeout):
+            raise WorkerTimeoutError(f"{name} did not finish within {timeout} seconds.")
+        status, value = self.connection.recv()
+        self.completed_tasks += 1
+        if status == "error":
+            raise WorkerError(value[0], worker_traceback=value[1])
+        return value
+
+    def kill(self):
+        if self.process.is_alive():
+            self.process.kill()
+        self.process.join()
+        self.connection.close()
+
+    def stop(self, timeout=1):
+        try:
+            self.connection.send(None)
+        except (OSError, ValueError):
+            pass
+        self.process.join(timeout)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.connection.close()
+
+
+class ExecutionEngine:
+    """
+        Keeps a pool of warm worker processes and sends `evaluation_function` and
+        `preview_function` calls to them. Since simplification is CPU bound and holds
+        the GIL, using processes is the only way to use more than one core.
+
+        Parameters:
+            workers              : number of worker processes, defaults to the number of CPUs
+            timeout              : default deadline (in seconds) for each call, a worker that
+                                   does not finish before the deadline is killed and replaced
+            max_tasks_per_worker : workers are replaced after this many tasks so that memory
+                                   used by caches does not grow without bound (None to disable)
+            memory_limit_mb      : optional limit on the address space of each worker
+            start_method         : multiprocessing start method, defaults to `forkserver` when
+                                   available so that new workers start from a clean process
+                                   where the evaluation function modules are already imported
+            warm_up_timeout      : time (in seconds) a new worker is given to warm up
+    """
+
+    def __init__(self, workers=None, timeout=30, max_tasks_per_worker=500, memory_limit_mb=None, start_method=None, warm_up_timeout=120):
+        if workers is None:
+            workers = os.cpu_count() or 1
+        if start_method is None and "forkserver" in multiprocessing.get_all_start_methods():
+            start_method = "forkserver"
+        self.number_of_workers = max(1, int(workers))
+        self.timeout = timeout
+        self.max_tasks_per_worker = max_tasks_per_worker
+        self.memory_limit_mb = memory_limit_mb
+        self.warm_up_timeout = warm_up_timeout
+        self._context = multiprocessing.get_context(start_method)
+        if start_method == "forkserver" and __package__:
+            self._context.set_forkserver_preload([__package__+".evaluation", __package__+".preview", "latex2sympy2"])
+        self._idle_workers = queue.Queue()
+        self._lock = threading.Lock()
+        self._closed = False
+        for _ in range(self.number_of_workers):
+            self._idle_workers.put(Worker(self._context, self.memory_limit_mb))
+        self._executor = ThreadPoolExecutor(max_workers=self.number_of_workers)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.close()
+
+    def _replace(self, worker, kill=False):
+        if kill:
+            worker.kill()
+        else:
+            worker.stop()
+        return Worker(self._context, self.memory_limit_mb)
+
+    def call(self, name, *args, timeout=None, **kwargs):
+        """
+            Calls the function with the given name in a worker process and returns the result.
+            Raises WorkerTimeoutError if the call does not finish before the deadline and
+            WorkerError if the call raised an exception in the worker.
+        """
+        if self._closed:
+            raise Exception("Execution engine is closed.")
+        if timeout is None:
+            timeout = self.timeout
+        worker = self._idle_workers.get()
+        try:
+            worker.wait_until_ready(self.warm_up_timeout)
+            return worker.call(name, args, kwargs, timeout)
+        except WorkerTimeoutError:
+            worker = self._replace(worker, kill=True)
+            raise
+        except (EOFError, OSError) as exc:
+            worker = self._replace(worker, kill=True)
+            raise WorkerError("Worker process stopped unexpectedly.") from exc
+        finally:
+            if self.max_tasks_per_worker is not None and worker.completed_tasks >= self.max_tasks_per_worker:
+                worker = self._replace(worker)
+            self._idle_workers.put(worker)
+
+    def submit(self, name, *args, timeout=None, **kwargs):
+        """
+            Same as call but returns a concurrent.futures.Future.
+        """
+        return self._executor.submit(self.call, name, *args, timeout=timeout, **kwargs)
+
+    def evaluate(self, response, answer, params, include_test_data=False, timeout=None):
+        return self.call("evaluation_function", response, answer, params, include_test_data=include_test_data, timeout=timeout)
+
+    def preview(self, response, params, timeout=None):
+        return self.call("preview_function", response, params, timeout=timeout)
+
+    def wait_until_ready(self):
+        """
+            Waits until all idle workers have finished warming up.
+        """
+        for worker in list(self._idle_workers.queue):
+            worker.wait_until_ready(self.warm_up_timeout)
+
+    def worker_pids(self):
+        """
+            Returns the process ids of the workers that are currently idle.
+        """
+        return [worker.process.pid for worker in list(self._idle_workers.queue)]
+
+    def close(self):
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        self._executor.shutdown(wait=True)
+        started = time.monotonic()
+        while time.monotonic()-started < 10:
+            try:
+                worker = self._idle_workers.get_nowait()
+            except queue.Empty:
+                break
+            worker.stop()
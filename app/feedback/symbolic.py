@@ -30,6 +30,7 @@ feedback_generators["INTERNAL"] = lambda tag: lambda inputs: {
     "EQUALITY_EQUIVALENCE_UNKNOWN": "Cannot determine if the given equality is equivalent to the expected equality.",
     "WITHIN_TOLERANCE": None,  # "The difference between the response the answer is within specified error tolerance.",
     "NOT_NUMERICAL": None,  # "The expression cannot be evaluated numerically.",
+    "TIME_BUDGET_EXCEEDED": "Evaluation was cancelled since it took too long.",
 }[tag]
 feedback_generators["GENERIC"] = lambda tag: lambda inputs: {
     "TRUE": None,
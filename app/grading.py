@@ -0,0 +1,135 @@
+"""
+    Command-line entry point for grading many responses, e.g. when a whole
+    course is regraded after a task has been changed.
+
+    Reads evaluation requests as JSON lines, each line on the form
+        {"response": ..., "answer": ..., "params": {...}}
+    from a file or stdin, evaluates them in a pool of worker processes
+    (or in this process, in the main thread, with --workers 0)
+    and writes one JSON line per request, in the same order as the input:
+        {"line": ..., "result": {...}, "error": null, "time_ms": ...}
+    Any other fields in the input (e.g. "request_id") are copied to the output.
+
+    Usage:
+        python -m app.grading [input] [--output output] [--workers N] [--timeout seconds] [--include-test-data]
+"""
+import argparse
+import json
+import sys
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+
+from .execution_engine import ExecutionEngine
+
+
+def error_dictionary(exception):
+    return {"type": type(exception).__name__, "message": str(exception)}
+
+
+def parse_record(line):
+    record = json.loads(line)
+    if not isinstance(record, dict):
+        raise ValueError("Each line must contain a JSON object.")
+    for key in ("response", "answer"):
+        if key not in record.keys():
+            raise ValueError(f"Field `{key}` is missing.")
+    params = record.get("params", {})
+    if not isinstance(params, dict):
+        raise ValueError("Field `params` must be a JSON object.")
+    return record
+
+
+def grade_record(evaluate, record, include_test_data=False):
+    """
+        Evaluates a single record and returns the output record.
+        Errors are captured and returned in the `error` field.
+    """
+    output = {key: value for (key, value) in record.items() if key not in {"response", "answer", "params"}}
+    start = time.perf_counter()
+    try:
+        output["result"] = evaluate(record["response"], record["answer"], record.get("params", {}), include_test_data)
+        output["error"] = None
+    except Exception as e:
+        output["result"] = None
+        output["error"] = error_dictionary(e)
+    output["time_ms"] = 1000*(time.perf_counter()-start)
+    return output
+
+
+def grade_stream(lines, output, evaluate, workers=1, include_test_data=False):
+    """
+        Grades each line in lines using evaluate(response, answer, params, include_test_data)
+        and writes the results to output, in the same order as the input, as soon as they
+        are available. At most 2*workers records are being processed at the same time.
+        If workers is 0 the records are graded one at a time in the calling thread, so that
+        the time budget of the evaluation (see time_budget_ms) can interrupt running checks.
+        Returns the number of records that were graded.
+    """
+    pending = deque()
+    count = 0
+
+    def write(future_or_output):
+        if isinstance(future_or_output, dict):
+            record_output = future_or_output
+        else:
+            record_output = future_or_output.result()
+        output.write(json.dumps(record_output)+"\n")
+        output.flush()
+
+    with (ThreadPoolExecutor(max_workers=workers) if workers > 0 else nullcontext()) as executor:
+        for (line_number, line) in enumerate(lines, start=1):
+            if len(line.strip()) == 0:
+                continue
+            count += 1
+            try:
+                record = parse_record(line)
+            except Exception as e:
+                pending.append({"line": line_number, "result": None, "error": error_dictionary(e), "time_ms": 0.0})
+            else:
+                record = {"line": line_number, **record}
+                if executor is None:
+                    pending.append(grade_record(evaluate, record, include_test_data))
+                else:
+                    pending.append(executor.submit(grade_record, evaluate, record, include_test_data))
+            while len(pending) > 2*max(1, workers) or (len(pending) > 0 and isinstance(pending[0], dict)):
+                write(pending.popleft())
+        while len(pending) > 0:
+            write(pending.popleft())
+    return count
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description="Grade evaluation requests given as JSON lines.")
+    parser.add_argument("input", nargs="?", default="-", help="file with one request per line, - (default) reads from stdin")
+    parser.add_argument("--output", "-o", default="-", help="file that results are written to, - (default) writes to stdout")
+    parser.add_argument("--workers", "-w", type=int, default=None, help="number of worker processes (default: number of CPUs), 0 evaluates in this process")
+    parser.add_argument("--timeout", "-t", type=float, default=None, help="time limit (in seconds) for each request, default 30 (cannot be used with --workers 0)")
+    parser.add_argument("--include-test-data", action="store_true", help="include test data in the results")
+    arguments = parser.parse_args(arguments)
+    if arguments.workers == 0 and arguments.timeout is not None:
+        parser.error("--timeout cannot be used with --workers 0, use the time_budget_ms parameter instead")
+
+    input_file = sys.stdin if arguments.input == "-" else open(arguments.input, "r", encoding="utf-8")
+    output_file = sys.stdout if arguments.output == "-" else open(arguments.output, "w", encoding="utf-8")
+    try:
+        if arguments.workers == 0:
+            from .evaluation import evaluation_function
+            grade_stream(input_file, output_file, evaluation_function, workers=0, include_test_data=arguments.include_test_data)
+        else:
+            timeout = arguments.timeout if arguments.timeout is not None else 30
+            with ExecutionEngine(workers=arguments.workers, timeout=timeout) as engine:
+                engine.wait_until_ready()
+                def evaluate(response, answer, params, include_test_data):
+                    return engine.evaluate(response, answer, params, include_test_data=include_test_data)
+                grade_stream(input_file, output_file, evaluate, workers=engine.number_of_workers, include_test_data=arguments.include_test_data)
+    finally:
+        if input_file is not sys.stdin:
+            input_file.close()
+        if output_file is not sys.stdout:
+            output_file.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+import pytest
+
+from ..benchmarking import percentile, stage_benchmark, compare_to_baseline, run_stage_benchmark, stage_benchmark_cases, parse_import_times, import_time_benchmark, quantity_construction_benchmark
+from ..utility.tracing_utilities import evaluation_stages, record_stage_times, stage
+
+
+class TestStageBenchmark():
+
+    def test_stage_times_are_only_recorded_when_requested(self):
+        with stage("parse"):
+            pass
+        with record_stage_times() as stage_times:
+            with stage("parse"):
+                pass
+            with stage("parse"):
+                pass
+        assert list(stage_times.keys()) == ["parse"]
+        assert stage_times["parse"] >= 0
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        assert percentile(values, 0.5) == 50
+        assert percentile(values, 0.9) == 90
+        assert percentile(values, 0.99) == 99
+        assert percentile([3.0], 0.99) == 3.0
+
+    def test_generated_families(self):
+        families = {case["family"] for case in stage_benchmark_cases()}
+        assert families == {"benchmarks", "long_polynomial", "nested_trigonometry", "multiple_answers", "imperial_quantity", "latex"}
+
+    def test_all_stages_are_timed(self):
+        cases = [
+            {"family": "symbolic", "response": "2x", "answer": "2*x", "params": {"strict_syntax": False}},
+            {"family": "quantity", "response": "2 foot", "answer": "24 inch", "params": {"physical_quantity": True, "units_string": "SI common imperial"}},
+        ]
+        results = stage_benchmark(cases, repetitions=2)
+        assert set(results["stages"].keys()) == set(evaluation_stages+["total"])
+        assert set(results["families"].keys()) == {"symbolic", "quantity"}
+        for stage_name in evaluation_stages:
+            assert results["stages"][stage_name]["count"] == 4
+            assert results["stages"][stage_name]["p50"] > 0
+        total = results["stages"]["total"]
+        assert total["p50"] <= total["p90"] <= total["p99"] <= total["max"]
+
+    def test_regressions_are_found(self):
+        def results(parse_time, preview_time):
+            stages = {"parse": {"p50": parse_time}, "preview": {"p50": preview_time}}
+            return {"stages": stages, "families": {"family": stages}}
+
+        baseline = results(10.0, 0.5)
+        assert compare_to_baseline(results(12.0, 1.2), baseline, threshold=0.25) == []
+        regressions = compare_to_baseline(results(14.0, 1.2), baseline, threshold=0.25)
+        assert [(regression["group"], regression["stage"]) for regression in regressions] == [("all", "parse"), ("family", "parse")]
+        assert regressions[0]["change"] == 0.4
+
+    def test_save_baseline_requires_baseline(self, capsys):
+        with pytest.raises(SystemExit) as exit_info:
+            run_stage_benchmark(["--save-baseline"])
+        assert exit_info.value.code == 2
+        assert "--save-baseline requires --baseline" in capsys.readouterr().err
+
+    def test_parse_import_times(self):
+        output = "\n".join([
+            "import time: self [us] | cumulative | imported package",
+            "import time:       120 |        120 |   re",
+            "import time:      2500 |       4000 | app.evaluation",
+            "some other output",
+        ])
+        import_times = parse_import_times(output)
+        assert import_times == {
+            "re": {"self_ms": 0.12, "cumulative_ms": 0.12},
+            "app.evaluation": {"self_ms": 2.5, "cumulative_ms": 4.0},
+        }
+
+    def test_latex2sympy_is_not_imported_by_evaluation_function(self):
+        results = import_time_benchmark(modules=["app.evaluation"], repetitions=1)
+        assert results["app.evaluation"]["imports_latex2sympy"] is False
+        assert results["app.evaluation"]["p50"] > 0
+
+    def test_quantity_construction_benchmark(self):
+        results = quantity_construction_benchmark(quantities=["2 kN*m"], repetitions=2)
+        assert [result["quantity"] for result in results] == ["2 kN*m"]
+        assert results[0]["rebuilt_ms"] > 0 and results[0]["shared_ms"] > 0
@@ -0,0 +1,77 @@
+import threading
+
+from ..utility.cache_utilities import LRUCache
+
+
+class TestLRUCache():
+
+    def test_hits_and_misses_are_counted(self):
+        cache = LRUCache(maxsize=4)
+        assert cache.get("a") is None
+        cache.put("a", 1)
+        assert cache.get("a") == 1
+        assert cache.info() == {"hits": 1, "misses": 1, "size": 1, "maxsize": 4}
+
+    def test_least_recently_used_item_is_discarded(self):
+        cache = LRUCache(maxsize=2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        cache.get("a")
+        cache.put("c", 3)
+        assert cache.get("b") is None
+        assert cache.get("a") == 1
+        assert cache.get("c") == 3
+        assert len(cache) == 2
+
+    def test_cached_none_is_a_hit(self):
+        cache = LRUCache()
+        calls = []
+        compute = lambda: calls.append(1)
+        assert cache.get_or_compute("a", compute) is None
+        assert cache.get_or_compute("a", compute) is None
+        assert len(calls) == 1
+
+    def test_exceptions_are_not_cached(self):
+        cache = LRUCache()
+
+        def fail():
+            raise ValueError()
+
+        for _ in range(2):
+            try:
+                cache.get_or_compute("a", fail)
+            except ValueError:
+                pass
+        assert len(cache) == 0
+        assert cache.misses == 2
+
+    def test_cache_with_size_zero_stores_nothing(self):
+        cache = LRUCache(maxsize=0)
+        cache.put("a", 1)
+        assert len(cache) == 0
+
+    def test_resize_and_clear(self):
+        cache = LRUCache(maxsize=10)
+        for k in range(10):
+            cache.put(k, k)
+        cache.resize(3)
+        assert len(cache) == 3
+        assert cache.get(9) == 9
+        cache.clear()
+        assert cache.info() == {"hits": 0, "misses": 0, "size": 0, "maxsize": 3}
+
+    def test_concurrent_use(self):
+        cache = LRUCache(maxsize=50)
+
+        def work(offset):
+            for k in range(500):
+                cache.get_or_compute((k+offset) % 100, lambda: k)
+
+        threads = [threading.Thread(target=work, args=(n,)) for n in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        info = cache.info()
+        assert info["size"] == 50
+        assert info["hits"]+info["misses"] == 8*500
@@ -0,0 +1,53 @@
+import pytest
+from copy import deepcopy
+
+from ..evaluation import evaluation_function, compile_task
+
+
+class TestCompiledTask():
+
+    @pytest.mark.parametrize(
+        "responses, answer, params",
+        [
+            (["2a", "3a", "2*a", ""], "a", {"strict_syntax": False, "elementary_functions": True, "criteria": "response/answer=2"}),
+            (["2*x**2 = 10*y**2+20", "x = 2", "x**2"], "x**2-5*y**2-10=0", {"strict_syntax": False}),
+            (["sin(x)+2", "cos(x)", "sin(x"], "sin(x)", {"strict_syntax": False, "elementary_functions": True}),
+            (["x**2", "x**3", "x!!!"], "x**2", {"strict_syntax": True}),
+            (["x^{2}", r"\frac{1}{2}x"], "x**2", {"strict_syntax": False, "is_latex": True}),
+            (["2a", "a2", "a*b"], "2*a", {"strict_syntax": False, "syntactical_comparison": True}),
+            (["1.24 mile/hour", "2 km/h", "1.24", "mile/hour"], "1.24 mile/hour", {"strict_syntax": False, "elementary_functions": True, "physical_quantity": True}),
+            (["10 kN", "10000 N"], "10 kN", {"strict_syntax": False, "physical_quantity": True, "rtol": 0.01}),
+        ]
+    )
+    def test_compiled_task_gives_same_result_as_evaluation_function(self, responses, answer, params):
+        task = compile_task(answer, deepcopy(params))
+        for response in responses:
+            expected = evaluation_function(response, answer, deepcopy(params), include_test_data=True)
+            assert task.evaluate(response, include_test_data=True) == expected
+
+    def test_compiled_task_raises_for_answer_that_cannot_be_parsed(self):
+        with pytest.raises(Exception):
+            compile_task("-2M0/3", {"strict_syntax": True})
+
+    def test_compiled_task_can_evaluate_responses_repeatedly(self):
+        task = compile_task("lambda*x", {"strict_syntax": False, "elementary_functions": True})
+        for _ in range(3):
+            assert task.evaluate("x*lambda")["is_correct"] is True
+            assert task.evaluate("x+lambda")["is_correct"] is False
+
+    def test_aliases_of_lambda_are_kept_for_every_response(self):
+        params = {
+            "strict_syntax": False,
+            "symbols": {
+                "k": {"latex": "k", "aliases": ["K", "kk"]},
+                "lambda": {"latex": r"\lambda", "aliases": ["lam"]},
+            },
+        }
+        responses = ["K*lam", "k*lam", "K*lambda", "kk*lam"]
+        for response in responses:
+            assert evaluation_function(response, "k*lambda", deepcopy(params))["is_correct"] is True
+        task = compile_task("k*lambda", deepcopy(params))
+        for _ in range(2):
+            for response in responses:
+                assert task.evaluate(response)["is_correct"] is True
+        assert task.parameters["symbols"]["lamda"] == {"latex": r"\lambda", "aliases": ["lam", "lambda"]}
@@ -0,0 +1,58 @@
+import pytest
+from copy import deepcopy
+
+from ..evaluation import evaluation_function, evaluation_function_batch, CompiledTask
+
+
+class TestEvaluationFunctionBatch():
+
+    @pytest.mark.parametrize(
+        "responses, answer, params",
+        [
+            (["2a", "2*a", "2a", " 2a ", "3a", "2a"], "2*a", {"strict_syntax": False, "elementary_functions": True}),
+            (["sin(x)", "sin(x)", "cos(x)", ""], "sin(x)", {"strict_syntax": False, "elementary_functions": True}),
+            (["1.24 mile/hour", "2 km/h", "1.24 mile/hour"], "1.24 mile/hour", {"strict_syntax": False, "elementary_functions": True, "physical_quantity": True}),
+        ]
+    )
+    def test_batch_gives_same_results_as_evaluation_function(self, responses, answer, params):
+        results = evaluation_function_batch(responses, answer, deepcopy(params))
+        assert len(results) == len(responses)
+        for (response, result) in zip(responses, results):
+            assert result == evaluation_function(response, answer, deepcopy(params))
+
+    def test_batch_evaluates_each_distinct_response_once(self, monkeypatch):
+        evaluated = []
+        evaluate = CompiledTask.evaluate
+
+        def counting_evaluate(self, response, include_test_data=False):
+            evaluated.append(response)
+            return evaluate(self, response, include_test_data)
+
+        monkeypatch.setattr(CompiledTask, "evaluate", counting_evaluate)
+        params = {
+            "strict_syntax": False,
+            "elementary_functions": True,
+            "symbols": {"alpha": {"aliases": ["a", "A"], "latex": r"\alpha"}}
+        }
+        responses = ["2*a", "2*A", " 2*a  ", "a", "2*a", "a"]
+        results = evaluation_function_batch(responses, "2*alpha", params)
+        assert evaluated == ["2*a", "2*A", " 2*a  ", "a"]
+        assert [result["is_correct"] for result in results] == [True, True, True, False, True, False]
+
+    @pytest.mark.parametrize(
+        "responses, answer, params",
+        [
+            (["1.0 m", "1.0  m", " 1.0 m"], "1 m", {"strict_syntax": False, "physical_quantity": True}),
+            (["x**2", " x**2", "x**2 "], "x**2", {"strict_syntax": True}),
+            (["2*a", "2*A", "2 a"], "2*alpha", {"strict_syntax": False, "symbols": {"alpha": {"aliases": ["a", "A"], "latex": r"\alpha"}}}),
+        ]
+    )
+    def test_near_duplicates_give_same_results_as_evaluation_function(self, responses, answer, params):
+        results = evaluation_function_batch(responses, answer, deepcopy(params), include_test_data=True)
+        for (response, result) in zip(responses, results):
+            assert result == evaluation_function(response, answer, deepcopy(params), include_test_data=True)
+
+    def test_batch_results_are_independent_copies(self):
+        results = evaluation_function_batch(["x", "x"], "x", {"strict_syntax": False})
+        results[0]["tags"].append("CHANGED")
+        assert "CHANGED" not in results[1]["tags"]
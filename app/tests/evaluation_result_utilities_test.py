@@ -0,0 +1,47 @@
+from ..utility.evaluation_result_utilities import EvaluationResult
+
+
+class CountingGraph:
+
+    def __init__(self, name):
+        self.name = name
+        self.calls = {"json": 0, "mermaid": 0}
+
+    def json(self):
+        self.calls["json"] += 1
+        return "json "+self.name
+
+    def mermaid(self):
+        self.calls["mermaid"] += 1
+        return "mermaid "+self.name
+
+
+class TestEvaluationResult():
+
+    def test_criteria_graphs_are_not_serialised_without_test_data(self):
+        result = EvaluationResult()
+        graph = CountingGraph("a")
+        result.add_criteria_graph("a", graph)
+        output = result.serialise()
+        assert "criteria_graphs" not in output
+        assert graph.calls == {"json": 0, "mermaid": 0}
+
+    def test_criteria_graphs_are_serialised_once(self):
+        result = EvaluationResult()
+        graphs = [CountingGraph("a"), CountingGraph("b")]
+        for graph in graphs:
+            result.add_criteria_graph(graph.name, graph)
+        for _ in range(2):
+            output = result.serialise(include_test_data=True)
+            assert output["criteria_graphs"] == {"a": "json a", "b": "json b"}
+            assert output["criteria_graphs_vis"] == {"a": "mermaid a", "b": "mermaid b"}
+        for graph in graphs:
+            assert graph.calls == {"json": 1, "mermaid": 1}
+
+    def test_replaced_criteria_graph_is_serialised_again(self):
+        result = EvaluationResult()
+        result.add_criteria_graph("a", CountingGraph("a"))
+        result.add_criteria_graph("b", CountingGraph("b"))
+        assert result["criteria_graphs"] == {"a": "json a", "b": "json b"}
+        result.add_criteria_graph("a", CountingGraph("c"))
+        assert list(result["criteria_graphs_vis"].items()) == [("a", "mermaid c"), ("b", "mermaid b")]
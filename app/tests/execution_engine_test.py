@@ -0,0 +1,52 @@
+import pytest
+
+from ..execution_engine import ExecutionEngine, WorkerTimeoutError, WorkerError
+from ..evaluation import evaluation_function
+from ..preview import preview_function
+
+
+@pytest.fixture(scope="module")
+def engine():
+    engine = ExecutionEngine(workers=1, timeout=60)
+    yield engine
+    engine.close()
+
+
+class TestExecutionEngine():
+
+    @pytest.mark.parametrize(
+        "response, answer, params",
+        [
+            ("2x", "2*x", {"strict_syntax": False}),
+            ("sin(x)+2", "sin(x)", {"strict_syntax": False, "elementary_functions": True}),
+            ("1.24 mile/hour", "1.24 mile/hour", {"strict_syntax": False, "physical_quantity": True}),
+        ]
+    )
+    def test_results_match_evaluation_function(self, engine, response, answer, params):
+        expected = evaluation_function(response, answer, dict(params))
+        assert engine.evaluate(response, answer, dict(params)) == expected
+
+    def test_preview(self, engine):
+        params = {"strict_syntax": False}
+        assert engine.preview("x^2", dict(params)) == preview_function("x^2", dict(params))
+
+    def test_timeout_replaces_worker(self, engine):
+        pids = engine.worker_pids()
+        with pytest.raises(WorkerTimeoutError):
+            engine.evaluate("sin(x)**2+cos(x)**2", "1", {"strict_syntax": False, "elementary_functions": True}, timeout=0.001)
+        assert engine.worker_pids() != pids
+        result = engine.evaluate("2x", "2*x", {"strict_syntax": False})
+        assert result["is_correct"] is True
+
+    def test_errors_in_worker_are_reported(self, engine):
+        with pytest.raises(WorkerError):
+            engine.call("evaluation_function", "x", "x")
+        result = engine.evaluate("2x", "2*x", {"strict_syntax": False})
+        assert result["is_correct"] is True
+
+    def test_workers_are_recycled(self):
+        with ExecutionEngine(workers=1, max_tasks_per_worker=1) as engine:
+            pids = engine.worker_pids()
+            engine.evaluate("x", "x", {"strict_syntax": False})
+            assert engine.worker_pids() != pids
+
@@ -1,21 +1,34 @@
+import random
+from copy import deepcopy
+
 import pytest
 from sympy import Symbol, sqrt, sin as sympy_sin
 
 from ..utility.expression_utilities import (
+    canonical_form,
+    canonical_form_cache,
     compute_relative_tolerance_from_significant_decimals,
     convert_absolute_notation,
     convert_bracket_notation,
     convert_unicode_dashes,
     create_expression_set,
+    create_sympy_parsing_params,
     extract_latex,
     find_matching_parenthesis,
+    freeze_parsing_params,
     has_matching_brackets,
     is_multiple_answers_wrapper,
     latex_symbols,
+    override_parsing_params,
+    parse_cache,
+    parse_expression,
+    parsing_params_fingerprint,
     preprocess_expression,
     protect_elementary_functions_substitutions,
     substitute,
     substitute_input_symbols,
+    input_symbols_substitutions_cache,
+    substitution_trie_cache,
     substitutions_sort_key,
     sympy_symbols,
     sympy_to_latex,
@@ -155,6 +168,30 @@ class TestSubstituteInputSymbols:
         result = substitute_input_symbols(["x", "y"], {})
         assert result == ["x", "y"]
 
+    def test_substitution_table_is_reused(self):
+        params = {"elementary_functions": True, "symbols": {"x_table_test": {"latex": r"\(x\)", "aliases": ["xt"]}}}
+        assert substitute_input_symbols(["sin(xt)"], deepcopy(params)) == ["sin(x_table_test)"]
+        hits = input_symbols_substitutions_cache.hits
+        first = substitute_input_symbols(["arcsin(xt)*alpha"], deepcopy(params))
+        second = substitute_input_symbols(["xt+exp(xt)"], deepcopy(params))
+        assert input_symbols_substitutions_cache.hits == hits+2
+        assert first == ["asin(x_table_test)* alpha"]
+        assert second == ["x_table_test+ exp(x_table_test)"]
+
+    def test_substitution_table_depends_on_symbols(self):
+        params = {"symbols": {"x": {"latex": r"\(x\)", "aliases": ["a"]}}}
+        assert substitute_input_symbols(["a"], params) == ["x"]
+        params = {"symbols": {"y": {"latex": r"\(y\)", "aliases": ["a"]}}}
+        assert substitute_input_symbols(["a"], params) == ["y"]
+        params = {"symbols": {"y": {"latex": r"\(y\)", "aliases": ["a"]}}, "elementary_functions": True}
+        assert substitute_input_symbols(["a*sin(a)"], params) == ["y* sin(y)"]
+
+    def test_symbols_are_cleaned_when_table_is_cached(self):
+        for _ in range(2):
+            params = {"symbols": {"lambda": {"latex": r"\(\lambda\)", "aliases": ["L", ""]}, "": {"latex": "", "aliases": []}}}
+            assert substitute_input_symbols(["L"], params) == ["lamda"]
+            assert params["symbols"] == {"lamda": {"latex": r"\(\lambda\)", "aliases": ["L", "lambda"]}}
+
 
 class TestFindMatchingParenthesis:
 
@@ -480,4 +517,233 @@ class TestPreprocessExpression:
         assert success is False
         assert result == expr
         assert feedback is not None
-        assert feedback[0] == "BRACKET_NOTATION_MISMATCH"
\ No newline at end of file
+        assert feedback[0] == "BRACKET_NOTATION_MISMATCH"
+
+
+class TestFrozenParsingParameters:
+
+    def parsing_params(self):
+        params = {
+            "complexNumbers": False,
+            "elementary_functions": False,
+            "convention": "equal_precedence",
+            "strict_syntax": False,
+            "symbol_assumptions": "('k','constant')",
+        }
+        return create_sympy_parsing_params(params)
+
+    def test_frozen_parameters_cannot_be_changed(self):
+        frozen = freeze_parsing_params(self.parsing_params())
+        with pytest.raises(TypeError):
+            frozen["simplify"] = True
+        assert frozen["constants"] == {"k"}
+        assert isinstance(frozen["constants"], frozenset)
+
+    def test_nested_values_cannot_be_changed(self):
+        parsing_params = self.parsing_params()
+        frozen = freeze_parsing_params(parsing_params)
+        fingerprint = parsing_params_fingerprint(frozen)
+        with pytest.raises(TypeError):
+            frozen["symbol_dict"]["x"] = Symbol("x", positive=True)
+        with pytest.raises(TypeError):
+            frozen["symbol_dict"].update({"x": Symbol("x", positive=True)})
+        with pytest.raises(TypeError):
+            frozen["unsplittable_symbols"].append("xy")
+        assert frozen["unsplittable_symbols"]+["xy"] == parsing_params["unsplittable_symbols"]+["xy"]
+        parsing_params["symbol_dict"].update({"x": Symbol("x", positive=True)})
+        assert "x" not in frozen["symbol_dict"]
+        assert parsing_params_fingerprint(frozen) == fingerprint
+        assert parsing_params_fingerprint(frozen) == parsing_params_fingerprint(self.parsing_params())
+        assert deepcopy(frozen) is frozen
+        overridden = frozen.override(symbol_dict={"y": Symbol("y")})
+        with pytest.raises(TypeError):
+            overridden["symbol_dict"]["x"] = Symbol("x")
+
+    def test_override_shares_unchanged_values(self):
+        frozen = freeze_parsing_params(self.parsing_params())
+        overridden = frozen.override(simplify=True)
+        assert overridden["simplify"] is True
+        assert frozen["simplify"] is False
+        assert overridden["symbol_dict"] is frozen["symbol_dict"]
+
+    def test_override_accepts_dictionary(self):
+        parsing_params = self.parsing_params()
+        overridden = override_parsing_params(parsing_params, evaluate=False)
+        assert overridden["evaluate"] is False
+        assert "evaluate" not in parsing_params
+
+    def test_parsing_with_frozen_parameters(self):
+        parsing_params = self.parsing_params()
+        frozen = freeze_parsing_params(parsing_params)
+        assert parse_expression("2x+lambda", frozen) == parse_expression("2x+lambda", parsing_params)
+        assert parse_expression("x+x", frozen.override(simplify=True)) == 2*Symbol("x")
+
+
+class TestParseCache:
+
+    def parsing_params(self, **changes):
+        params = {
+            "complexNumbers": False,
+            "elementary_functions": False,
+            "convention": "equal_precedence",
+            "strict_syntax": False,
+        }
+        params.update(changes)
+        return create_sympy_parsing_params(params)
+
+    def test_repeated_parse_is_a_hit(self):
+        parsing_params = freeze_parsing_params(self.parsing_params())
+        expr = parse_expression("2x+3y+unique_cache_test_symbol", parsing_params)
+        hits = parse_cache.hits
+        assert parse_expression("2x+3y+unique_cache_test_symbol", parsing_params) is expr
+        assert parse_cache.hits == hits+1
+
+    def test_fingerprint_depends_on_parameters(self):
+        parsing_params = self.parsing_params()
+        assert parsing_params_fingerprint(parsing_params) == parsing_params_fingerprint(self.parsing_params())
+        assert parsing_params_fingerprint(parsing_params) == parsing_params_fingerprint(freeze_parsing_params(parsing_params))
+        different_parameters = [
+            self.parsing_params(strict_syntax=True),
+            self.parsing_params(elementary_functions=True),
+            self.parsing_params(symbol_assumptions="('x','positive')"),
+            override_parsing_params(parsing_params, simplify=True),
+            override_parsing_params(parsing_params, rationalise=False),
+        ]
+        for other in different_parameters:
+            assert parsing_params_fingerprint(parsing_params) != parsing_params_fingerprint(other)
+
+    def test_callables_are_compared_by_identity(self):
+        def identity(tokens, local_dict, global_dict):
+            return tokens
+        transformations = [(identity,), (lambda tokens, local_dict, global_dict: tokens,), (lambda tokens, local_dict, global_dict: tokens,)]
+        parsing_params = [override_parsing_params(self.parsing_params(), extra_transformations=t) for t in transformations]
+        assert all("0x" not in parsing_params_fingerprint(p) for p in parsing_params)
+        assert parsing_params_fingerprint(parsing_params[1]) == parsing_params_fingerprint(parsing_params[2])
+        for p in parsing_params:
+            misses = parse_cache.misses
+            parse_expression("x+unique_callable_cache_test_symbol", p)
+            assert parse_cache.misses == misses+1
+        hits = parse_cache.hits
+        parse_expression("x+unique_callable_cache_test_symbol", override_parsing_params(self.parsing_params(), extra_transformations=(identity,)))
+        assert parse_cache.hits == hits+1
+
+    def test_assumptions_are_respected(self):
+        x = parse_expression("x", self.parsing_params())
+        positive_x = parse_expression("x", self.parsing_params(symbol_assumptions="('x','positive')"))
+        assert x.is_positive is None
+        assert positive_x.is_positive is True
+
+    def test_sets_are_copied(self):
+        parsing_params = freeze_parsing_params(self.parsing_params())
+        first = parse_expression("x plus_minus 1", parsing_params)
+        assert isinstance(first, set) and len(first) == 2
+        first.clear()
+        assert len(parse_expression("x plus_minus 1", parsing_params)) == 2
+
+
+class TestCanonicalForm:
+
+    def test_same_result_as_simplification(self):
+        x = Symbol("x")
+        expr = (x**2-1)/(x-1)-x-1+sympy_sin(x)**2
+        assert canonical_form(expr) == expr.cancel().simplify().simplify()
+        assert canonical_form(expr, simplifications=1) == expr.cancel().simplify()
+        assert canonical_form(expr, cancel=False, simplifications=1) == expr.simplify()
+
+    def test_repeated_canonicalisation_is_a_hit(self):
+        x = Symbol("x_canonical_form_test")
+        canonical_form((x+1)**2-x**2-2*x)
+        hits = canonical_form_cache.hits
+        assert canonical_form((x+1)**2-x**2-2*x) == 1
+        assert canonical_form_cache.hits == hits+1
+
+    def test_assumptions_are_part_of_the_key(self):
+        x = Symbol("x")
+        positive_x = Symbol("x", positive=True)
+        assert canonical_form(sqrt(x**2)-x) != 0
+        assert canonical_form(sqrt(positive_x**2)-positive_x) == 0
+
+
+def substitute_by_scanning(string, substitutions):
+    # Reference implementation, tries every substitution at every position
+    if isinstance(string, str):
+        string = [string]
+    new_string = []
+    for part in string:
+        index = 0
+        string_buffer = ""
+        while index < len(part):
+            matched_start = False
+            for k, pair in enumerate(substitutions):
+                if isinstance(pair[0], tuple):
+                    match = any(part.startswith(pair[0][0]+look_ahead, index) for look_ahead in pair[0][1])
+                    substitution_length = len(pair[0][0])
+                else:
+                    match = part.startswith(pair[0], index)
+                    substitution_length = len(pair[0])
+                if match:
+                    matched_start = True
+                    if len(string_buffer) > 0:
+                        new_string.append(string_buffer)
+                        string_buffer = ""
+                    new_string.append(pair[1])
+                    index += substitution_length
+                    break
+            if not matched_start:
+                string_buffer += part[index]
+                index += 1
+        if len(string_buffer) > 0:
+            new_string.append(string_buffer)
+    return "".join(new_string)
+
+
+class TestSubstitute:
+
+    @pytest.mark.parametrize(
+        "string, substitutions, expected",
+        [
+            ("abc bc c", [("abc", "p"), ("bc", "q"), ("c", "r")], "p q r"),
+            ("p bc c", [("p", "abc"), ("bc", "q"), ("c", "r")], "abc q r"),
+            ("ab ac", [(("a", ("b",)), "X")], "Xb ac"),
+            ("ab ac", [(("a", ("b", "c")), "X"), ("ac", "Y")], "Xb Xc"),
+            ("ab ac", [("ac", "Y"), (("a", ("b", "c")), "X")], "Xb Y"),
+            (["ab", "ba"], [("a", "x")], "xbbx"),
+            ("", [("a", "x")], ""),
+        ]
+    )
+    def test_substitute(self, string, substitutions, expected):
+        assert substitute(string, substitutions) == expected
+
+    def test_first_substitution_in_the_list_is_used(self):
+        # When several substitutions match at the same position the one that comes first wins,
+        # even if it is shorter than the others
+        assert substitute("sinh(x)", [("sin", "A"), ("sinh", "B")]) == "Ah(x)"
+        assert substitute("sinh(x)", [("sinh", "B"), ("sin", "A")]) == "B(x)"
+
+    def test_same_result_as_scanning(self):
+        generator = random.Random(0)
+        alphabet = "ab c"
+        for _ in range(2000):
+            substitutions = []
+            for _ in range(generator.randint(1, 6)):
+                left = "".join(generator.choice(alphabet) for _ in range(generator.randint(1, 3)))
+                if generator.random() < 0.3:
+                    look_aheads = tuple("".join(generator.choice(alphabet) for _ in range(generator.randint(0, 2))) for _ in range(2))
+                    left = (left, look_aheads)
+                substitutions.append((left, "".join(generator.choice("XY") for _ in range(generator.randint(0, 2)))))
+            string = "".join(generator.choice(alphabet) for _ in range(generator.randint(0, 30)))
+            assert substitute(string, substitutions) == substitute_by_scanning(string, substitutions)
+
+    def test_same_result_as_scanning_for_elementary_functions(self):
+        expr = "arcsin(x)+sinh(y)*cosec(alpha)-ln(β)+exp(asin(z))/cotan(theta)"
+        substitutions = protect_elementary_functions_substitutions(expr)+transform_unicode_greek_symbols(expr)
+        substitutions.sort(key=substitutions_sort_key)
+        assert substitute(expr, substitutions) == substitute_by_scanning(expr, substitutions)
+
+    def test_trie_is_reused(self):
+        substitutions = [("trie_reuse_test", "x")]
+        substitute("trie_reuse_test", substitutions)
+        hits = substitution_trie_cache.hits
+        assert substitute("a trie_reuse_test", substitutions) == "a x"
+        assert substitution_trie_cache.hits == hits+1
+
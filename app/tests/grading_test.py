@@ -0,0 +1,100 @@
+import io
+import json
+import threading
+import time
+
+import pytest
+
+from ..grading import grade_stream, main
+from ..evaluation import evaluation_function
+
+
+def requests_as_lines(requests):
+    return [json.dumps(request) for request in requests]
+
+
+class TestGrading():
+
+    requests = [
+        {"request_id": "a", "response": "2x", "answer": "2*x", "params": {"strict_syntax": False}},
+        {"request_id": "b", "response": "x+1", "answer": "x", "params": {"strict_syntax": False}},
+        {"request_id": "c", "response": "1.24 mile/hour", "answer": "1.24 mile/hour", "params": {"physical_quantity": True}},
+    ]
+
+    def test_results_match_evaluation_function(self):
+        output = io.StringIO()
+        count = grade_stream(requests_as_lines(self.requests), output, evaluation_function)
+        records = [json.loads(line) for line in output.getvalue().splitlines()]
+        assert count == 3
+        assert [record["request_id"] for record in records] == ["a", "b", "c"]
+        for (request, record) in zip(self.requests, records):
+            assert record["error"] is None
+            assert record["time_ms"] >= 0
+            assert record["result"] == evaluation_function(request["response"], request["answer"], request["params"])
+
+    def test_output_is_in_input_order(self):
+        def evaluate(response, answer, params, include_test_data):
+            time.sleep(float(response))
+            return response
+
+        lines = requests_as_lines([{"response": str(delay), "answer": ""} for delay in [0.2, 0.0, 0.1, 0.0]])
+        output = io.StringIO()
+        grade_stream(lines, output, evaluate, workers=4)
+        records = [json.loads(line) for line in output.getvalue().splitlines()]
+        assert [record["result"] for record in records] == ["0.2", "0.0", "0.1", "0.0"]
+        assert [record["line"] for record in records] == [1, 2, 3, 4]
+
+    def test_errors_are_captured(self):
+        lines = [
+            "not json",
+            json.dumps({"answer": "x"}),
+            "",
+            json.dumps({"response": "x", "answer": "x", "params": {"criteria": "response ?? answer"}}),
+            json.dumps({"response": "x", "answer": "x"}),
+        ]
+        output = io.StringIO()
+        count = grade_stream(lines, output, evaluation_function)
+        records = [json.loads(line) for line in output.getvalue().splitlines()]
+        assert count == 4
+        assert [record["line"] for record in records] == [1, 2, 4, 5]
+        assert all(record["error"] is not None for record in records[0:3])
+        assert records[1]["error"]["message"] == "Field `response` is missing."
+        assert records[3]["error"] is None
+        assert records[3]["result"]["is_correct"] is True
+
+    def test_command_line_with_worker_processes(self, tmp_path):
+        input_path = tmp_path / "requests.jsonl"
+        output_path = tmp_path / "results.jsonl"
+        input_path.write_text("\n".join(requests_as_lines(self.requests)))
+        main([str(input_path), "--output", str(output_path), "--workers", "2"])
+        records = [json.loads(line) for line in output_path.read_text().splitlines()]
+        assert [record["request_id"] for record in records] == ["a", "b", "c"]
+        assert [record["result"]["is_correct"] for record in records] == [True, False, True]
+
+    def test_without_workers_records_are_graded_in_calling_thread(self):
+        threads = []
+
+        def evaluate(response, answer, params, include_test_data):
+            threads.append(threading.current_thread())
+            return response
+
+        output = io.StringIO()
+        grade_stream(requests_as_lines(self.requests), output, evaluate, workers=0)
+        records = [json.loads(line) for line in output.getvalue().splitlines()]
+        assert [record["request_id"] for record in records] == ["a", "b", "c"]
+        assert threads == [threading.current_thread()]*3
+
+    def test_command_line_in_process(self, tmp_path):
+        input_path = tmp_path / "requests.jsonl"
+        output_path = tmp_path / "results.jsonl"
+        input_path.write_text("\n".join(requests_as_lines(self.requests)))
+        main([str(input_path), "--output", str(output_path), "--workers", "0"])
+        records = [json.loads(line) for line in output_path.read_text().splitlines()]
+        assert [record["result"]["is_correct"] for record in records] == [True, False, True]
+
+    def test_timeout_cannot_be_used_in_process(self, tmp_path, capsys):
+        input_path = tmp_path / "requests.jsonl"
+        input_path.write_text("\n".join(requests_as_lines(self.requests)))
+        with pytest.raises(SystemExit):
+            main([str(input_path), "--workers", "0", "--timeout", "5"])
+        assert "--timeout cannot be used with --workers 0" in capsys.readouterr().err
@@ -0,0 +1,102 @@
+import pytest
+
+from sympy import Symbol, Function, sqrt, sin, cos, exp, log, Abs, I, Equality, Integer
+
+from ..utility.numerical_comparison_utilities import numeric_probe
+from ..evaluation import evaluation_function
+from ..context import symbolic
+
+x = Symbol("x")
+y = Symbol("y")
+p = Symbol("p", positive=True)
+n = Symbol("n", integer=True)
+
+
+class TestNumericProbe():
+
+    @pytest.mark.parametrize(
+        "lhs, rhs",
+        [
+            (sin(x)**2+cos(x)**2, Integer(1)),
+            ((x**2-1)/(x-1), x+1),
+            (exp(x+y), exp(x)*exp(y)),
+            (sqrt(p**2), p),
+            ((-1)**(2*n), Integer(1)),
+            (x*I+y, y+I*x),
+        ]
+    )
+    def test_probe_finds_match(self, lhs, rhs):
+        assert numeric_probe(lhs, rhs) is True
+
+    @pytest.mark.parametrize(
+        "lhs, rhs",
+        [
+            (sin(x)+2, sin(x)),
+            (x*y, x+y),
+            (log(x*y), log(x)+2*log(y)),
+            (Abs(x), x+1),
+        ]
+    )
+    def test_probe_finds_mismatch(self, lhs, rhs):
+        assert numeric_probe(lhs, rhs) is False
+
+    @pytest.mark.parametrize(
+        "lhs, rhs",
+        [
+            (Function("f")(x), Function("f")(x)+1),
+            (Equality(x, 1), Equality(x, 2)),
+            (Symbol("a", commutative=False)*x, x),
+            (1/(x-x), Integer(1)),
+        ]
+    )
+    def test_probe_is_inconclusive(self, lhs, rhs):
+        assert numeric_probe(lhs, rhs) is None
+
+    def test_probe_uses_assumptions(self):
+        # sqrt(x**2) = x only holds for nonnegative x
+        assert numeric_probe(sqrt(x**2), x) is False
+        assert numeric_probe(sqrt(p**2), p) is True
+
+    def test_probe_with_complex_points(self):
+        # x*conjugate(x) = x**2 only holds when x is real
+        assert numeric_probe(x*x.conjugate(), x**2) is True
+        assert numeric_probe(x*x.conjugate(), x**2, complex_numbers=True) is False
+
+    @pytest.mark.parametrize(
+        "response, answer, path",
+        [
+            ("sin(x)+2", "sin(x)", "NUMERIC_PROBE_MISMATCH"),
+            ("cos(x)**2+sin(x)**2", "1", "NUMERIC_PROBE_MATCH_SYMBOLIC_CONFIRMATION"),
+            ("3.14", "pi", "NUMERIC_PROBE_MISMATCH"),
+        ]
+    )
+    def test_probe_path_is_reported_in_test_data(self, response, answer, path):
+        params = {"strict_syntax": False, "elementary_functions": True}
+        result = evaluation_function(response, answer, params, include_test_data=True)
+        assert "response = answer_DECIDED_BY_"+path in result["test_data_tags"]
+
+    def test_probe_match_does_not_try_all_simplifications(self, monkeypatch):
+        comparisons = []
+
+        def failing_comparison(comparison_symbol, expression):
+            comparisons.append(expression)
+            return False
+
+        monkeypatch.setattr(symbolic, "do_comparison", failing_comparison)
+        params = {"strict_syntax": False, "elementary_functions": True}
+        result = evaluation_function("cos(x)**2+sin(x)**2", "1", params, include_test_data=True)
+        assert result["is_correct"] is False
+        assert len(comparisons) == 2
+        assert "response = answer_DECIDED_BY_NUMERIC_PROBE_MATCH_NOT_CONFIRMED" in result["test_data_tags"]
+
+    def test_probe_can_be_disabled(self):
+        params = {"strict_syntax": False, "elementary_functions": True, "numeric_probe": False}
+        result = evaluation_function("sin(x)+2", "sin(x)", params, include_test_data=True)
+        assert result["is_correct"] is False
+        assert "response = answer_DECIDED_BY_SYMBOLIC" in result["test_data_tags"]
+
+    def test_tolerance_is_applied_after_probe_mismatch(self):
+        params = {"strict_syntax": False, "elementary_functions": True, "rtol": 0.01}
+        result = evaluation_function("3.14", "pi", params, include_test_data=True)
+        assert result["is_correct"] is True
+        assert "response = answer_DECIDED_BY_TOLERANCE" in result["test_data_tags"]
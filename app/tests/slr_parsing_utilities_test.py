@@ -0,0 +1,397 @@
+import json
+import os
+import re
+import subprocess
+import sys
+from copy import deepcopy
+
+import pytest
+
+from ..context.physical_quantity import default_parameters as quantity_default_parameters
+from ..context.physical_quantity import generate_criteria_parser as generate_quantity_criteria_parser
+from ..utility.criteria_parsing import base_token_list, generate_criteria_parser
+from ..utility.physical_quantity_utilities import SLR_quantity_parser
+from ..build_slr_tables import build_tables, default_parsers, reserved_expressions
+from ..utility.slr_parsing_utilities import (
+    SLR_expression_parser,
+    Token,
+    catch_undefined,
+    grammar_hash,
+    group,
+    load_persisted_tables,
+    save_persisted_tables,
+    set_persisted_tables,
+    slr_tables_version,
+)
+
+
+def scan_by_matching_each_pattern(parser, expr, mode="expression"):
+    # Reference implementation, matches every token pattern separately at each position
+    token_list = parser.token_list
+    tokens = []
+    token_catch_undefined = [x for x in token_list if len(x) > 2 and x[2] == catch_undefined]
+    token_catch_undefined = token_catch_undefined[0] if len(token_catch_undefined) > 0 else None
+    if "expression" in mode:
+        token_rules = [x for x in token_list if len(x) > 2 and x[2] not in {None, catch_undefined}]
+        token_symbols = [x for x in token_list if len(x) == 2]
+    else:
+        token_rules = []
+        token_symbols = [(x[0], x[1]) for x in token_list]
+    index = 0
+    string = ""
+    while index-len(string) < len(expr):
+        end_token = None
+        end_token_length = 0
+        content = ""
+        label = None
+        for (re_content, current_label) in token_symbols:
+            match_content = re.match(re_content, expr[index:])
+            if match_content is not None and len(match_content.group()) > end_token_length:
+                content = match_content.group()
+                end_token_length = len(content)
+                label = current_label
+        for token in token_rules:
+            match_rule, match_content = token[2](expr[index:])
+            if match_rule is not None and len(match_rule) > end_token_length:
+                content = match_content
+                end_token_length = len(match_rule)
+                label = token[1]
+        if label is None:
+            string = string+expr[index]
+            index += 1
+        else:
+            end_token = Token(label, content, expr, index, index+end_token_length-1)
+        if len(string) > 0 and (end_token is not None or index >= len(expr)):
+            if token_catch_undefined is None:
+                raise Exception(f"Undefined input: {string}")
+            tokens.append(token_catch_undefined[2](token_catch_undefined[1], string, expr, index-len(string), index-1))
+            string = ""
+        if end_token is not None:
+            tokens.append(end_token)
+            index += end_token_length
+    return tokens
+
+
+def reference_parsing_table(parser):
+    # Reference implementation of the grammar analysis, uses lists for FIRST, FOLLOW and item sets
+    productions_token = parser.productions_token
+    terminals_token = parser.terminals_token
+    non_terminals_token = parser.non_terminals_token
+    start_token, end_token, null_token = parser.start_token, parser.end_token, parser.null_token
+
+    first_dict = {**{x: [x] for x in terminals_token}, **{x: [] for x in non_terminals_token}}
+    lengths = [-1]*len(non_terminals_token)
+    any_first_changed = True
+    while any_first_changed:
+        any_first_changed = False
+        for k, x in enumerate(non_terminals_token):
+            if lengths[k] != len(first_dict[x]):
+                lengths[k] = len(first_dict[x])
+                any_first_changed = True
+        for nt in non_terminals_token:
+            for prod in [x[1] for x in productions_token if x[0] == nt]:
+                for token in prod:
+                    for x in first_dict[token]:
+                        if x not in first_dict[nt]:
+                            first_dict[nt].append(x)
+                    if null_token not in first_dict[token]:
+                        break
+
+    def first(tokens):
+        if len(tokens) == 1:
+            return first_dict[tokens[0]]
+        fs = []
+        for token in tokens:
+            for item in first_dict[token]:
+                if item not in fs and item != null_token:
+                    fs.append(item)
+            if token != null_token:
+                break
+        return fs
+
+    follow = {x: [] for x in non_terminals_token}
+    follow[start_token].append(end_token)
+    lengths = [-1]*len(non_terminals_token)
+    while lengths != [len(follow[x]) for x in non_terminals_token]:
+        lengths = [len(follow[x]) for x in non_terminals_token]
+        for (head, body) in productions_token:
+            for k, token in enumerate(body):
+                if token in non_terminals_token:
+                    if null_token in first(body[k+1:]) or len(body[k+1:]) == 0:
+                        for item in follow[head]:
+                            if item not in follow[token]:
+                                follow[token].append(item)
+                    for item in first(body[k+1:]):
+                        if item != null_token and item not in follow[token]:
+                            follow[token].append(item)
+
+    def closure(item_set):
+        closure_set = []
+        new_items = item_set
+        added_to_closure = [False]*len(non_terminals_token)
+        while len(new_items) > 0:
+            closure_set += new_items
+            new_items = []
+            for (i, j) in closure_set:
+                if j < len(productions_token[i][1]) and productions_token[i][1][j] in non_terminals_token:
+                    k = non_terminals_token.index(productions_token[i][1][j])
+                    if not added_to_closure[k]:
+                        new_items += [(m, 0) for m, production in enumerate(productions_token) if production[0] == non_terminals_token[k]]
+                        added_to_closure[k] = True
+        return closure_set
+
+    def compute_transitions(item_set):
+        transitions = []
+        for (i, j) in item_set:
+            if j < len(productions_token[i][1]):
+                token = productions_token[i][1][j]
+                if token not in [x[0] for x in transitions]:
+                    transitions.append((token, [(i, j+1)]))
+                else:
+                    transitions[[x[0] for x in transitions].index(token)][1].append((i, j+1))
+        return transitions
+
+    start_productions = tuple([(k, 0) for k in range(0, len(productions_token)) if productions_token[k][0] == start_token])
+    states = {start_productions: closure(start_productions)}
+    transitions = {}
+    new_states = [start_productions]
+    while len(new_states) > 0:
+        state = new_states.pop(0)
+        transitions[state] = compute_transitions(closure(list(state)))
+        for t in transitions[state]:
+            if tuple(t[1]) not in states.keys():
+                states[tuple(t[1])] = closure(t[1])
+                new_states.append(tuple(t[1]))
+    states_index = {s: i for i, s in enumerate(states)}
+    symbols = terminals_token+non_terminals_token
+
+    parsing_table = [[[] for _ in symbols] for _ in states]
+    for state in states:
+        for (production_index, dot_index) in closure(state):
+            (head, body) = productions_token[production_index]
+            row = parsing_table[states_index[state]]
+            if dot_index < len(body):
+                for (symbol, next_state) in transitions[state]:
+                    if symbol == body[dot_index]:
+                        row[symbols.index(body[dot_index])].append((production_index, states_index[tuple(next_state)]))
+                        break
+            elif head == start_token:
+                row[symbols.index(end_token)].append((production_index, len(states)))
+            else:
+                for a in follow[head]:
+                    row[symbols.index(a)].append((production_index, len(states)+production_index))
+
+    kernels = list(states)
+    for i in range(0, len(states)):
+        for j in range(0, len(symbols)):
+            table_entry = parsing_table[i][j]
+            if len(table_entry) == 0:
+                items_token = [(productions_token[x[0]][1][0:x[1]], productions_token[x[0]][1][x[1]:]) for x in kernels[i]]
+                parsing_table[i][j] = -1
+                for (index, condition) in enumerate([x[0] for x in parser.error_handler], 2):
+                    if condition(items_token, symbols[j]):
+                        parsing_table[i][j] = -index
+                        break
+            else:
+                precedence = table_entry[0][0]
+                index = 0
+                for k, action in enumerate(table_entry[1:], 1):
+                    if precedence < action[0]:
+                        precedence = action[0]
+                        index = k
+                parsing_table[i][j] = table_entry[index][1]
+    return kernels, states, parsing_table
+
+
+def token_summary(tokens):
+    return [(token.label, token.content, token.start, token.end) for token in tokens]
+
+
+reserved_expressions = {"learner": {"response": None}, "task": {"answer": None}}
+
+
+class TestScan:
+
+    @pytest.mark.parametrize(
+        "expr",
+        [
+            "response = answer",
+            "response=answer where x = 1; y = 2",
+            "response >= answer",
+            "response <answer",
+            "response written as answer",
+            "response contains x**2",
+            "2*response proportional to answer",
+            "  response   =   answer  ",
+            "x_response_2 = answeranswer",
+            "",
+        ]
+    )
+    def test_criteria_parser(self, expr):
+        parser = generate_criteria_parser(reserved_expressions)
+        assert token_summary(parser.scan(expr)) == token_summary(scan_by_matching_each_pattern(parser, expr))
+
+    @pytest.mark.parametrize(
+        "expr",
+        [
+            "response matches answer",
+            "dimension(response) matches dimension(answer)",
+            "response <= answer",
+            "(response) >= 10 m",
+        ]
+    )
+    def test_quantity_criteria_parser(self, expr):
+        parser = generate_quantity_criteria_parser(reserved_expressions)
+        assert token_summary(parser.scan(expr)) == token_summary(scan_by_matching_each_pattern(parser, expr))
+
+    @pytest.mark.parametrize("strictness", ["strict", "natural"])
+    @pytest.mark.parametrize(
+        "expr",
+        [
+            "10 m",
+            "-1.5e-3 kilometre/hour^2",
+            "(x+y) kg*m**2/s^2",
+            "2 mile per hour",
+            "q",
+            "10 N m",
+        ]
+    )
+    def test_quantity_parser(self, strictness, expr):
+        parameters = deepcopy(quantity_default_parameters)
+        parameters["strictness"] = strictness
+        parser = SLR_quantity_parser(parameters)
+        assert token_summary(parser.scan(expr)) == token_summary(scan_by_matching_each_pattern(parser, expr))
+
+    def test_expression_parser(self):
+        parser = SLR_expression_parser(
+            infix_operators=[("+", "PLUS"), ("*", "TIMES"), ("^", "POWER")],
+            delimiters=[(("(", ")"), lambda production, output, tag_handler: output)],
+        )
+        for expr in ["a+b*c", "(a + b)^2", "a^b*c", "(((a)))"]:
+            assert token_summary(parser.scan(expr)) == token_summary(scan_by_matching_each_pattern(parser, expr))
+
+    def test_productions_are_scanned_in_bnf_mode(self):
+        parser = generate_criteria_parser(reserved_expressions)
+        for production in ["EQUAL where EQUAL_LIST", "RESERVED written as OTHER", "OTHER ORDER RESERVED"]:
+            assert token_summary(parser.scan(production, mode="bnf")) == token_summary(scan_by_matching_each_pattern(parser, production, mode="bnf"))
+
+    def test_longest_match_is_used(self):
+        parser = generate_criteria_parser(reserved_expressions)
+        assert [token.label for token in parser.scan("x>=y")] == ["OTHER", "ORDER", "OTHER"]
+        assert [token.content for token in parser.scan("x>=y")] == ["x", ">=", "y"]
+
+    def test_criteria_parser_does_not_change_base_token_list(self):
+        base_tokens = list(base_token_list)
+        generate_criteria_parser({"learner": {"response_for_token_list_test": None}})
+        assert base_token_list == base_tokens
+
+
+class TestGrammarAnalysis:
+
+    @pytest.mark.parametrize(
+        "create_parser",
+        [
+            lambda: generate_criteria_parser(reserved_expressions),
+            lambda: generate_quantity_criteria_parser(reserved_expressions),
+            lambda: SLR_quantity_parser({**deepcopy(quantity_default_parameters), "strictness": "strict"}),
+            lambda: SLR_quantity_parser({**deepcopy(quantity_default_parameters), "strictness": "natural"}),
+            lambda: SLR_expression_parser(
+                infix_operators=[("+", "PLUS"), ("*", "TIMES"), ("^", "POWER")],
+                delimiters=[(("(", ")"), group(1))],
+            ),
+        ]
+    )
+    def test_same_tables_as_reference(self, create_parser):
+        parser = create_parser()
+        kernels, states, parsing_table = reference_parsing_table(parser)
+        assert list(parser.states.keys()) == kernels
+        assert list(parser.states.values()) == list(states.values())
+        assert parser.parsing_table == parsing_table
+
+
+def token_data(token):
+    return (token.label, token.content, token.original, token.start, token.end)
+
+
+class TestPersistedTables:
+
+    @pytest.fixture(autouse=True)
+    def reset_persisted_tables(self):
+        set_persisted_tables(dict())
+        yield
+        set_persisted_tables(None)
+
+    def test_loaded_tables_are_identical_to_computed_tables(self, tmp_path):
+        path = str(tmp_path / "slr_tables.json")
+        computed_parsers = default_parsers()
+        assert not any(parser.persisted_tables_used for parser in computed_parsers)
+        save_persisted_tables(computed_parsers, path)
+        set_persisted_tables(load_persisted_tables(path))
+        loaded_parsers = default_parsers()
+        for (computed, loaded) in zip(computed_parsers, loaded_parsers):
+            assert loaded.persisted_tables_used
+            assert loaded.parsing_table == computed.parsing_table
+            assert list(loaded.states.items()) == list(computed.states.items())
+            assert [(token_data(head), [token_data(x) for x in body]) for (head, body) in loaded.productions_token]\
+                == [(token_data(head), [token_data(x) for x in body]) for (head, body) in computed.productions_token]
+            assert {k: [(token_data(t), items) for (t, items) in v] for (k, v) in loaded.transitions.items()}\
+                == {k: [(token_data(t), items) for (t, items) in v] for (k, v) in computed.transitions.items()}
+            assert loaded.tables_data() == computed.tables_data()
+
+    def test_parsing_with_loaded_tables(self, tmp_path):
+        path = str(tmp_path / "slr_tables.json")
+        build_tables(path)
+        set_persisted_tables(load_persisted_tables(path))
+        parser = generate_criteria_parser(reserved_expressions)
+        assert parser.persisted_tables_used
+        tree = parser.parse(parser.scan("response = q+p where q = a*b; p = b*c"))
+        set_persisted_tables(dict())
+        reference_parser = generate_criteria_parser(reserved_expressions)
+        reference_tree = reference_parser.parse(reference_parser.scan("response = q+p where q = a*b; p = b*c"))
+        assert str(tree) == str(reference_tree)
+
+    def test_tables_are_computed_when_grammar_does_not_match(self, tmp_path):
+        path = str(tmp_path / "slr_tables.json")
+        build_tables(path)
+        set_persisted_tables(load_persisted_tables(path))
+        token_list = base_token_list+[(" *written +like *", "WRITTEN_AS")]
+        parser = generate_criteria_parser(reserved_expressions, token_list=token_list)
+        assert not parser.persisted_tables_used
+        assert parser.parsing_table == reference_parsing_table(parser)[2]
+
+    def test_files_with_other_version_are_ignored(self, tmp_path):
+        path = str(tmp_path / "slr_tables.json")
+        build_tables(path)
+        assert len(load_persisted_tables(path)) > 0
+        with open(path, "r", encoding="utf-8") as tables_file:
+            content = json.load(tables_file)
+        content["version"] = slr_tables_version+1
+        with open(path, "w", encoding="utf-8") as tables_file:
+            json.dump(content, tables_file)
+        assert load_persisted_tables(path) == dict()
+        assert load_persisted_tables(str(tmp_path / "missing.json")) == dict()
+
+    def test_grammar_hash_depends_on_error_condition_closures(self):
+        def condition_for(label):
+            return lambda items_token, next_symbol: next_symbol.label == label
+
+        def action(p, s, a, i, t, o):
+            raise Exception("Unexpected token.")
+
+        def hash_for(label):
+            return grammar_hash(base_token_list, [], "START", "END", "NULL", [(condition_for(label), action)])
+        assert hash_for("END") == hash_for("END")
+        assert hash_for("END") != hash_for("NULL")
+
+    def test_grammar_hash_does_not_depend_on_hash_seed(self):
+        command = [
+            sys.executable, "-c",
+            "from app.build_slr_tables import default_parsers; print([parser.grammar_hash for parser in default_parsers()])"
+        ]
+        root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        outputs = set()
+        for seed in ["1", "2"]:
+            environment = {**os.environ, "PYTHONHASHSEED": seed}
+            outputs.add(subprocess.run(command, cwd=root, env=environment, capture_output=True, text=True, check=True).stdout)
+        assert len(outputs) == 1
+
@@ -1,11 +1,161 @@
 import pytest
 import os
+import random
+import re
+from fractions import Fraction
+
+from sympy import Mul, Symbol
 
 from ..context.physical_quantity import SLR_quantity_parser, SLR_quantity_parsing, default_parameters
+from ..utility.physical_quantity_utilities import (
+    SLR_generate_unit_dictionaries,
+    SLR_generate_unit_expansions,
+    SLR_generate_unit_trie,
+    base_units_order,
+    create_SLR_quantity_parser,
+    exact_number,
+    match_unit,
+    preprocess_legacy,
+    quantity_parser_cache,
+    quantity_parsing_params,
+    precompute_unit_expansions,
+    warm_up_quantity_parsers,
+)
+from ..utility.unit_system_conversions import conversion_to_base_si_units
 from ..utility.unit_system_conversions import\
-    set_of_SI_base_unit_dimensions, set_of_derived_SI_units_in_SI_base_units,\
+    set_of_SI_prefixes, set_of_SI_base_unit_dimensions, set_of_derived_SI_units_in_SI_base_units,\
     set_of_common_units_in_SI, set_of_very_common_units_in_SI, set_of_imperial_units
 
+
+def starts_with_unit_by_slicing(units_string, strictness):
+    # Reference implementation, tries every prefix of the string from longest to shortest
+    units_dictionary, prefixed_units_dictionary, units_end_dictionary, prefixed_units_end_dictionary = \
+        SLR_generate_unit_dictionaries(units_string, strictness)
+    max_unit_name_length = max(len(x) for x in [units_dictionary.keys()]+[units_end_dictionary.keys()])
+    if strictness == "strict":
+        units = {**units_dictionary, **prefixed_units_dictionary}
+
+        def starts_with_unit(string):
+            for k in range(max_unit_name_length, -1, -1):
+                unit = units.get(string[0:k+1], None)
+                if unit is not None:
+                    return string[0:k+1], unit
+            return None, None
+    else:
+        units_end = {**prefixed_units_end_dictionary, **units_end_dictionary}
+        units = {**prefixed_units_dictionary, **units_dictionary}
+        chars_in_keys = {c for key in list(units.keys())+list(units_end.keys()) for c in key}
+
+        def starts_with_unit(string):
+            end_point = len(string)
+            for k, c in enumerate(string):
+                if c not in chars_in_keys:
+                    end_point = k
+                    break
+            if end_point == 0:
+                return None, None
+            local_string = string[0:end_point]
+            if local_string in units_end.keys():
+                return local_string, units_end[local_string]
+            for k in range(len(local_string), -1, -1):
+                unit = units.get(local_string[0:k], None)
+                if unit is not None:
+                    return local_string[0:k], unit
+            return None, None
+    return starts_with_unit
+
+
+def expand_units_by_parsing(node, parser):
+    # Reference implementation, parses the expansion of each unit every time it is needed
+    if node.label == "UNIT" and len(node.children) == 0 and node.content not in [x[0] for x in set_of_SI_base_unit_dimensions]:
+        node = parser.parse(parser.scan(conversion_to_base_si_units[node.content]))[0]
+    for k, child in enumerate(node.children):
+        node.children[k] = expand_units_by_parsing(child, parser)
+    return node
+
+def preprocess_legacy_by_searching(expr):
+    # Reference implementation, builds the patterns on every call and searches
+    # from the start of the string after each rewrite
+    prefix_data = {(p[0], p[1], tuple(), p[3]) for p in set_of_SI_prefixes}
+    prefixes = []
+    for prefix in prefix_data:
+        prefixes = prefixes + [prefix[0]] + list(prefix[-1])
+    prefix_short_forms = [prefix[1] for prefix in prefix_data]
+    unit_data = set_of_SI_base_unit_dimensions \
+        | set_of_derived_SI_units_in_SI_base_units \
+        | set_of_common_units_in_SI \
+        | set_of_very_common_units_in_SI \
+        | set_of_imperial_units
+    unit_long_forms = prefixes
+    for unit in unit_data:
+        unit_long_forms = unit_long_forms + [unit[0]] + list(unit[-2]) + list(unit[-1])
+    unit_long_forms = "(" + "|".join(unit_long_forms) + ")"
+    search_string = r"(?<!\*)\* *" + unit_long_forms
+    match_content = re.search(search_string, expr[1:])
+    while match_content is not None:
+        expr = expr[0:match_content.span()[0]+1] + match_content.group().replace("*", " ") + expr[match_content.span()[1]+1:]
+        match_content = re.search(search_string, expr[1:])
+    prefixes = "(" + "|".join(prefixes) + ")"
+    search_string = prefixes + " " + unit_long_forms
+    match_content = re.search(search_string, expr)
+    while match_content is not None:
+        expr = expr[0:match_content.span()[0]] + " " + "".join(match_content.group().split()) + expr[match_content.span()[1]:]
+        match_content = re.search(search_string, expr)
+    unit_short_forms = [u[1] for u in unit_data]
+    short_forms = "(" + "|".join(list(set(prefix_short_forms + unit_short_forms))) + ")"
+    search_string = r"[0-9\*\(\)]" + short_forms
+    match_content = re.search(search_string, expr)
+    while match_content is not None:
+        expr = expr[0:match_content.span()[0]+1] + " " + expr[match_content.span()[0]+1:]
+        match_content = re.search(search_string, expr)
+    prefix_short_forms = "(" + "|".join(prefix_short_forms) + ")"
+    search_string = r"[0-9\*\(\) ]" + prefix_short_forms + " "
+    match_content = re.search(search_string, expr)
+    while match_content is not None:
+        expr = expr[0:match_content.span()[0]+1] + match_content.group()[0:-1] + expr[match_content.span()[1]:]
+        match_content = re.search(search_string, expr)
+    search_string = r"[0-9\*\(\) ]" + prefix_short_forms + "\\* "
+    match_content = re.search(search_string, expr)
+    while match_content is not None:
+        expr = expr[0:match_content.span()[0]+1] + match_content.group()[0:-2] + expr[match_content.span()[1]:]
+        match_content = re.search(search_string, expr)
+    unit_short_forms = "(" + "|".join(unit_short_forms) + ")"
+    search_string = r"[0-9\(\) ]\* " + unit_short_forms
+    match_content = re.search(search_string, expr)
+    while match_content is not None:
+        expr = expr[0:match_content.span()[0]] + match_content.group().replace("*", " ") + expr[match_content.span()[1]:]
+        match_content = re.search(search_string, expr)
+    return expr
+
+
+# Responses and answers used with the legacy strictness
+legacy_test_corpus = [
+    "100*kilo*pascal*ohm",
+    "100 kilopascal ohm",
+    "8650*watt",
+    "8.65kW",
+    "8650W",
+    "8650*W",
+    "8.65 k   W",
+    "8.65 k*W",
+    "(8.65)kW",
+    "(8650)W",
+    "newton*metre",
+    "kilo metre",
+    "100Pa",
+    "100 m Pa",
+    "100 m* Pa",
+    "100* Pa",
+    "2**metre",
+    "**metre",
+    "3* * *metre",
+    "kilokilo metre",
+    "1 m  x",
+    "5 mu m/s^2",
+    "7.5*10^3 k W h",
+]
+
+
 slr_strict_si_syntax_test_cases = [
     ("q",  # String that will be used as response / answer
      "q",  # Expected value
@@ -571,6 +721,198 @@ class TestEvaluationFunction():
         assert parsed_value_latex == value_latex
         assert parsed_unit_latex == unit_latex
 
+    def test_quantity_parser_is_cached(self):
+        parser = SLR_quantity_parser({"units_string": "SI common imperial", "strictness": "natural"})
+        assert SLR_quantity_parser({"units_string": "SI common imperial", "strictness": "legacy"}) is parser
+        assert SLR_quantity_parser({"units_string": "SI common imperial", "strictness": "strict"}) is not parser
+        assert SLR_quantity_parser({"units_string": "SI", "strictness": "natural"}) is not parser
+
+    def test_warm_up_quantity_parsers(self):
+        quantity_parser_cache.clear()
+        warm_up_quantity_parsers(units_strings=("SI",), precompute_expansions=False)
+        info = quantity_parser_cache.info()
+        assert info["size"] == 2
+        SLR_quantity_parser({"units_string": "SI", "strictness": "strict"})
+        assert quantity_parser_cache.info()["hits"] == info["hits"]+1
+
+    @pytest.mark.parametrize("strictness", ["strict", "natural"])
+    @pytest.mark.parametrize("units_string", ["SI", "common", "imperial", "SI common imperial"])
+    def test_unit_trie_gives_same_units_as_reference(self, units_string, strictness):
+        reference = starts_with_unit_by_slicing(units_string, strictness)
+        unit_trie, chars_in_keys = SLR_generate_unit_trie(units_string, strictness)
+        dictionaries = SLR_generate_unit_dictionaries(units_string, strictness)
+        names = sorted({name for dictionary in dictionaries for name in dictionary.keys()})
+        generator = random.Random(0)
+        strings = ["", " ", "2 m", "(m)", "ms", "mss", "kgm", "metres per second"]
+        for name in names:
+            strings += [name, name+" ", name+"s", name+"^2", name+"/s", name+")", name+"x"]
+        for _ in range(200):
+            strings.append("".join(generator.choice(names) for _ in range(generator.randint(1, 3))))
+        for string in strings:
+            if strictness == "strict":
+                assert match_unit(unit_trie, string) == reference(string), string
+            else:
+                assert match_unit(unit_trie, string, chars_in_keys) == reference(string), string
+
+    def test_unit_trie_is_shared(self):
+        assert SLR_generate_unit_trie("SI common imperial", "legacy") is SLR_generate_unit_trie("SI common imperial", "natural")
+
+    @pytest.mark.parametrize("strictness", ["strict", "natural"])
+    @pytest.mark.parametrize(
+        "string",
+        ["2 kN*m/s^2", "kilonewton metre", "3 mile/hour", "(km/h)^2", "5 ounce", "10 mL", "1 kW/m^2/K", "2.5 GPa", "kg"]
+    )
+    def test_expanded_units_are_same_as_reference(self, strictness, string):
+        parameters = {**default_parameters, "strict_syntax": False, "units_string": "SI common imperial", "strictness": strictness}
+        parser = SLR_quantity_parser(parameters)
+        quantity = SLR_quantity_parsing(string, parameters, parser, "quantity")
+        expected = expand_units_by_parsing(quantity.unit.copy(), parser)
+        for _ in range(2):
+            expanded = quantity._expand_units(quantity.unit.copy())
+            assert expanded.content_string() == expected.content_string()
+            assert expanded.tree_string() == expected.tree_string()
+
+    def test_unit_expansions_are_shared(self):
+        precompute_unit_expansions("SI", "strict")
+        expansions = SLR_generate_unit_expansions("SI", "strict")
+        assert "kilonewton" in expansions.keys() and "metre" not in expansions.keys()
+        expansion_strings = {unit: node.tree_string() for (unit, node) in expansions.items()}
+        parameters = {**default_parameters, "strict_syntax": False, "units_string": "SI", "strictness": "strict"}
+        parser = SLR_quantity_parser(parameters)
+        for string in ["kN*m/s^2", "2 GPa", "3 kJ/(mol*K)"]:
+            SLR_quantity_parsing(string, parameters, parser, "quantity")
+        assert SLR_generate_unit_expansions("SI", "strict") is expansions
+        assert {unit: node.tree_string() for (unit, node) in expansions.items()} == expansion_strings
+
+    @pytest.mark.parametrize(
+        "string,exponents,scale",
+        [
+            ("2 kN*m/s^2", {"gram": 1, "metre": 2, "second": -4}, Fraction(10**6)),
+            ("2 km/h", {"metre": 1, "second": -1}, Fraction(1000, 3600)),
+            ("2 mile", {"metre": 1}, Fraction("1609.344")),
+            ("2 mA s^-1", {"ampere": 1, "second": -1}, Fraction(1, 1000)),
+            ("2", {}, Fraction(1)),
+        ]
+    )
+    def test_unit_vector(self, string, exponents, scale):
+        parameters = {**default_parameters, "strict_syntax": False, "units_string": "SI common imperial", "strictness": "natural"}
+        quantity = SLR_quantity_parsing(string, parameters, SLR_quantity_parser(parameters), "quantity")
+        assert quantity.unit_vector == (tuple(exponents.get(unit, 0) for unit in base_units_order), scale)
+
+    def test_unit_vector_is_none_for_irrational_scale(self):
+        parameters = {**default_parameters, "strict_syntax": False, "units_string": "SI common imperial", "strictness": "natural"}
+        quantity = SLR_quantity_parsing("2 radian", parameters, SLR_quantity_parser(parameters), "quantity")
+        assert quantity.unit_vector is None
+
+    @pytest.mark.parametrize("strictness", ["strict", "natural"])
+    def test_unit_vector_agrees_with_expanded_unit(self, strictness):
+        parameters = {**default_parameters, "strict_syntax": False, "units_string": "SI common imperial", "strictness": strictness}
+        parser = SLR_quantity_parser(parameters)
+        units = sorted(conversion_to_base_si_units.keys())
+        generator = random.Random(0)
+        strings = ["2 "+unit for unit in generator.sample(units, 100)]
+        for operator in ["*", "/", " "]:
+            strings += ["2 "+generator.choice(units)+operator+generator.choice(units)+"^2" for _ in range(30)]
+        base_units = [Symbol(unit, positive=True) for unit in base_units_order]
+        for string in strings:
+            quantity = SLR_quantity_parsing(string, parameters, parser, "quantity")
+            if quantity.unit_vector is None:
+                continue
+            (exponents, scale) = quantity.unit_vector
+            expanded_unit = quantity.expanded_unit.subs({x: Symbol(str(x), positive=True) for x in quantity.expanded_unit.free_symbols})
+            ratio = (expanded_unit/Mul(*[x**k for (x, k) in zip(base_units, exponents)])).simplify()
+            assert len(ratio.free_symbols) == 0, string
+            assert abs(float(ratio)-float(scale)) <= 1e-12*float(scale), string
+
+    @pytest.mark.parametrize(
+        "string,value",
+        [
+            ("1.24", Fraction(31, 25)),
+            ("-0.5", Fraction(-1, 2)),
+            ("3.0e8", Fraction(3*10**8)),
+            ("1.2e-3", Fraction(3, 2500)),
+            ("1.2*10**5", Fraction(120000)),
+            ("1.2 e5", None),
+            ("2/3", None),
+            ("x", None),
+            ("", None),
+        ]
+    )
+    def test_exact_number(self, string, value):
+        assert exact_number(string) == value
+
+    def test_exact_number_without_e_notation(self):
+        assert exact_number("3.0e8", e_notation=False) is None
+        assert exact_number("1.2*10**5", e_notation=False) == Fraction(120000)
+
+    @pytest.mark.parametrize(
+        "string,exact",
+        [
+            ("1.24 km", True),
+            ("-3.0e8 m/s", True),
+            ("5e3 g", True),
+            ("2.5 mile/h", True),
+            ("0 N", True),
+            ("12", True),
+            ("2/3 m", False),
+            ("2*pi m", False),
+            ("2 radian", False),
+            ("1.2 e5 m", False),
+        ]
+    )
+    def test_exact_value_agrees_with_standard_value(self, string, exact):
+        parameters = {**default_parameters, "strict_syntax": False, "elementary_functions": False, "units_string": "SI common imperial", "strictness": "natural"}
+        quantity = SLR_quantity_parsing(string, parameters, SLR_quantity_parser(parameters), "quantity")
+        assert (quantity.exact_value is not None) == exact
+        if exact:
+            assert quantity.exact_value == quantity.standard_value.simplify()
+
+    def test_no_exact_value_for_e_notation_with_elementary_functions(self):
+        parameters = {**default_parameters, "strict_syntax": False, "elementary_functions": True, "units_string": "SI common imperial", "strictness": "natural"}
+        quantity = SLR_quantity_parsing("3.0e8 m/s", parameters, SLR_quantity_parser(parameters), "quantity")
+        assert quantity.exact_value is None
+        quantity = SLR_quantity_parsing("1.24 km", parameters, SLR_quantity_parser(parameters), "quantity")
+        assert quantity.exact_value == Fraction(1240)
+
+    def test_parsing_params_are_shared(self):
+        parameters = {**default_parameters, "strict_syntax": False, "elementary_functions": False, "units_string": "SI common imperial", "strictness": "natural"}
+        parser = SLR_quantity_parser(parameters)
+        response = SLR_quantity_parsing("2 km/h", parameters, parser, "response")
+        answer = SLR_quantity_parsing("2 mile", {**parameters}, parser, "answer")
+        assert response.parsing_params is answer.parsing_params
+        assert quantity_parsing_params({**parameters, "units_string": "SI"}) is not response.parsing_params
+        assert quantity_parsing_params({**parameters, "elementary_functions": True}) is not response.parsing_params
+        assert "mile" in response.parsing_params["unsplittable_symbols"]
+        assert "mile" not in quantity_parsing_params({**parameters, "units_string": "SI"})["unsplittable_symbols"]
+
+    @pytest.mark.parametrize("expr", legacy_test_corpus)
+    def test_preprocess_legacy_gives_same_result_as_reference(self, expr):
+        assert preprocess_legacy(expr, {}) == preprocess_legacy_by_searching(expr)
+
+    def test_preprocess_legacy_gives_same_result_as_reference_for_generated_strings(self):
+        pieces = ["*", "**", " ", "  ", "* ", "2", "8.65", "(", ")", "k", "m", "mu", "da", "W", "Pa", "kilo", "metre", "pascal", "hour", "h", "x", "/", "^2"]
+        generator = random.Random(0)
+        for _ in range(2000):
+            expr = "".join(generator.choice(pieces) for _ in range(generator.randint(1, 12)))
+            assert preprocess_legacy(expr, {}) == preprocess_legacy_by_searching(expr), expr
+
+    def test_unit_dictionaries_are_not_changed_by_strict_parser(self):
+        dictionaries = SLR_generate_unit_dictionaries("SI common", "strict")
+        sizes = [len(dictionary) for dictionary in dictionaries]
+        create_SLR_quantity_parser("SI common", "strict")
+        assert SLR_generate_unit_dictionaries("SI common", "strict") is dictionaries
+        assert [len(dictionary) for dictionary in dictionaries] == sizes
+
+    @pytest.mark.parametrize("strictness", ["strict", "natural"])
+    @pytest.mark.parametrize("string", ["10 kg m/s^2", "(2+x) km/h", "5 N m"])
+    def test_cached_parser_gives_same_result_as_new_parser(self, strictness, string):
+        parameters = {**default_parameters, "strict_syntax": False, "units_string": "SI common imperial", "strictness": strictness}
+        results = []
+        for parser in [create_SLR_quantity_parser("SI common imperial", strictness)]+[SLR_quantity_parser(parameters)]*2:
+            quantity = SLR_quantity_parsing(string, parameters, parser, "quantity")
+            results.append((quantity.ast_root.content_string(), quantity.value_latex_string, quantity.unit_latex_string))
+        assert results[0] == results[1] == results[2]
+
 
 if __name__ == "__main__":
     pytest.main(["-xs", "--tb=line", os.path.abspath(__file__)])
@@ -0,0 +1,155 @@
+import signal
+import threading
+import time
+import pytest
+
+from ..utility.time_budget_utilities import TimeBudget, EvaluationTimeout, interrupt_after, can_interrupt
+from ..utility.criteria_graph_utilities import CriteriaGraph
+from ..feedback.symbolic import feedback_generators as symbolic_feedback_string_generators
+from ..evaluation import evaluation_function, generate_feedback
+from ..utility.evaluation_result_utilities import EvaluationResult
+
+requires_interrupt = pytest.mark.skipif(not can_interrupt(), reason="Evaluation can only be interrupted in the main thread on Unix-like systems")
+
+
+def busy_loop(unused_input):
+    # Exceptions are caught here to check that the timeout is not swallowed by
+    # code that catches all exceptions
+    while True:
+        try:
+            sum(range(1000))
+        except Exception:
+            pass
+
+
+def create_graph(evaluate, with_unknown_criterion=True):
+    graph = CriteriaGraph("test")
+    END = CriteriaGraph.END
+    graph.add_node(END)
+    graph.add_evaluation_node("test", summary="test", details="test", evaluate=evaluate)
+    outcomes = ["TRUE", "FALSE"]+(["UNKNOWN"] if with_unknown_criterion else [])
+    for outcome in outcomes:
+        graph.attach("test", "test_"+outcome, summary=outcome, details=outcome)
+        graph.attach("test_"+outcome, END.label)
+    return graph
+
+
+class TestTimeBudget():
+
+    def test_remaining_time(self):
+        budget = TimeBudget(1000)
+        assert 0 < budget.remaining() <= 1
+        assert budget.expired() is False
+        assert TimeBudget(0).expired() is True
+
+    def test_share(self):
+        budget = TimeBudget(1000)
+        share = budget.share(4)
+        assert share.remaining() <= 0.25
+        assert share.deadline <= budget.deadline
+
+    @requires_interrupt
+    def test_interrupt_after(self):
+        start = time.monotonic()
+        with pytest.raises(EvaluationTimeout):
+            with interrupt_after(0.05):
+                busy_loop(None)
+        assert time.monotonic()-start < 1
+
+    @requires_interrupt
+    def test_interrupt_after_does_not_affect_code_that_finishes(self):
+        with interrupt_after(1):
+            result = sum(range(10))
+        assert result == 45
+        time.sleep(0.1)
+
+    @requires_interrupt
+    def test_timeout_during_teardown_restores_timer_and_handler(self, monkeypatch):
+        set_handler = signal.signal
+        calls = []
+
+        def set_handler_interrupted_once(signum, handler):
+            # Simulates the timer firing while the previous handler is being restored
+            calls.append(handler)
+            if len(calls) == 2:
+                raise EvaluationTimeout()
+            return set_handler(signum, handler)
+        monkeypatch.setattr(signal, "signal", set_handler_interrupted_once)
+        previous_handler = signal.getsignal(signal.SIGALRM)
+        with interrupt_after(1):
+            result = sum(range(10))
+        assert result == 45
+        assert len(calls) == 3
+        assert signal.getitimer(signal.ITIMER_REAL) == (0.0, 0.0)
+        assert signal.getsignal(signal.SIGALRM) is previous_handler
+
+    @requires_interrupt
+    def test_cancelled_node_is_reported_as_unknown(self):
+        graph = create_graph(busy_loop)
+        feedback = graph.generate_feedback(None, "test_TRUE", time_budget=TimeBudget(50))
+        assert feedback == {"test_UNKNOWN": None}
+
+    @requires_interrupt
+    def test_cancelled_node_without_unknown_criterion(self):
+        graph = create_graph(busy_loop, with_unknown_criterion=False)
+        feedback = graph.generate_feedback(None, "test_TRUE", time_budget=TimeBudget(50))
+        assert feedback == {"test_UNKNOWN": None}
+        assert "test_UNKNOWN" in graph.criteria.keys()
+
+    def test_added_unknown_criterion_uses_given_feedback(self):
+        graph = create_graph(busy_loop, with_unknown_criterion=False)
+        time_budget_feedback = symbolic_feedback_string_generators["INTERNAL"]("TIME_BUDGET_EXCEEDED")
+        graph.generate_feedback(None, "test_TRUE", time_budget=TimeBudget(0), time_budget_feedback=time_budget_feedback)
+        assert graph.criteria["test_UNKNOWN"].feedback_string_generator is time_budget_feedback
+
+    def test_time_budget_feedback_from_evaluation_parameters(self):
+        graph = create_graph(busy_loop, with_unknown_criterion=False)
+        evaluation_result = EvaluationResult()
+        evaluation_parameters = {
+            "evaluation_result": evaluation_result,
+            "reserved_expressions": {"response": None},
+            "time_budget": TimeBudget(0),
+            "time_budget_feedback": symbolic_feedback_string_generators["INTERNAL"]("TIME_BUDGET_EXCEEDED"),
+        }
+        generate_feedback("test_TRUE", {"test": graph}, evaluation_parameters)
+        expected = symbolic_feedback_string_generators["INTERNAL"]("TIME_BUDGET_EXCEEDED")(dict())
+        assert evaluation_result.is_correct is False
+        assert expected in evaluation_result.serialise()["feedback"]
+
+    def test_expired_budget_is_checked_outside_main_thread(self):
+        graph = create_graph(busy_loop)
+        feedback = []
+        thread = threading.Thread(target=lambda: feedback.append(graph.generate_feedback(None, "test_TRUE", time_budget=TimeBudget(0))))
+        thread.start()
+        thread.join(10)
+        assert feedback == [{"test_UNKNOWN": None}]
+
+    def test_node_that_finishes_in_time(self):
+        graph = create_graph(lambda unused_input: {"test_TRUE": None})
+        feedback = graph.generate_feedback(None, "test_TRUE", time_budget=TimeBudget(10000))
+        assert feedback == {"test_TRUE": None}
+
+    def test_expired_budget_skips_evaluation(self):
+        graph = create_graph(busy_loop)
+        feedback = graph.generate_feedback(None, "test_TRUE", time_budget=TimeBudget(0))
+        assert feedback == {"test_UNKNOWN": None}
+
+    @pytest.mark.parametrize(
+        "response, answer, params, unknown_tag",
+        [
+            ("sin(x)**2+cos(x)**2", "1", {"strict_syntax": False, "elementary_functions": True}, "response = answer_UNKNOWN"),
+            ("2*x", "x", {"strict_syntax": False, "criteria": "response/answer = 2"}, "response/answer = 2_UNKNOWN"),
+            ("1.24 mile/hour", "1.24 mile/hour", {"strict_syntax": False, "physical_quantity": True}, "response matches answer_UNKNOWN"),
+        ]
+    )
+    def test_time_budget_ms_parameter(self, response, answer, params, unknown_tag):
+        params.update({"time_budget_ms": 0})
+        result = evaluation_function(response, answer, params)
+        assert result["is_correct"] is False
+        assert unknown_tag in result["tags"]
+
+    def test_large_time_budget_does_not_change_result(self):
+        params = {"strict_syntax": False, "elementary_functions": True}
+        expected = evaluation_function("sin(x)**2+cos(x)**2", "1", dict(params))
+        params.update({"time_budget_ms": 60000})
+        assert evaluation_function("sin(x)**2+cos(x)**2", "1", params) == expected
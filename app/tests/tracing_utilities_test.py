@@ -0,0 +1,125 @@
+import io
+import json
+
+from ..evaluation import evaluation_function
+from sympy import Symbol, sin, cos
+
+from ..utility.expression_utilities import parse_cache, canonical_form_cache, traced_simplify
+from ..utility.tracing_utilities import (
+    tracing,
+    tracing_enabled,
+    span,
+    stage,
+    collect_spans,
+    summarise_spans,
+    MemorySink,
+    JSONLogSink,
+    CallbackSink,
+)
+
+
+class TestTracing():
+
+    def test_spans_are_only_recorded_when_tracing_is_enabled(self):
+        sink = MemorySink()
+        with span("outside"):
+            pass
+        assert tracing_enabled() is False
+        with tracing(sink):
+            assert tracing_enabled() is True
+            with span("outer") as attributes:
+                attributes["value"] = 1
+                with span("inner", category="parse"):
+                    pass
+        assert tracing_enabled() is False
+        assert [s["name"] for s in sink.spans] == ["inner", "outer"]
+        assert sink.spans[0]["depth"] == 1
+        assert sink.spans[0]["category"] == "parse"
+        assert sink.spans[1]["depth"] == 0
+        assert sink.spans[1]["attributes"] == {"value": 1}
+        assert all(s["wall_ms"] >= 0 and s["cpu_ms"] >= 0 for s in sink.spans)
+
+    def test_json_log_sink(self):
+        stream = io.StringIO()
+        with tracing(JSONLogSink(stream)):
+            with span("a", attribute="x"):
+                pass
+            with stage("parse"):
+                pass
+        lines = [json.loads(line) for line in stream.getvalue().splitlines()]
+        assert [line["name"] for line in lines] == ["a", "parse"]
+        assert lines[0]["attributes"] == {"attribute": "x"}
+        assert lines[1]["category"] == "stage"
+
+    def test_callback_sink_and_call_counts(self):
+        names = []
+        with tracing(CallbackSink(lambda s: names.append(s["name"]))) as tracer:
+            for _ in range(3):
+                with span("a"):
+                    pass
+            with span("b"):
+                pass
+        assert names == ["a", "a", "a", "b"]
+        assert tracer.call_counts == {"a": 3, "b": 1}
+
+    def test_collect_spans_and_summary(self):
+        with tracing():
+            with span("before"):
+                pass
+            with collect_spans() as spans:
+                with span("a"):
+                    pass
+                with span("a"):
+                    pass
+            with span("after"):
+                pass
+        summary = summarise_spans(spans)
+        assert list(summary.keys()) == ["a"]
+        assert summary["a"]["calls"] == 2
+
+    def test_evaluation_spans(self):
+        parse_cache.clear()
+        canonical_form_cache.clear()
+        params = {"strict_syntax": False, "elementary_functions": True}
+        with tracing() as tracer:
+            result = evaluation_function("sin(x)**2+cos(x)**2", "1", params, include_test_data=True)
+        assert result["is_correct"] is True
+        names = set(tracer.call_counts.keys())
+        assert {"evaluation_function", "parse_expression", "simplify", "graph_node"} <= names
+        assert {"preprocess", "parse", "preview", "criteria_parsing", "graph_construction", "graph_evaluation"} <= names
+        assert tracer.call_counts["evaluation_function"] == 1
+        assert "evaluate" not in names
+        assert len(result["trace"]["spans"]) == sum(tracer.call_counts.values())
+        assert set(result["trace"]["summary"].keys()) == names
+        graph_nodes = [s for s in result["trace"]["spans"] if s["name"] == "graph_node"]
+        assert all("outcome" in s["attributes"] for s in graph_nodes)
+        parse_spans = [s for s in result["trace"]["spans"] if s["name"] == "parse_expression"]
+        assert all("cached" in s["attributes"] for s in parse_spans)
+
+    def test_direct_simplification_spans(self):
+        x = Symbol("x")
+        with tracing() as tracer:
+            assert traced_simplify(sin(x)**2+cos(x)**2) == 1
+        assert tracer.call_counts["simplify"] == 1
+        assert tracer.sink.spans[0]["attributes"] == {"simplifications": 1, "cached": False}
+        params = {"strict_syntax": False, "elementary_functions": True, "numeric_probe": False}
+        with tracing() as tracer:
+            result = evaluation_function("x+2", "x+1", params, include_test_data=True)
+        assert result["is_correct"] is False
+        direct_simplifications = [s for s in result["trace"]["spans"] if s["name"] == "simplify" and s["attributes"]["cached"] is False and s["attributes"]["simplifications"] == 1]
+        # Each side of the comparison in the check_equality cascade is simplified
+        assert len(direct_simplifications) >= 4
+
+    def test_trace_is_only_added_when_tracing_is_enabled_and_test_data_is_requested(self):
+        params = {"strict_syntax": False, "elementary_functions": True}
+        assert "trace" not in evaluation_function("2x", "2*x", params, include_test_data=True)
+        with tracing():
+            assert "trace" not in evaluation_function("2x", "2*x", params)
+            assert "trace" in evaluation_function("2x", "2*x", params, include_test_data=True)
+
+    def test_latex_conversion_span(self):
+        params = {"strict_syntax": False, "elementary_functions": True, "is_latex": True}
+        with tracing() as tracer:
+            result = evaluation_function("x^{2}", "x**2", params)
+        assert result["is_correct"] is True
+        assert tracer.call_counts["latex_conversion"] == 1
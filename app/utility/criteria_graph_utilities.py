@@ -1,5 +1,8 @@
 import json
 
+from .time_budget_utilities import EvaluationTimeout, interrupt_after
+from .tracing_utilities import span
+
 evaluation_style = ("([", "])")
 starting_evaluation_style = (">", "]")
 criterion_style = ("[", "]")
@@ -350,7 +353,37 @@ class CriteriaGraph:
         trees = [self.build_tree(start, main_criteria=[label]) for start in self.starting_evaluations(label)]
         return trees
 
-    def generate_feedback(self, response, main_criteria):
+    def evaluate_within_time_budget(self, label, response, time_budget, time_budget_feedback=None):
+        """
+            Runs the evaluation node with the given label, if the node does not finish
+            before the time budget runs out it is cancelled and the outcome is reported
+            using the unknown criterion of the node (label+"_UNKNOWN"). If the node
+            does not have an unknown criterion one is added to the graph, using
+            time_budget_feedback as its feedback string generator.
+        """
+        if not time_budget.expired():
+            try:
+                with interrupt_after(time_budget.remaining()):
+                    return self.evaluations[label].evaluate(response)
+            except EvaluationTimeout:
+                pass
+        unknown_criteria = [edge.target.label for edge in self.evaluations[label].outgoing if edge.target.label.endswith("_UNKNOWN")]
+        if len(unknown_criteria) > 0:
+            unknown_criterion = unknown_criteria[0]
+        else:
+            unknown_criterion = label+"_UNKNOWN"
+            self.attach(
+                label,
+                unknown_criterion,
+                summary="Time budget exceeded",
+                details="Evaluation of "+label+" was cancelled since the time budget was exceeded.",
+                feedback_string_generator=time_budget_feedback
+            )
+            if self.END.label in self.outputs.keys():
+                self.attach(unknown_criterion, self.END.label)
+        return {unknown_criterion: None}
+
+    def generate_feedback(self, response, main_criteria, time_budget=None, time_budget_feedback=None):
         evaluations = set().union(self.starting_evaluations(main_criteria))
         visited_evaluations = set()
         feedback = dict()
@@ -362,7 +395,12 @@ class CriteriaGraph:
             if e not in visited_evaluations and e in self.evaluations.keys():
                 visited_evaluations.update({e})
                 try:
-                    results = self.evaluations[e].evaluate(response)
+                    with span("graph_node", category="graph", graph=self.identifier, node=e) as attributes:
+                        if time_budget is None:
+                            results = self.evaluations[e].evaluate(response)
+                        else:
+                            results = self.evaluate_within_time_budget(e, response, time_budget, time_budget_feedback)
+                        attributes["outcome"] = list(results.keys())
                 except Exception as exc:
                     print(e)
                     print(self.evaluations)
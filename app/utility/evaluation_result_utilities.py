@@ -4,8 +4,10 @@ class EvaluationResult:
         self.latex = None
         self._feedback = []  # A list that will hold all feedback items
         self._feedback_tags = {}  # A dictionary that holds a list with indices to all feedback items with the same tag
+        self._criteria_graphs_sources = {}  # Criteria graphs that will be serialised when needed
         self._criteria_graphs = {}
         self._criteria_graphs_vis = {}
+        self._test_data_tags = []  # Tags that are only returned when test data is requested
         self.latex = ""
         self.simplified = ""
 
@@ -15,6 +17,14 @@ class EvaluationResult:
     def get_tags(self):
         return list(self._feedback_tags.keys())
 
+    def get_feedback_items(self):
+        """
+            Returns all feedback items, on the form (tag, feedback),
+            in the order they were added.
+        """
+        index_tags = {index: tag for (tag, indices) in self._feedback_tags.items() for index in indices}
+        return [(index_tags[index], feedback) for (index, feedback) in enumerate(self._feedback)]
+
     def add_feedback(self, feedback_item):
         if isinstance(feedback_item, tuple):
             self._feedback.append(feedback_item[1])
@@ -40,9 +50,36 @@ class EvaluationResult:
                         feedback_string = graph.criteria[tag].feedback_string_generator(inputs)
                 self.add_feedback((tag, feedback_string))
 
+    def add_test_data_tag(self, tag):
+        if tag not in self._test_data_tags:
+            self._test_data_tags.append(tag)
+
     def add_criteria_graph(self, name, graph):
-        self._criteria_graphs.update({name: graph.json()})
-        self._criteria_graphs_vis.update({name: graph.mermaid()})
+        # The graphs are only serialised when test data is requested,
+        # see get_criteria_graphs and get_criteria_graphs_vis
+        self._criteria_graphs_sources.update({name: graph})
+        self._criteria_graphs.pop(name, None)
+        self._criteria_graphs_vis.pop(name, None)
+
+    def get_criteria_graphs(self):
+        """
+            Returns the criteria graphs serialised as json, each graph is
+            only serialised the first time it is requested.
+        """
+        for (name, graph) in self._criteria_graphs_sources.items():
+            if name not in self._criteria_graphs.keys():
+                self._criteria_graphs.update({name: graph.json()})
+        return {name: self._criteria_graphs[name] for name in self._criteria_graphs_sources.keys()}
+
+    def get_criteria_graphs_vis(self):
+        """
+            Returns the criteria graphs serialised as mermaid diagrams, each
+            graph is only serialised the first time it is requested.
+        """
+        for (name, graph) in self._criteria_graphs_sources.items():
+            if name not in self._criteria_graphs_vis.keys():
+                self._criteria_graphs_vis.update({name: graph.mermaid()})
+        return {name: self._criteria_graphs_vis[name] for name in self._criteria_graphs_sources.keys()}
 
     def _serialise_feedback(self) -> str:
         feedback = []
@@ -57,8 +94,9 @@ class EvaluationResult:
         out = dict(is_correct=self.is_correct, feedback=self._serialise_feedback())
         out.update(dict(tags=list(self._feedback_tags.keys())))
         if include_test_data is True:
-            out.update(dict(criteria_graphs=self._criteria_graphs))
-            out.update(dict(criteria_graphs_vis=self._criteria_graphs_vis))
+            out.update(dict(criteria_graphs=self.get_criteria_graphs()))
+            out.update(dict(criteria_graphs_vis=self.get_criteria_graphs_vis()))
+            out.update(dict(test_data_tags=self._test_data_tags))
         if self.latex is not None:
             out.update(dict(response_latex=self.latex))
         if self.simplified is not None:
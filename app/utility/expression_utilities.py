@@ -26,9 +26,14 @@ from .syntactical_comparison_utilities import is_number_regex
 from sympy.parsing.sympy_parser import parse_expr, split_symbols_custom, _token_splittable
 from sympy.parsing.sympy_parser import T as parser_transformations
 from sympy.printing.latex import LatexPrinter
-from sympy import Basic, Symbol, Equality, Function
+from sympy import Basic, Symbol, Equality, Function, srepr
 
+from .cache_utilities import LRUCache
+from .tracing_utilities import span, tracing_enabled
+
+import hashlib
 import re
+from collections.abc import Mapping, MutableMapping
 from typing import Dict, List, TypedDict
 
 from ..feedback.symbolic import feedback_generators as feedback_string_generators
@@ -351,48 +356,32 @@ def protect_elementary_functions_substitutions(expr):
     return alias_substitutions
 
 
-def substitute_input_symbols(exprs, params):
-    '''
-    Input:
-        exprs  : a string or a list of strings
-        params : Evaluation function parameter dictionary
-    Output:
-        List of strings where alternatives for input symbols have been replaced with
-        their corresponsing input symbol code.
-    Remark:
-        Alternatives are sorted before substitution so that longer alternatives takes precedence.
-    '''
-    if isinstance(exprs, str):
-        exprs = [exprs]
-
-    substitutions = [(expr, expr) for expr in params.get("reserved_keywords", [])]
-    substitutions += [(expr, expr) for expr in params.get("unsplittable_symbols", [])]
+# Cache for the substitution tables used by substitute_input_symbols, the keys are
+# fingerprints of the parameters that the substitutions depend on
+input_symbols_substitutions_cache = LRUCache(maxsize=256)
 
-    if "plus_minus" in params.keys():
-        substitutions += [(params["plus_minus"], "plus_minus")]
+# Parameters that determine which substitutions are made by substitute_input_symbols
+input_symbols_fingerprint_keys = (
+    "symbols",
+    "input_symbols",
+    "elementary_functions",
+    "reserved_keywords",
+    "unsplittable_symbols",
+    "plus_minus",
+    "minus_plus",
+)
 
-    if "minus_plus" in params.keys():
-        substitutions += [(params["minus_plus"], "minus_plus")]
 
-    input_symbols = params.get("symbols",dict())
+def input_symbols_fingerprint(params):
+    return combine_fingerprints({key: value_fingerprint(key, params[key]) for key in input_symbols_fingerprint_keys if key in params.keys()})
 
-    input_symbols_alternatives = []
-    for (code, definition) in input_symbols.items():
-        input_symbols_alternatives += definition["aliases"]
 
-    if params.get("elementary_functions", False) is True:
-        alias_substitutions = []
-        for expr in exprs:
-            for (name, alias_list) in elementary_functions_names+special_symbols_names:
-                if name in input_symbols_alternatives:
-                    continue
-                else:
-                    if (name in expr) and not (name in input_symbols_alternatives):
-                        alias_substitutions += [(name, " "+name)]
-                    for alias in alias_list:
-                        if (alias in expr) and not (alias in input_symbols_alternatives):
-                            alias_substitutions += [(alias, " "+name)]
-        substitutions += alias_substitutions
+def clean_input_symbols(params):
+    '''
+    Removes invalid input symbols and aliases and replaces the input symbol 'lambda' with 'lamda'.
+    The input symbols are changed in place and returned.
+    '''
+    input_symbols = params.get("symbols",dict())
 
     if "symbols" in params.keys():
         # Removing invalid input symbols
@@ -418,40 +407,84 @@ def substitute_input_symbols(exprs, params):
 
     # Since 'lambda' is a reserved keyword in python
     # it needs to be replaced with 'lamda' for expression
-    # parsing to work properly
-    lambda_value = input_symbols.pop("lambda", {"latex": r"\lambda", "aliases": ["lambda"]})
-    if lambda_value is not None:
-        lambda_value["aliases"].append("lambda")
-    input_symbols.update({"lamda": lambda_value})
-    params.update({"symbols": input_symbols})
-
-    for (code, symbol_data) in input_symbols.items():
-        substitutions.append((code, code))
-        for alias in symbol_data["aliases"]:
-            if len(alias) > 0:
-                substitutions.append((alias, code))
+    # parsing to work properly. The symbols can be cleaned
+    # more than once (e.g. for the answer and for each response)
+    # so an existing 'lamda' entry is never overwritten.
+    if "lambda" in input_symbols.keys() or "lamda" not in input_symbols.keys():
+        lambda_value = input_symbols.pop("lambda", {"latex": r"\lambda", "aliases": ["lambda"]})
+        if lambda_value is not None:
+            lambda_value["aliases"].append("lambda")
+        input_symbols.setdefault("lamda", lambda_value)
+    if isinstance(params, MutableMapping):
+        params.update({"symbols": input_symbols})
 
     # REMARK: This is to ensure capability with response areas that use the old formatting
     # for input_symbols. Should be removed when all response areas are updated.
     if "input_symbols" in params.keys():
-        input_symbols = params["input_symbols"]
+        legacy_input_symbols = params["input_symbols"]
         input_symbols_to_remove = []
         alternatives_to_remove = []
-        for k in range(0, len(input_symbols)):
-            if len(input_symbols[k]) > 0:
-                input_symbols[k][0].strip()
-                if len(input_symbols[k][0]) == 0:
+        for k in range(0, len(legacy_input_symbols)):
+            if len(legacy_input_symbols[k]) > 0:
+                legacy_input_symbols[k][0].strip()
+                if len(legacy_input_symbols[k][0]) == 0:
                     input_symbols_to_remove += [k]
             else:
-                for i in range(0, len(input_symbols[k][1])):
-                    if len(input_symbols[k][1][i]) > 0:
-                        input_symbols[k][1][i].strip()
-                    if len(input_symbols[k][1][i]) == 0:
+                for i in range(0, len(legacy_input_symbols[k][1])):
+                    if len(legacy_input_symbols[k][1][i]) > 0:
+                        legacy_input_symbols[k][1][i].strip()
+                    if len(legacy_input_symbols[k][1][i]) == 0:
                         alternatives_to_remove += [(k, i)]
         for (k, i) in alternatives_to_remove:
-            del input_symbols[k][1][i]
+            del legacy_input_symbols[k][1][i]
         for k in input_symbols_to_remove:
-            del input_symbols[k]
+            del legacy_input_symbols[k]
+
+    return input_symbols
+
+
+def create_input_symbols_substitution_table(params, input_symbols, input_symbols_alternatives):
+    '''
+    Input:
+        params                     : Evaluation function parameter dictionary
+        input_symbols              : input symbols cleaned by clean_input_symbols
+        input_symbols_alternatives : aliases of the input symbols before they were cleaned
+    Output:
+        SubstitutionTable with all substitutions made by substitute_input_symbols,
+        sorted so that longer alternatives take precedence.
+    Remark:
+        The substitutions for elementary functions and special symbols are included even
+        if they do not occur in the expression, this does not change the result of the
+        substitution and makes it possible to use the same table for all expressions.
+    '''
+    substitutions = [(expr, expr) for expr in params.get("reserved_keywords", [])]
+    substitutions += [(expr, expr) for expr in params.get("unsplittable_symbols", [])]
+
+    if "plus_minus" in params.keys():
+        substitutions += [(params["plus_minus"], "plus_minus")]
+
+    if "minus_plus" in params.keys():
+        substitutions += [(params["minus_plus"], "minus_plus")]
+
+    if params.get("elementary_functions", False) is True:
+        alias_substitutions = []
+        for (name, alias_list) in elementary_functions_names+special_symbols_names:
+            if name in input_symbols_alternatives:
+                continue
+            else:
+                alias_substitutions += [(name, " "+name)]
+                for alias in alias_list:
+                    if not (alias in input_symbols_alternatives):
+                        alias_substitutions += [(alias, " "+name)]
+        substitutions += alias_substitutions
+
+    for (code, symbol_data) in input_symbols.items():
+        substitutions.append((code, code))
+        for alias in symbol_data["aliases"]:
+            if len(alias) > 0:
+                substitutions.append((alias, code))
+
+    if "input_symbols" in params.keys():
         for input_symbol in params["input_symbols"]:
             substitutions.append((input_symbol[0], input_symbol[0]))
             for alternative in input_symbol[1]:
@@ -463,14 +496,45 @@ def substitute_input_symbols(exprs, params):
     substitutions = [(original, subs.replace("lambda", "lamda")) for (original, subs) in substitutions]
 
     # Since 'as' is a reserved keyword in python, we add a subsitution of 'as' to 'a*s' if 'as' is not a defined symbol
-    if 'as' not in input_symbols:
+    if 'as' not in params.get("input_symbols", input_symbols):
         substitutions += [('as', 'a*s')]
 
     substitutions = list(set(substitutions))
-    if len(substitutions) > 0:
-        substitutions.sort(key=substitutions_sort_key)
+    substitutions.sort(key=substitutions_sort_key)
+    return SubstitutionTable(substitutions)
+
+
+def substitute_input_symbols(exprs, params):
+    '''
+    Input:
+        exprs  : a string or a list of strings
+        params : Evaluation function parameter dictionary
+    Output:
+        List of strings where alternatives for input symbols have been replaced with
+        their corresponsing input symbol code.
+    Remark:
+        Alternatives are sorted before substitution so that longer alternatives takes precedence.
+        The sorted substitutions are cached (see input_symbols_substitutions_cache) so they are
+        only created once for each combination of input symbols and parameters.
+    '''
+    if isinstance(exprs, str):
+        exprs = [exprs]
+
+    fingerprint = input_symbols_fingerprint(params)
+
+    input_symbols_alternatives = []
+    for (code, definition) in params.get("symbols", dict()).items():
+        input_symbols_alternatives += definition["aliases"]
+
+    input_symbols = clean_input_symbols(params)
+
+    substitution_table = input_symbols_substitutions_cache.get_or_compute(
+        fingerprint,
+        lambda: create_input_symbols_substitution_table(params, input_symbols, input_symbols_alternatives)
+    )
+    if len(substitution_table) > 0:
         for k in range(0, len(exprs)):
-            exprs[k] = substitute(exprs[k], substitutions)
+            exprs[k] = substitution_table.apply(exprs[k])
             exprs[k] = " ".join(exprs[k].split())
 
     return exprs
@@ -508,12 +572,78 @@ def find_matching_parenthesis(string, index, delimiters=None):
     return -1
 
 
-def substitute(string, substitutions):
+# Cache for the tries used by substitute, the keys are the left elements of the substitutions
+substitution_trie_cache = LRUCache(maxsize=256)
+
+# Key used in the trie nodes for the (index, length) of the substitution that ends at that node
+_substitution_end = None
+
+
+def substitution_patterns(substitutions):
+    patterns = []
+    for pair in substitutions:
+        if isinstance(pair[0], tuple):
+            patterns.append((pair[0][0], tuple(pair[0][1])))
+        else:
+            patterns.append(pair[0])
+    return tuple(patterns)
+
+
+def create_substitution_trie(patterns):
+    """
+        Creates a trie where each node is a dictionary from characters to nodes.
+        A node where a pattern ends stores the index of the substitution and the
+        number of characters that are replaced. If several patterns end in the
+        same node the substitution that comes first is used.
+    """
+    trie = dict()
+    for (k, pattern) in enumerate(patterns):
+        if isinstance(pattern, tuple):
+            strings = [pattern[0]+look_ahead for look_ahead in pattern[1]]
+            substitution_length = len(pattern[0])
+        else:
+            strings = [pattern]
+            substitution_length = len(pattern)
+        for string in strings:
+            node = trie
+            for char in string:
+                node = node.setdefault(char, dict())
+            if _substitution_end not in node.keys():
+                node[_substitution_end] = (k, substitution_length)
+    return trie
+
+
+def compiled_substitutions(substitutions):
+    patterns = substitution_patterns(substitutions)
+    return substitution_trie_cache.get_or_compute(patterns, lambda: create_substitution_trie(patterns))
+
+
+def match_substitution(trie, string, index):
+    """
+        Returns (index of substitution, number of replaced characters) for the first
+        substitution (in the order of the substitution list) that matches string at
+        the given position, or None if no substitution matches.
+    """
+    node = trie
+    match = node.get(_substitution_end, None)
+    for position in range(index, len(string)):
+        node = node.get(string[position], None)
+        if node is None:
+            break
+        candidate = node.get(_substitution_end, None)
+        if candidate is not None and (match is None or candidate[0] < match[0]):
+            match = candidate
+    return match
+
+
+def substitute(string, substitutions, trie=None):
     '''
     Input:
         string        (required) : a string or a list of strings
         substitutions (required) : a list with elements of the form (string,string)
                                    or ((string,list of strings),string)
+        trie          (optional) : trie for the substitutions created by create_substitution_trie,
+                                   if not given it is taken from substitution_trie_cache
     Output:
         A string that is the input string where any occurence of the left element
         of each pair in substitutions have been replaced with the corresponding right element.
@@ -538,6 +668,9 @@ def substitute(string, substitutions):
     if isinstance(string, str):
         string = [string]
 
+    if trie is None:
+        trie = compiled_substitutions(substitutions)
+
     # Perform substitutions
     new_string = []
     for part in string:
@@ -545,33 +678,19 @@ def substitute(string, substitutions):
             new_string.append(part)
         else:
             index = 0
-            string_buffer = ""
+            buffer_start = 0
             while index < len(part):
-                matched_start = False
-                for k, pair in enumerate(substitutions):
-                    if isinstance(pair[0], tuple):
-                        match = False
-                        for look_ahead in pair[0][1]:
-                            if part.startswith(pair[0][0]+look_ahead, index):
-                                match = True
-                                break
-                        substitution_length = len(pair[0][0])
-                    else:
-                        match = part.startswith(pair[0], index)
-                        substitution_length = len(pair[0])
-                    if match:
-                        matched_start = True
-                        if len(string_buffer) > 0:
-                            new_string.append(string_buffer)
-                            string_buffer = ""
-                        new_string.append(k)
-                        index += substitution_length
-                        break
-                if not matched_start:
-                    string_buffer += part[index]
+                match = match_substitution(trie, part, index)
+                if match is None:
                     index += 1
-            if len(string_buffer) > 0:
-                new_string.append(string_buffer)
+                else:
+                    if index > buffer_start:
+                        new_string.append(part[buffer_start:index])
+                    new_string.append(match[0])
+                    index += match[1]
+                    buffer_start = index
+            if len(part) > buffer_start:
+                new_string.append(part[buffer_start:])
 
     for k, elem in enumerate(new_string):
         if isinstance(elem, int):
@@ -580,6 +699,23 @@ def substitute(string, substitutions):
     return "".join(new_string)
 
 
+class SubstitutionTable:
+    """
+        List of substitutions, in the order they are applied, together
+        with the trie used by substitute to match them.
+    """
+
+    def __init__(self, substitutions):
+        self.substitutions = tuple(substitutions)
+        self.trie = create_substitution_trie(substitution_patterns(self.substitutions))
+
+    def __len__(self):
+        return len(self.substitutions)
+
+    def apply(self, string):
+        return substitute(string, self.substitutions, trie=self.trie)
+
+
 def compute_relative_tolerance_from_significant_decimals(string):
     rtol = None
     string = string.strip()
@@ -684,6 +820,202 @@ def sympy_to_latex(equation, symbols, settings=None):
     return latex_out
 
 
+class FrozenDict(dict):
+    """
+        Read-only dictionary, used for dictionaries (e.g. `symbol_dict`) in frozen
+        parsing parameters. It is a subclass of dict since sympy's `parse_expr`
+        requires `local_dict` to be a dict. Copies share the same instance.
+    """
+
+    def _read_only(self, *args, **kwargs):
+        raise TypeError("Frozen dictionaries cannot be changed.")
+
+    __setitem__ = __delitem__ = __ior__ = _read_only
+    clear = pop = popitem = setdefault = update = _read_only
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __reduce__(self):
+        return (FrozenDict, (dict(self),))
+
+
+class FrozenList(list):
+    """
+        Read-only list, used for lists (e.g. `unsplittable_symbols`) in frozen parsing
+        parameters. It is a subclass of list so that e.g. concatenation gives a list.
+        Copies share the same instance.
+    """
+
+    def _read_only(self, *args, **kwargs):
+        raise TypeError("Frozen lists cannot be changed.")
+
+    __setitem__ = __delitem__ = __iadd__ = __imul__ = _read_only
+    append = clear = extend = insert = pop = remove = reverse = sort = _read_only
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __reduce__(self):
+        return (FrozenList, (list(self),))
+
+
+def freeze_value(value):
+    '''
+    Returns value with all dictionaries, lists and sets (also nested ones)
+    replaced by frozen dictionaries, frozen lists and frozensets.
+    '''
+    if isinstance(value, (FrozenDict, FrozenList)):
+        return value
+    if isinstance(value, dict):
+        return FrozenDict({key: freeze_value(item) for (key, item) in value.items()})
+    if isinstance(value, list):
+        return FrozenList(freeze_value(item) for item in value)
+    if isinstance(value, tuple):
+        return tuple(freeze_value(item) for item in value)
+    if isinstance(value, set):
+        return frozenset(value)
+    return value
+
+
+class FrozenParsingParameters(Mapping):
+    """
+        Read-only parsing parameters. Values cannot be changed, instead
+        `override` returns new parsing parameters where the given keys
+        have new values and all other values are shared with the original.
+        This makes it possible to change e.g. `simplify` or `evaluate`
+        for a single parse without copying the symbol dictionary.
+        Nested values are frozen as well (see `freeze_value`) so that
+        the fingerprint cannot become stale.
+    """
+
+    __slots__ = ("_values", "_value_fingerprints", "_fingerprint")
+
+    def __init__(self, values=None, **overrides):
+        values = {**(values if values is not None else {}), **overrides}
+        self._values = {key: freeze_value(value) for (key, value) in values.items()}
+        self._value_fingerprints = dict()
+        self._fingerprint = None
+
+    def __getitem__(self, key):
+        return self._values[key]
+
+    def __iter__(self):
+        return iter(self._values)
+
+    def __len__(self):
+        return len(self._values)
+
+    def __repr__(self):
+        return f"FrozenParsingParameters({self._values!r})"
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def override(self, **overrides):
+        # The values of self are already frozen, only the overrides need to be frozen
+        overridden = FrozenParsingParameters(overrides)
+        overridden._values = {**self._values, **overridden._values}
+        # Fingerprints of shared values are still valid
+        overridden._value_fingerprints = {key: value for (key, value) in self._value_fingerprints.items() if key not in overrides}
+        return overridden
+
+    def fingerprint(self):
+        if self._fingerprint is None:
+            for key in self._values.keys():
+                if key not in self._value_fingerprints:
+                    self._value_fingerprints[key] = value_fingerprint(key, self._values[key])
+            self._fingerprint = combine_fingerprints(self._value_fingerprints)
+        return self._fingerprint
+
+
+def freeze_parsing_params(parsing_params):
+    '''
+    Returns parsing_params as FrozenParsingParameters. Nested values are
+    frozen as well since they are shared between all overrides.
+    '''
+    if isinstance(parsing_params, FrozenParsingParameters):
+        return parsing_params
+    return FrozenParsingParameters(parsing_params)
+
+
+def is_callable_value(value):
+    # Sympy classes and expressions (e.g. Function('f') or symbols) are callable
+    # but have a stable repr, only other callables need to be compared by identity
+    return callable(value) and not isinstance(value, (type, Basic))
+
+
+def callable_name(value):
+    return getattr(value, "__qualname__", type(value).__qualname__)
+
+
+def value_callables(value):
+    if is_callable_value(value):
+        return (value,)
+    if isinstance(value, (tuple, list)):
+        return tuple(item for item in value if is_callable_value(item))
+    return tuple()
+
+
+def value_fingerprint(key, value):
+    '''
+    Returns a string that identifies value. The repr of a callable includes its id,
+    which can be reused when the callable is freed, so callables are only described
+    by name here and are instead compared by identity, see parsing_params_callables.
+    '''
+    if value_callables(value):
+        items = (value,) if is_callable_value(value) else value
+        return repr(tuple(callable_name(item) if is_callable_value(item) else item for item in items))
+    if key == "symbol_dict":
+        return repr(sorted((name, srepr(symbol)) for (name, symbol) in value.items()))
+    if isinstance(value, (set, frozenset)):
+        return repr(sorted(value, key=repr))
+    if isinstance(value, dict):
+        return repr(sorted(value.items(), key=repr))
+    return repr(value)
+
+
+def combine_fingerprints(value_fingerprints):
+    content = repr(sorted(value_fingerprints.items()))
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def parsing_params_fingerprint(parsing_params):
+    '''
+    Returns a string that identifies the parsing parameters, i.e. parsing parameters
+    with the same fingerprint will give the same result when used to parse an expression.
+    The fingerprint is only computed once for frozen parsing parameters.
+    '''
+    if isinstance(parsing_params, FrozenParsingParameters):
+        return parsing_params.fingerprint()
+    # Values are frozen first so that the fingerprint is the same as for frozen parsing parameters
+    return combine_fingerprints({key: value_fingerprint(key, freeze_value(value)) for (key, value) in parsing_params.items()})
+
+
+def parsing_params_callables(parsing_params):
+    '''
+    Returns the callables (e.g. extra transformations) in the parsing parameters.
+    They are part of the parse cache keys so that the cache entries are only shared
+    between parsing parameters that use the same callables, and so that the callables
+    are kept alive (and their ids cannot be reused) as long as the entries are cached.
+    '''
+    return tuple((key, value_callables(parsing_params[key])) for key in sorted(parsing_params.keys()) if value_callables(parsing_params[key]))
+
+
+def override_parsing_params(parsing_params, **overrides):
+    '''
+    Returns parsing parameters where the values for the given keys have been
+    replaced, parsing_params itself is not changed.
+    '''
+    return freeze_parsing_params(parsing_params).override(**overrides)
+
+
 def create_sympy_parsing_params(params, unsplittable_symbols=tuple(), symbol_assumptions=tuple()):
     '''
     Input:
@@ -796,7 +1128,89 @@ def preprocess_expression(name, expr, parameters):
     success = feedback is None
     return success, expr, feedback
 
+# Cache for parsed expressions, the keys are the expression string, the fingerprint
+# of the parsing parameters and the callables in the parsing parameters. Sympy expressions are immutable so they can be shared
+# safely, sets of expressions are stored as frozensets and copied when returned.
+parse_cache = LRUCache(maxsize=2048)
+
+
 def parse_expression(expr_string, parsing_params):
+    '''
+    Input:
+        expr_string    : string to be parsed into a sympy expression
+        parsing_params : dictionary that contains parsing parameters
+    Output:
+        sympy expression created by parsing expr configured according
+        to the parameters in parsing_params
+    Remark:
+        Results are cached in parse_cache, see parse_expression_uncached.
+    '''
+    with span("parse_expression", category="parse") as attributes:
+        if tracing_enabled():
+            attributes["expression"] = str(expr_string)
+        if parse_cache.maxsize <= 0:
+            attributes["cached"] = False
+            return parse_expression_uncached(expr_string, parsing_params)
+        key = (
+            expr_string if isinstance(expr_string, str) else tuple(expr_string),
+            parsing_params_fingerprint(parsing_params),
+            parsing_params_callables(parsing_params),
+        )
+        attributes["cached"] = True
+
+        def parse():
+            attributes["cached"] = False
+            parsed_expr = parse_expression_uncached(expr_string, parsing_params)
+            if isinstance(parsed_expr, set):
+                parsed_expr = frozenset(parsed_expr)
+            return parsed_expr
+
+        parsed_expr = parse_cache.get_or_compute(key, parse)
+        if isinstance(parsed_expr, frozenset):
+            parsed_expr = set(parsed_expr)
+        return parsed_expr
+
+
+# Cache for canonical forms, the keys are given by srepr of the expression
+canonical_form_cache = LRUCache(maxsize=1024)
+
+
+def canonical_form(expr, cancel=True, simplifications=2):
+    '''
+    Input:
+        expr            : sympy expression
+        cancel          : if True, expr.cancel() is applied before simplification
+        simplifications : number of times simplify is applied
+    Output:
+        The simplified expression, for the default arguments this is the same as
+        expr.cancel().simplify().simplify(). Results are cached in canonical_form_cache.
+    '''
+    with span("simplify", category="simplify", simplifications=simplifications) as attributes:
+        attributes["cached"] = True
+
+        def compute():
+            attributes["cached"] = False
+            result = expr.cancel() if cancel else expr
+            for _ in range(simplifications):
+                result = result.simplify()
+            return result
+
+        if canonical_form_cache.maxsize <= 0 or not isinstance(expr, Basic):
+            return compute()
+        return canonical_form_cache.get_or_compute((cancel, simplifications, srepr(expr)), compute)
+
+
+def traced_simplify(expr, **kwargs):
+    '''
+    Returns expr.simplify(**kwargs). Used instead of calling simplify directly
+    (when the result should not be cached, see canonical_form) so that the
+    time spent simplifying is recorded in a span.
+    '''
+    with span("simplify", category="simplify", simplifications=1, cached=False):
+        return expr.simplify(**kwargs)
+
+
+def parse_expression_uncached(expr_string, parsing_params):
     '''
     Input:
         expr_string    : string to be parsed into a sympy expression
@@ -811,7 +1225,8 @@ def parse_expression(expr_string, parsing_params):
     strict_syntax = parsing_params.get("strict_syntax", False)
     extra_transformations = parsing_params.get("extra_transformations", ())
     unsplittable_symbols = parsing_params.get("unsplittable_symbols", ())
-    symbol_dict = parsing_params.get("symbol_dict", {})
+    # parse_expr temporarily adds entries to local_dict, so the (frozen) symbol_dict is copied
+    symbol_dict = dict(parsing_params.get("symbol_dict", {}))
     separate_unsplittable_symbols = [(x, " " + x + " ") for x in unsplittable_symbols]
     substitutions = separate_unsplittable_symbols
 
@@ -0,0 +1,101 @@
+import random
+
+import mpmath
+from sympy import Expr, lambdify
+
+# Seed used to generate the evaluation points, a fixed seed is used so that
+# the same comparison always gives the same result.
+numeric_probe_seed = 0
+
+# Number of significant digits used when evaluating expressions.
+numeric_probe_precision = 30
+
+# Two values are considered to be clearly different if the difference between
+# them is larger than this relative to the magnitude of the values.
+numeric_probe_tolerance = 1e-8
+
+
+def sample_value(symbol, generator, complex_numbers=False):
+    '''
+    Input:
+        symbol          : sympy symbol that a random value should be generated for
+        generator       : random.Random instance used to generate the value
+        complex_numbers : if True then symbols that are not known to be real
+                          will get complex values
+    Output:
+        value that is consistent with the assumptions for the symbol
+    '''
+    if symbol.is_integer:
+        if symbol.is_positive:
+            return generator.randint(1, 9)
+        elif symbol.is_nonnegative:
+            return generator.randint(0, 9)
+        elif symbol.is_negative:
+            return -generator.randint(1, 9)
+        elif symbol.is_nonpositive:
+            return -generator.randint(0, 9)
+        return generator.randint(-9, 9)
+    if symbol.is_positive or symbol.is_nonnegative:
+        return mpmath.mpf(generator.uniform(0.1, 2))
+    if symbol.is_negative or symbol.is_nonpositive:
+        return -mpmath.mpf(generator.uniform(0.1, 2))
+    if complex_numbers is True and not symbol.is_real:
+        return mpmath.mpc(generator.uniform(-2, 2), generator.uniform(-2, 2))
+    return mpmath.mpf(generator.uniform(-2, 2))
+
+
+def to_finite_number(value):
+    '''
+    Returns value as an mpmath number if it is a finite number, otherwise None.
+    '''
+    try:
+        value = +mpmath.mpmathify(value)
+    except Exception:
+        return None
+    if isinstance(value, (mpmath.mpf, mpmath.mpc)) and mpmath.isfinite(value):
+        return value
+    return None
+
+
+def numeric_probe(lhs_expr, rhs_expr, number_of_points=5, complex_numbers=False):
+    '''
+    Evaluates lhs_expr and rhs_expr at a number of randomly chosen points.
+    Input:
+        lhs_expr, rhs_expr : sympy expressions that should be compared
+        number_of_points   : number of points where the expressions are evaluated
+        complex_numbers    : if True, complex values are used for symbols that
+                             are not known to be real
+    Output:
+        False if the expressions are clearly different in at least one point,
+        True if the expressions are equal (up to numerical precision) in all points,
+        None if the expressions could not be compared numerically
+    '''
+    if not (isinstance(lhs_expr, Expr) and isinstance(rhs_expr, Expr)):
+        return None
+    symbols = sorted(lhs_expr.free_symbols.union(rhs_expr.free_symbols), key=str)
+    if any(not symbol.is_commutative for symbol in symbols):
+        return None
+    try:
+        lhs_function = lambdify(symbols, lhs_expr, modules="mpmath", dummify=True)
+        rhs_function = lambdify(symbols, rhs_expr, modules="mpmath", dummify=True)
+    except Exception:
+        return None
+    generator = random.Random(numeric_probe_seed)
+    compared_points = 0
+    with mpmath.workdps(numeric_probe_precision):
+        for _ in range(number_of_points):
+            point = [sample_value(symbol, generator, complex_numbers) for symbol in symbols]
+            try:
+                lhs_value = to_finite_number(lhs_function(*point))
+                rhs_value = to_finite_number(rhs_function(*point))
+            except Exception:
+                continue
+            if lhs_value is None or rhs_value is None:
+                continue
+            scale = max(1, abs(lhs_value), abs(rhs_value))
+            if abs(lhs_value-rhs_value) > numeric_probe_tolerance*scale:
+                return False
+            compared_points += 1
+    if compared_points == 0:
+        return None
+    return True
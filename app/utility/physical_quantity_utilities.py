@@ -1,9 +1,12 @@
 import re
 from enum import Enum
+from fractions import Fraction
 from .expression_utilities import (
     substitute,
     create_sympy_parsing_params,
-    parse_expression
+    freeze_parsing_params,
+    parse_expression,
+    traced_simplify
 )
 from .slr_parsing_utilities import (
     SLR_Parser,
@@ -16,6 +19,8 @@ from .slr_parsing_utilities import (
     create_node,
     ExprNode
 )
+from .cache_utilities import LRUCache
+from .syntactical_comparison_utilities import is_number_regex
 from .unit_system_conversions import\
     set_of_SI_prefixes, set_of_SI_base_unit_dimensions, set_of_derived_SI_units_in_SI_base_units,\
     set_of_common_units_in_SI, set_of_very_common_units_in_SI, set_of_imperial_units, conversion_to_base_si_units
@@ -38,22 +43,7 @@ class PhysicalQuantity:
     def __init__(self, name, parameters, ast_root, parser, messages=None, tag_handler=lambda x: x):
         self.name = name
         self.parameters = parameters
-        prefixes = set(x[0] for x in set_of_SI_prefixes)
-        fundamental_units = set(x[0] for x in set_of_SI_base_unit_dimensions)
-        units_string = parameters.get("units_string", "SI common imperial")
-        valid_units = set()
-        for key in units_sets_dictionary.keys():
-            if key in units_string:
-                for unit in units_sets_dictionary[key]:
-                    valid_units = valid_units.union(set((unit[0],)))
-        dimensions = set(x[2] for x in set_of_SI_base_unit_dimensions)
-        unsplittable_symbols = list(prefixes | fundamental_units | valid_units | dimensions)
-        symbol_assumptions = tuple((f'{s}', 'positive') for s in unsplittable_symbols)
-        self.parsing_params = create_sympy_parsing_params(
-            parameters,
-            unsplittable_symbols=unsplittable_symbols,
-            symbol_assumptions=symbol_assumptions,
-        )
+        self.parsing_params = quantity_parsing_params(parameters)
         if messages is None:
             self.messages = []
         else:
@@ -102,7 +92,8 @@ class PhysicalQuantity:
         value_latex = self.value_latex_string if self.value_latex_string is not None else ""
         unit_latex = self.unit_latex_string if self.unit_latex_string is not None else ""
         self.latex_string = value_latex+separator+unit_latex
-        self.standard_value, self.standard_unit, self.expanded_unit, self.dimension, self.converted_unit_factor = self._all_forms()
+        self.standard_value, self.standard_unit, self.expanded_unit, self.dimension, self.converted_unit_factor, self.unit_vector = self._all_forms()
+        self.exact_value = self._exact_value()
         return
 
     def _rotate(self, direction):
@@ -156,17 +147,9 @@ class PhysicalQuantity:
     def _value_latex(self, parameters):
         if self.value is not None:
             preview_parameters = {**parameters}
-            prefixes = set(x[0] for x in set_of_SI_prefixes)
-            fundamental_units = set(x[0] for x in set_of_SI_base_unit_dimensions)
             units_string = parameters.get("units_string", "SI common imperial")
-            valid_units = set()
-            for key in units_sets_dictionary.keys():
-                if key in units_string:
-                    for unit in units_sets_dictionary[key]:
-                        valid_units = valid_units.union(set((unit[0], unit[1])+unit[3]+unit[4]))
-            dimensions = set(x[2] for x in set_of_SI_base_unit_dimensions)
-            unsplittable_symbols = list(prefixes | fundamental_units | valid_units | dimensions)
-            preview_parameters.update({"reserved_keywords": preview_parameters.get("reserved_keywords", [])+unsplittable_symbols})
+            _, preview_symbols = SLR_quantity_symbols(units_string)
+            preview_parameters.update({"reserved_keywords": preview_parameters.get("reserved_keywords", [])+list(preview_symbols)})
             if "rtol" not in preview_parameters.keys():
                 preview_parameters.update({"rtol": 1e-12})
             original_string = self.value.original_string()
@@ -200,12 +183,22 @@ class PhysicalQuantity:
             return [content]
 
     def _expand_units(self, node):
-        if node.label == "UNIT" and len(node.children) == 0 and node.content not in [x[0] for x in set_of_SI_base_unit_dimensions]:
-            expanded_unit_content = conversion_to_base_si_units[node.content]
-            node = self.parser.parse(self.parser.scan(expanded_unit_content))[0]
-        for k, child in enumerate(node.children):
-            node.children[k] = self._expand_units(child)
-        return node
+        units_string = self.parameters.get("units_string", "SI common imperial")
+        strictness = self.parameters.get("strictness", "natural")
+        return expand_units(node, self.parser, SLR_generate_unit_expansions(units_string, strictness))
+
+    def _exact_value(self):
+        """
+            Returns the value converted to base SI units as a Fraction if the value
+            is a plain number and the unit has an exact scale (see `unit_vector`),
+            otherwise None.
+        """
+        if self.value is None or self.unit_vector is None or self.parameters.get("is_latex", False):
+            return None
+        value = exact_number(self.value.content_string(), e_notation=not self.parsing_params.get("elementary_functions", False))
+        if value is None:
+            return None
+        return value*self.unit_vector[1]
 
     def _all_forms(self):
         parsing_params = self.parsing_params
@@ -218,9 +211,11 @@ class PhysicalQuantity:
         expanded_unit = None
         converted_dimension = parse_expression("1", parsing_params)
         converted_unit_factor = parse_expression("1", parsing_params)
+        converted_unit_vector = ((0,)*len(base_units_order), Fraction(1))
         if self.unit is not None:
             converted_unit = self.unit.copy()
             expanded_unit = self._expand_units(converted_unit)
+            converted_unit_vector = unit_vector(expanded_unit)
             converted_unit_string = expanded_unit.content_string()
             try:
                 expanded_unit = parse_expression(converted_unit_string, parsing_params)
@@ -230,17 +225,107 @@ class PhysicalQuantity:
             base_unit_dimensions = [(base_unit[0], base_unit[2]) for base_unit in set_of_SI_base_unit_dimensions]
             if self.value is not None:
                 substitution_dict = {symbol: 1 for symbol in converted_unit.free_symbols if str(symbol) in [x[0] for x in set_of_SI_base_unit_dimensions]}
-                converted_unit_factor = converted_unit.subs(substitution_dict).simplify()
-                converted_unit = (converted_unit/converted_unit_factor).simplify(rational=True)
+                converted_unit_factor = traced_simplify(converted_unit.subs(substitution_dict))
+                converted_unit = traced_simplify(converted_unit/converted_unit_factor, rational=True)
                 converted_value = "("+str(converted_value)+")*("+str(converted_unit_factor)+")"
             converted_dimension = substitute(converted_unit_string, base_unit_dimensions)
             converted_dimension = parse_expression(converted_dimension, parsing_params)
         if converted_value is not None:
             converted_value = parse_expression(converted_value, parsing_params)
-        return converted_value, converted_unit, expanded_unit, converted_dimension, converted_unit_factor
+        return converted_value, converted_unit, expanded_unit, converted_dimension, converted_unit_factor, converted_unit_vector
+
+
+# Cache for the names that are not split when quantities are parsed, the keys are the units string
+quantity_symbols_cache = LRUCache(maxsize=32)
+
+# Cache for the parsing parameters used by PhysicalQuantity, the keys are the units string and the
+# values of the parameters that the parsing parameters depend on (see quantity_parsing_params_keys).
+# The parsing parameters are frozen so they can be shared by all quantities.
+quantity_parsing_params_cache = LRUCache(maxsize=64)
+
+# Evaluation parameters that are used by create_sympy_parsing_params
+quantity_parsing_params_keys = (
+    "complexNumbers",
+    "convention",
+    "elementary_functions",
+    "rationalise",
+    "reserved_keywords",
+    "simplify",
+    "specialFunctions",
+    "strict_syntax",
+    "symbol_assumptions",
+    "symbols",
+)
+
+
+def SLR_quantity_symbols(units_string):
+    '''
+    Returns the names of the prefixes, base units, units and dimensions for the
+    units string as a pair of tuples (symbols, preview_symbols), where preview_symbols
+    also contains the short forms and alternative names of the units.
+    Results are cached in quantity_symbols_cache.
+    '''
+    def compute():
+        prefixes = set(x[0] for x in set_of_SI_prefixes)
+        fundamental_units = set(x[0] for x in set_of_SI_base_unit_dimensions)
+        dimensions = set(x[2] for x in set_of_SI_base_unit_dimensions)
+        valid_units = set()
+        preview_units = set()
+        for key in units_sets_dictionary.keys():
+            if key in units_string:
+                for unit in units_sets_dictionary[key]:
+                    valid_units.add(unit[0])
+                    preview_units.update((unit[0], unit[1])+unit[3]+unit[4])
+        symbols = tuple(sorted(prefixes | fundamental_units | valid_units | dimensions))
+        preview_symbols = tuple(sorted(prefixes | fundamental_units | preview_units | dimensions))
+        return symbols, preview_symbols
+    return quantity_symbols_cache.get_or_compute(units_string, compute)
+
+
+def create_quantity_parsing_params(parameters):
+    units_string = parameters.get("units_string", "SI common imperial")
+    unsplittable_symbols, _ = SLR_quantity_symbols(units_string)
+    symbol_assumptions = tuple((f'{s}', 'positive') for s in unsplittable_symbols)
+    return freeze_parsing_params(create_sympy_parsing_params(
+        parameters,
+        unsplittable_symbols=unsplittable_symbols,
+        symbol_assumptions=symbol_assumptions,
+    ))
+
+
+def quantity_parsing_params(parameters):
+    '''
+    Returns the (frozen) parsing parameters used for quantities. They only depend
+    on the units string and the parameters in quantity_parsing_params_keys, so they
+    are created once and shared by all quantities with the same values.
+    '''
+    key = (parameters.get("units_string", "SI common imperial"),)\
+        + tuple(repr(parameters.get(name, None)) for name in quantity_parsing_params_keys)
+    return quantity_parsing_params_cache.get_or_compute(key, lambda: create_quantity_parsing_params(parameters))
+
+
+# Cache for the unit dictionaries and for the quantity parsers, the keys are the units string
+# and the strictness. Neither the dictionaries nor the parsers are changed after they have been
+# created, so they can be shared by all requests.
+unit_dictionaries_cache = LRUCache(maxsize=32)
+quantity_parser_cache = LRUCache(maxsize=32)
 
 
 def SLR_generate_unit_dictionaries(units_string, strictness):
+    '''
+    Returns dictionaries of units, prefixed units, units that are only
+    recognised at the end of a string and prefixed versions of those.
+    Results are cached in unit_dictionaries_cache and must not be changed.
+    '''
+    if strictness == "legacy":
+        strictness = "natural"
+    return unit_dictionaries_cache.get_or_compute(
+        (units_string, strictness),
+        lambda: SLR_generate_unit_dictionaries_uncached(units_string, strictness)
+    )
+
+
+def SLR_generate_unit_dictionaries_uncached(units_string, strictness):
 
     if strictness == "legacy":
         strictness = "natural"
@@ -299,6 +384,215 @@ def SLR_generate_unit_dictionaries(units_string, strictness):
     return {**units, **units_short_to_long}, prefixed_units, units_end, prefixed_units_end
 
 
+# Names of the base SI units, these are not expanded by expand_units
+base_unit_names = frozenset(x[0] for x in set_of_SI_base_unit_dimensions)
+
+# Cache for tables of units expanded to base SI units, the keys are the units string and the strictness
+unit_expansions_cache = LRUCache(maxsize=32)
+
+
+def SLR_generate_unit_expansions(units_string, strictness):
+    """
+        Returns the table of units expanded to base SI units for the units string and
+        strictness. The table is a dictionary from unit names to expanded units (as
+        ExprNode) that is filled by expand_unit. The table is shared by all quantities
+        with the same units string and strictness, so the nodes in it must not be changed.
+    """
+    if strictness == "legacy":
+        strictness = "natural"
+    return unit_expansions_cache.get_or_compute((units_string, strictness), dict)
+
+
+def expand_unit(unit, parser, expansions):
+    """
+        Returns the unit expanded to base SI units (all units in the expansion are also
+        expanded). The expansion is parsed the first time it is needed and then stored
+        in expansions, see SLR_generate_unit_expansions.
+    """
+    expanded_unit = expansions.get(unit, None)
+    if expanded_unit is None:
+        expanded_unit = parser.parse(parser.scan(conversion_to_base_si_units[unit]))[0]
+        expanded_unit = expand_units(expanded_unit, parser, expansions)
+        expansions[unit] = expanded_unit
+    return expanded_unit
+
+
+def expand_units(node, parser, expansions):
+    """
+        Replaces each unit in the tree (except the base SI units) with a copy of its
+        expansion to base SI units. The nodes in the tree are changed in place.
+    """
+    if node.label == "UNIT" and len(node.children) == 0 and node.content not in base_unit_names:
+        return expand_unit(node.content, parser, expansions).copy()
+    for k, child in enumerate(node.children):
+        node.children[k] = expand_units(child, parser, expansions)
+    return node
+
+
+# Order of the base SI units in the exponent vectors returned by unit_vector
+base_units_order = tuple(sorted(base_unit_names))
+
+
+def unit_vector(node):
+    """
+        Returns (exponents, scale) for a unit that has been expanded to base SI units
+        (see expand_units), exponents is a tuple with the exponent of each base unit (in
+        the order given by base_units_order) and scale is a Fraction. Returns None if the
+        unit cannot be represented this way (e.g. if it contains pi or has non-integer
+        exponents) or if the content string of the tree could be parsed with another
+        order of operations than the tree has (e.g. a/b*c for a/(b*c)).
+    """
+    label = node.label
+    children = node.children
+    if label == "UNIT" and len(children) == 0:
+        if node.content not in base_unit_names:
+            return None
+        return tuple(1 if unit == node.content else 0 for unit in base_units_order), Fraction(1)
+    elif label == "NUMBER" and len(children) == 0:
+        try:
+            scale = Fraction(node.content)
+        except (ValueError, ZeroDivisionError):
+            return None
+        if scale == 0:
+            return None
+        return (0,)*len(base_units_order), scale
+    elif label == "GROUP" and len(children) == 1:
+        return unit_vector(children[0])
+    elif label in ["PRODUCT", "SPACE", "SOLIDUS"] and len(children) == 2:
+        if label == "SOLIDUS" and children[1].label in ["PRODUCT", "SPACE", "SOLIDUS"]:
+            return None
+        if label == "SPACE" and children[0].label == "SOLIDUS":
+            return None
+        lhs = unit_vector(children[0])
+        rhs = unit_vector(children[1])
+        if lhs is None or rhs is None:
+            return None
+        if label == "SOLIDUS":
+            return tuple(a-b for (a, b) in zip(lhs[0], rhs[0])), lhs[1]/rhs[1]
+        return tuple(a+b for (a, b) in zip(lhs[0], rhs[0])), lhs[1]*rhs[1]
+    elif label == "POWER" and len(children) == 2:
+        if children[0].label not in ["UNIT", "NUMBER", "GROUP"] or children[1].label not in ["NUMBER", "GROUP"]:
+            return None
+        base = unit_vector(children[0])
+        exponent = unit_vector(children[1])
+        if base is None or exponent is None or any(exponent[0]) or exponent[1].denominator != 1:
+            return None
+        n = int(exponent[1])
+        return tuple(n*a for a in base[0]), base[1]**n
+    return None
+
+
+def exact_number(string, e_notation=True):
+    """
+        Returns the number as a Fraction if the string is a plain number (see
+        `is_number_regex`), e.g. `1.24`, `-3.0e8` or `1.2*10**5`, otherwise None.
+        If e_notation is False, numbers like `3.0e8` are not accepted (when elementary
+        functions are enabled SymPy reads `e` as Euler's number).
+    """
+    string = string.strip()
+    match = re.fullmatch(is_number_regex, string)
+    if match is None or len(string) == 0:
+        return None
+    mantissa, separator, exponent = re.fullmatch(r"([^ *eE]+)( *(?:e|E|\*10\^|\*10\*\*))?(.*)", string).groups()
+    if separator is None:
+        return Fraction(mantissa)
+    if separator.strip() in ["e", "E"] and (separator != "e" or not e_notation):
+        # SymPy reads e.g. `1.2 e5` as a product with Euler's number
+        return None
+    return Fraction(mantissa)*Fraction(10)**int(exponent)
+
+
+def precompute_unit_expansions(units_string, strictness):
+    """
+        Expands all units in the units string, so that expanding units in quantities
+        with the same units string and strictness only requires table lookups.
+    """
+    parser = SLR_quantity_parser({"units_string": units_string, "strictness": strictness})
+    expansions = SLR_generate_unit_expansions(units_string, strictness)
+    units_dictionary, prefixed_units_dictionary, _, _ = SLR_generate_unit_dictionaries(units_string, strictness)
+    for unit in set(units_dictionary.values()) | set(prefixed_units_dictionary.values()):
+        if unit not in base_unit_names:
+            expand_unit(unit, parser, expansions)
+
+
+# Key used for the units stored in the nodes of a unit trie, see create_unit_trie
+_unit_end = None
+
+# Cache for unit tries, the keys are the units string and the strictness
+unit_trie_cache = LRUCache(maxsize=32)
+
+
+def create_unit_trie(units, units_end):
+    """
+        Creates a trie where each node is a dictionary from characters to nodes.
+        A node where a unit name ends stores [unit, end unit] where unit is the value
+        for the name in units and end unit is the value for the name in units_end
+        (None if the name is not a key in the dictionary).
+    """
+    trie = dict()
+    for (k, dictionary) in enumerate([units, units_end]):
+        for (name, unit) in dictionary.items():
+            node = trie
+            for c in name:
+                node = node.setdefault(c, dict())
+            node.setdefault(_unit_end, [None, None])[k] = unit
+    return trie
+
+
+def SLR_generate_unit_trie(units_string, strictness):
+    """
+        Returns the unit trie used by the quantity parser and the set of characters
+        used in unit names. Results are cached in unit_trie_cache and must not be changed.
+    """
+    if strictness == "legacy":
+        strictness = "natural"
+
+    def create():
+        units_dictionary, prefixed_units_dictionary, units_end_dictionary, prefixed_units_end_dictionary = \
+            SLR_generate_unit_dictionaries(units_string, strictness)
+        if strictness == "strict":
+            units = {**units_dictionary, **prefixed_units_dictionary}
+            units_end = dict()
+        elif strictness == "natural":
+            units = {**prefixed_units_dictionary, **units_dictionary}
+            units_end = {**prefixed_units_end_dictionary, **units_end_dictionary}
+        chars_in_keys = frozenset(c for key in list(units.keys())+list(units_end.keys()) for c in key)
+        return create_unit_trie(units, units_end), chars_in_keys
+
+    return unit_trie_cache.get_or_compute((units_string, strictness), create)
+
+
+def match_unit(trie, string, chars_in_keys=None):
+    """
+        Returns (token, unit) for the unit that string starts with, or (None, None) if
+        string does not start with a unit. If chars_in_keys is given, the candidate is
+        the part of string before the first character that is not in chars_in_keys,
+        and if the whole candidate is an end form of a unit that unit is used.
+        Otherwise the longest unit name that string starts with is used.
+    """
+    node = trie
+    token = None
+    unit = None
+    length = 0
+    for c in string:
+        if chars_in_keys is not None and c not in chars_in_keys:
+            break
+        node = node.get(c, None)
+        if node is None:
+            # No unit name starts with the candidate, so it cannot be an end form either
+            return token, unit
+        length += 1
+        units = node.get(_unit_end, None)
+        if units is not None and units[0] is not None:
+            token = string[0:length]
+            unit = units[0]
+    if length > 0:
+        units = node.get(_unit_end, None)
+        if units is not None and units[1] is not None:
+            return string[0:length], units[1]
+    return token, unit
+
+
 def set_tags(strictness):
     def tag_handler(node):
         tags = set()
@@ -342,61 +636,44 @@ def set_tags(strictness):
 
 
 def SLR_quantity_parser(parameters):
+    '''
+    Returns the quantity parser for the units string and strictness in parameters.
+    The parser only depends on these two parameters, so it is created once and
+    then cached in quantity_parser_cache, see create_SLR_quantity_parser.
+    '''
     units_string = parameters.get("units_string", "SI common imperial")
     strictness = parameters.get("strictness", "natural")
     if strictness == "legacy":
         strictness = "natural"
-    units_dictionary, prefixed_units_dictionary, units_end_dictionary, prefixed_units_end_dictionary = \
-        SLR_generate_unit_dictionaries(units_string, strictness)
-    max_unit_name_length = max(len(x) for x in [units_dictionary.keys()]+[units_end_dictionary.keys()])
+    return quantity_parser_cache.get_or_compute(
+        (units_string, strictness),
+        lambda: create_SLR_quantity_parser(units_string, strictness)
+    )
 
-    if strictness == "strict":
-        units_dictionary.update(prefixed_units_dictionary)
 
+def warm_up_quantity_parsers(units_strings=("SI common imperial",), strictnesses=("strict", "natural"), precompute_expansions=True):
+    '''
+    Creates and caches the quantity parsers for all combinations of the given
+    units strings and strictnesses, so that the first physical quantity request
+    does not have to wait for the parsers to be created. Unless precompute_expansions
+    is False, the expansions of all units to base SI units are also computed.
+    '''
+    for units_string in units_strings:
+        for strictness in strictnesses:
+            SLR_quantity_parser({"units_string": units_string, "strictness": strictness})
+            if precompute_expansions:
+                precompute_unit_expansions(units_string, strictness)
+
+
+def create_SLR_quantity_parser(units_string, strictness):
+    unit_trie, chars_in_keys = SLR_generate_unit_trie(units_string, strictness)
+
+    if strictness == "strict":
         def starts_with_unit(string):
-            token = None
-            unit = None
-            for k in range(max_unit_name_length, -1, -1):
-                unit = units_dictionary.get(string[0:k+1], None)
-                if unit is not None:
-                    token = string[0:k+1]
-                    break
-            return token, unit
+            return match_unit(unit_trie, string)
     elif strictness == "natural":
-        chars_in_keys = set()
-        for key in {
-            **units_dictionary,
-            **prefixed_units_dictionary,
-            **prefixed_units_end_dictionary,
-            **units_end_dictionary
-        }.keys():
-            for c in key:
-                chars_in_keys.add(c)
-
         def starts_with_unit(string):
-            units_end = {**prefixed_units_end_dictionary, **units_end_dictionary}
-            units = {**prefixed_units_dictionary, **units_dictionary}
-            token = None
-            unit = None
-            end_point = len(string)
-            for k, c in enumerate(string):
-                if c not in chars_in_keys:
-                    end_point = k
-                    break
-            if end_point > 0:
-                local_string = string[0:end_point]
-                # Check if string is end unit alternative
-                unit = units_end.get(local_string, None)
-                if unit is not None:
-                    token = local_string
-                else:
-                    # Check if string starts with unit
-                    for k in range(len(local_string), -1, -1):
-                        unit = units.get(local_string[0:k], None)
-                        if unit is not None:
-                            token = local_string[0:k]
-                            break
-            return token, unit
+            return match_unit(unit_trie, string, chars_in_keys)
 
     def starts_with_number(string):
         match_content = re.match('^-?(0|[1-9]\d*)?(\.\d+)?(?<=\d)(e-?(0|[1-9]\d*))?', string)
@@ -509,74 +786,114 @@ def expression_preprocess(name, expr, parameters):
 
     return True, expr, None
 
-def preprocess_legacy(expr, parameters):
-    prefix_data = {(p[0], p[1], tuple(), p[3]) for p in set_of_SI_prefixes}
-    prefixes = []
-    for prefix in prefix_data:
-        prefixes = prefixes + [prefix[0]] + list(prefix[-1])
-    prefix_short_forms = [prefix[1] for prefix in prefix_data]
-    unit_data = set_of_SI_base_unit_dimensions \
-                | set_of_derived_SI_units_in_SI_base_units \
-                | set_of_common_units_in_SI \
-                | set_of_very_common_units_in_SI \
-                | set_of_imperial_units
-    unit_long_forms = prefixes
-    for unit in unit_data:
-        unit_long_forms = unit_long_forms + [unit[0]] + list(unit[-2]) + list(unit[-1])
-    unit_long_forms = "(" + "|".join(unit_long_forms) + ")"
+def legacy_alternatives(names):
+    # Longer names first so that the alternation prefers the longest name,
+    # which unit is matched does not change the result of the rewrites
+    return "(" + "|".join(sorted(set(names), key=lambda x: (-len(x), x))) + ")"
+
+
+# Names used by the rewrite rules of preprocess_legacy
+legacy_prefixes = [name for prefix in set_of_SI_prefixes for name in (prefix[0],)+tuple(prefix[3])]
+legacy_prefix_short_forms = [prefix[1] for prefix in set_of_SI_prefixes]
+legacy_unit_data = set_of_SI_base_unit_dimensions \
+    | set_of_derived_SI_units_in_SI_base_units \
+    | set_of_common_units_in_SI \
+    | set_of_very_common_units_in_SI \
+    | set_of_imperial_units
+legacy_unit_long_forms = legacy_prefixes + [name for unit in legacy_unit_data for name in [unit[0]] + list(unit[-2]) + list(unit[-1])]
+legacy_unit_short_forms = [unit[1] for unit in legacy_unit_data]
+
+
+def longest_name_length(names):
+    return max(len(name) for name in names)
+
+
+def resume_before(length):
+    """
+        Returns a function that gives the position where the search for the next match
+        should start after a rewrite, for rules where matches are at most length
+        characters long. Matches that end before the rewritten part of the string
+        would already have been found, so there is no need to search from the start.
+    """
+    return lambda string, match: match.start()-length
+
+
+def resume_before_spaces(string, match):
+    # A match for rule 1 can only start at the last non-space character before the rewrite
+    return len(string[:match.start()].rstrip(" "))-1
+
+
+# Rewrite rules used by preprocess_legacy, in the order they are applied. Each rule is
+# (pattern, rewrite, resume), rewrite returns the string with the match rewritten and
+# resume returns the position where the search for the next match starts.
+legacy_rewrite_rules = [
     # Rewrite any expression on the form "*UNIT" (but not "**UNIT") as " UNIT"
     # Example: "newton*metre" ---> "newton metre"
-    search_string = r"(?<!\*)\* *" + unit_long_forms
-    match_content = re.search(search_string, expr[1:])
-    while match_content is not None:
-        expr = expr[0:match_content.span()[0] + 1] + match_content.group().replace("*", " ") + expr[
-                                                                                               match_content.span()[
-                                                                                                   1] + 1:]
-        match_content = re.search(search_string, expr[1:])
-    prefixes = "(" + "|".join(prefixes) + ")"
+    (
+        re.compile(r"(?<!\*)\* *" + legacy_alternatives(legacy_unit_long_forms)),
+        lambda string, match: string[:match.start()] + match.group().replace("*", " ") + string[match.end():],
+        resume_before_spaces,
+    ),
     # Rewrite any expression on the form "PREFIX UNIT" as "PREFIXUNIT"
     # Example: "kilo metre" ---> "kilometre"
-    search_string = prefixes + " " + unit_long_forms
-    match_content = re.search(search_string, expr)
-    while match_content is not None:
-        expr = expr[0:match_content.span()[0]] + " " + "".join(match_content.group().split()) + expr[
-                                                                                                match_content.span()[
-                                                                                                    1]:]
-        match_content = re.search(search_string, expr)
-    unit_short_forms = [u[1] for u in unit_data]
-    short_forms = "(" + "|".join(list(set(prefix_short_forms + unit_short_forms))) + ")"
+    (
+        re.compile(legacy_alternatives(legacy_prefixes) + " " + legacy_alternatives(legacy_unit_long_forms)),
+        lambda string, match: string[:match.start()] + " " + "".join(match.group().split()) + string[match.end():],
+        resume_before(longest_name_length(legacy_prefixes)+1+longest_name_length(legacy_unit_long_forms)),
+    ),
     # Add space before short forms of prefixes or unit names if they are preceded by numbers or multiplication
     # Example: "100Pa" ---> "100 Pa"
-    search_string = r"[0-9\*\(\)]" + short_forms
-    match_content = re.search(search_string, expr)
-    while match_content is not None:
-        expr = expr[0:match_content.span()[0] + 1] + " " + expr[match_content.span()[0] + 1:]
-        match_content = re.search(search_string, expr)
+    (
+        re.compile(r"[0-9\*\(\)]" + legacy_alternatives(legacy_prefix_short_forms + legacy_unit_short_forms)),
+        lambda string, match: string[:match.start()+1] + " " + string[match.start()+1:],
+        resume_before(1+longest_name_length(legacy_prefix_short_forms + legacy_unit_short_forms)),
+    ),
     # Remove space after prefix short forms if they are preceded by numbers, multiplication or space
     # Example: "100 m Pa" ---> "100 mPa"
-    prefix_short_forms = "(" + "|".join(prefix_short_forms) + ")"
-    search_string = r"[0-9\*\(\) ]" + prefix_short_forms + " "
-    match_content = re.search(search_string, expr)
-    while match_content is not None:
-        expr = expr[0:match_content.span()[0] + 1] + match_content.group()[0:-1] + expr[match_content.span()[1]:]
-        match_content = re.search(search_string, expr)
+    (
+        re.compile(r"[0-9\*\(\) ]" + legacy_alternatives(legacy_prefix_short_forms) + " "),
+        lambda string, match: string[:match.start()+1] + match.group()[0:-1] + string[match.end():],
+        resume_before(2+longest_name_length(legacy_prefix_short_forms)),
+    ),
     # Remove multiplication and space after prefix short forms if they are preceded by numbers, multiplication or space
     # Example:  "100 m* Pa" ---> "100 mPa"
-    search_string = r"[0-9\*\(\) ]" + prefix_short_forms + "\* "
-    match_content = re.search(search_string, expr)
-    while match_content is not None:
-        expr = expr[0:match_content.span()[0] + 1] + match_content.group()[0:-2] + expr[match_content.span()[1]:]
-        match_content = re.search(search_string, expr)
+    (
+        re.compile(r"[0-9\*\(\) ]" + legacy_alternatives(legacy_prefix_short_forms) + r"\* "),
+        lambda string, match: string[:match.start()+1] + match.group()[0:-2] + string[match.end():],
+        resume_before(3+longest_name_length(legacy_prefix_short_forms)),
+    ),
     # Replace multiplication followed by space before unit short forms with only spaces if they are preceded by numbers or space
     # Example:  "100* Pa" ---> "100 Pa"
-    unit_short_forms = "(" + "|".join(unit_short_forms) + ")"
-    search_string = r"[0-9\(\) ]\* " + unit_short_forms
-    match_content = re.search(search_string, expr)
-    while match_content is not None:
-        expr = expr[0:match_content.span()[0]] + match_content.group().replace("*", " ") + expr[
-                                                                                           match_content.span()[1]:]
-        match_content = re.search(search_string, expr)
+    (
+        re.compile(r"[0-9\(\) ]\* " + legacy_alternatives(legacy_unit_short_forms)),
+        lambda string, match: string[:match.start()] + match.group().replace("*", " ") + string[match.end():],
+        resume_before(3+longest_name_length(legacy_unit_short_forms)),
+    ),
+]
+
 
+def apply_rewrite_rule(string, rule):
+    """
+        Rewrites the leftmost match of the pattern until there are no matches left.
+        Gives the same result as searching from the start of the string after each
+        rewrite, but the string is only scanned once from left to right.
+    """
+    pattern, rewrite, resume = rule
+    match = pattern.search(string)
+    while match is not None:
+        string = rewrite(string, match)
+        match = pattern.search(string, max(0, resume(string, match)))
+    return string
+
+
+def preprocess_legacy(expr, parameters):
+    """
+        Rewrites the expression using the rules in legacy_rewrite_rules.
+    """
+    # The first rule is not applied to the first character
+    expr = expr[0:1] + apply_rewrite_rule(expr[1:], legacy_rewrite_rules[0])
+    for rule in legacy_rewrite_rules[1:]:
+        expr = apply_rewrite_rule(expr, rule)
     return expr
 
 def transform_prefixes_to_standard(expr):
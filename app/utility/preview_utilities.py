@@ -5,7 +5,6 @@ from sympy.parsing.sympy_parser import standard_transformations, implicit_multip
 from typing_extensions import NotRequired
 
 from sympy import Symbol, parse_expr, srepr
-from latex2sympy2 import latex2sympy
 
 from copy import deepcopy
 
@@ -18,6 +17,15 @@ from .expression_utilities import (
 )
 
 
+def latex2sympy(*args, **kwargs):
+    """
+        Imports latex2sympy2 (and the ANTLR runtime it depends on) the first
+        time it is used, so that evaluations that do not use LaTeX do not pay for it.
+    """
+    from latex2sympy2 import latex2sympy as convert_latex
+    return convert_latex(*args, **kwargs)
+
+
 class Params(TypedDict):
     is_latex: bool
     simplify: NotRequired[bool]
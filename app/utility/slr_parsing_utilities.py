@@ -7,6 +7,9 @@
 # -----------------
 # Scanner utilities
 # -----------------
+import hashlib
+import json
+import os
 import re
 
 
@@ -430,6 +433,116 @@ class ExprNode(Token):
         return str(self.label)+": "+str(self.content)+" tags: "+str(self.tags)
 
 
+# ------------------------
+# Persisted parsing tables
+# ------------------------
+
+# Version of the format of the persisted parsing tables, files with another version are ignored
+slr_tables_version = 1
+
+# File that the persisted parsing tables are loaded from, it is created by `python -m app.build_slr_tables`
+slr_tables_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "slr_tables.json")
+
+# Persisted parsing tables, keyed by grammar hash, None until the file has been loaded
+_persisted_tables = None
+
+
+def code_fingerprint(code):
+    # The fingerprint must be the same in every process, so nested code objects are
+    # fingerprinted recursively and sets are sorted (their order depends on string hashing)
+    consts = []
+    for x in code.co_consts:
+        if hasattr(x, "co_code"):
+            consts.append(code_fingerprint(x))
+        elif isinstance(x, frozenset):
+            consts.append(repr(sorted(repr(y) for y in x)))
+        else:
+            consts.append(repr(x))
+    return repr((code.co_code.hex(), code.co_names, consts))
+
+
+def function_fingerprint(function):
+    # Conditions created by a factory share their code but can differ in the values
+    # they close over (or in their default arguments), so these are part of the fingerprint
+    if not hasattr(function, "__code__"):
+        return repr(function)
+    values = list(function.__defaults__ or tuple())+[cell.cell_contents for cell in (function.__closure__ or tuple())]
+    fingerprints = []
+    for x in values:
+        if hasattr(x, "__code__"):
+            fingerprints.append(function_fingerprint(x))
+        elif isinstance(x, (set, frozenset)):
+            fingerprints.append(repr(sorted(repr(y) for y in x)))
+        else:
+            fingerprints.append(repr(x))
+    return repr((code_fingerprint(function.__code__), fingerprints))
+
+
+def grammar_hash(token_list, productions, start_symbol, end_symbol, null_symbol, error_handler):
+    """
+        Returns a hash of everything that the parsing table depends on: the token patterns
+        (used to tokenize the productions), the productions, the start, end and null symbols
+        and the code and closure values of the error handler conditions. Reduction functions and token rules
+        are not part of the hash since they are only used when parsing.
+    """
+    grammar = [
+        slr_tables_version,
+        [(x[0], x[1], len(x) > 2 and x[2] == catch_undefined) for x in token_list],
+        [(x[0], x[1]) for x in productions],
+        [start_symbol, end_symbol, null_symbol],
+        [function_fingerprint(x[0]) for x in error_handler],
+    ]
+    return hashlib.sha256(json.dumps(grammar).encode("utf-8")).hexdigest()
+
+
+def load_persisted_tables(path=None):
+    """
+        Reads persisted parsing tables from path (by default `slr_tables_path`) and
+        returns a dictionary with the tables for each grammar hash. If the file does
+        not exist, cannot be read or has another version an empty dictionary is returned.
+    """
+    if path is None:
+        path = slr_tables_path
+    try:
+        with open(path, "r", encoding="utf-8") as tables_file:
+            content = json.load(tables_file)
+    except (OSError, ValueError):
+        return dict()
+    if not isinstance(content, dict) or content.get("version", None) != slr_tables_version:
+        return dict()
+    return content.get("tables", dict())
+
+
+def set_persisted_tables(tables):
+    """
+        Replaces the persisted parsing tables that are used when parsers are created,
+        None means that the tables will be loaded from `slr_tables_path` when needed.
+    """
+    global _persisted_tables
+    _persisted_tables = tables
+
+
+def get_persisted_tables(grammar_hash):
+    global _persisted_tables
+    if _persisted_tables is None:
+        _persisted_tables = load_persisted_tables()
+    return _persisted_tables.get(grammar_hash, None)
+
+
+def save_persisted_tables(parsers, path=None):
+    """
+        Writes the parsing tables of the given parsers to path (by default `slr_tables_path`).
+    """
+    if path is None:
+        path = slr_tables_path
+    content = {
+        "version": slr_tables_version,
+        "tables": {parser.grammar_hash: parser.tables_data() for parser in parsers},
+    }
+    with open(path, "w", encoding="utf-8") as tables_file:
+        json.dump(content, tables_file, separators=(",", ":"))
+
+
 class SLR_Parser:
 
     def default_error_action(parser, stack, a, input_tokens, tokens, output):
@@ -445,9 +558,10 @@ class SLR_Parser:
             f"state: {parser.state_string(parser._states_index[stack[-1]])}\n" +
             f"{'-'*m}")
 
-    def __init__(self, token_list, productions, start_symbol, end_symbol, null_symbol, error_handler=[], tag_handler=tag_transfer):
+    def __init__(self, token_list, productions, start_symbol, end_symbol, null_symbol, error_handler=[], tag_handler=tag_transfer, use_persisted_tables=True):
         self.token_list = token_list
         self.token_list.sort(key=lambda x: -len(x[0]))
+        self._scanners = dict()
         self.productions = productions
         self.start_symbol = start_symbol
         self.end_symbol = end_symbol
@@ -471,22 +585,38 @@ class SLR_Parser:
         if len(duplicate_error_string) > 0:
             raise Exception("There are duplicate productions:\n" + "\n".join(duplicate_error_string))
 
+        # Use persisted tables if there are tables for this grammar (see `save_persisted_tables`),
+        # otherwise the productions are tokenized and the tables are computed
+        self.grammar_hash = grammar_hash(token_list, productions, start_symbol, end_symbol, null_symbol, error_handler)
+        tables = get_persisted_tables(self.grammar_hash) if use_persisted_tables else None
+        self.persisted_tables_used = tables is not None
+
         # Tokenize productions
-        productions_token = [
-            (self.scan(x[0], mode="bnf")[0], self.scan(x[1], mode="bnf")) for x in productions
-        ]
+        if tables is not None:
+            productions_token = [
+                (Token(head[0], head[1], x[0], head[2], head[3]), [Token(t[0], t[1], x[1], t[2], t[3]) for t in body])
+                for ((head, body), x) in zip(tables["productions"], productions)
+            ]
+        else:
+            productions_token = [
+                (self.scan(x[0], mode="bnf")[0], self.scan(x[1], mode="bnf")) for x in productions
+            ]
         self.productions_token = productions_token
 
         # Analyse productions to find terminals and non-terminals
         non_terminals_token = []
         terminals_token = [self.end_token, self.null_token]
+        non_terminal_labels = set()
         for token in [prod[0] for prod in productions_token]:
-            if token not in non_terminals_token:
+            if token.label not in non_terminal_labels:
                 non_terminals_token.append(token)
+                non_terminal_labels.add(token.label)
+        symbol_labels = {token.label for token in terminals_token} | non_terminal_labels
         for production in productions_token:
             for token in production[1]:
-                if token not in terminals_token and token not in non_terminals_token:
+                if token.label not in symbol_labels:
                     terminals_token.append(token)
+                    symbol_labels.add(token.label)
         self.symbols = terminals_token+non_terminals_token
         self.terminals_token = terminals_token
         self.non_terminals_token = non_terminals_token
@@ -494,153 +624,246 @@ class SLR_Parser:
         # Create reductions dictionary
         self.reductions = {tuple(productions_token[k][1]): productions[k][2] for k in range(0, len(productions))}
 
-        # Compute dictionary with FIRST for all single tokens
-        first_dict = {**{x: [x] for x in terminals_token}, **{x: [] for x in non_terminals_token}}
-        lengths = [-1]*len(non_terminals_token)
+        # Symbols are identified by their index in the list of symbols, terminals come first
+        symbols = terminals_token+non_terminals_token
+        symbol_ids = dict()
+        for j, h in enumerate(symbols):
+            symbol_ids[h.label] = j
+        number_of_terminals = len(terminals_token)
+        productions_ids = [(symbol_ids[head.label], tuple(symbol_ids[token.label] for token in body)) for (head, body) in productions_token]
+        productions_of = [[] for _ in symbols]
+        for k, (head, body) in enumerate(productions_ids):
+            productions_of[head].append(k)
+        self._symbol_ids = symbol_ids
+        self._productions_ids = productions_ids
+        self._productions_of = productions_of
+        self._number_of_terminals = number_of_terminals
+
+        symbols_index = {}
+        for j, h in enumerate(symbols):
+            symbols_index.update({h: j, j: h})
+        self._symbols_index = symbols_index
+
+        if tables is not None:
+            self.load_tables(tables)
+        else:
+            self.compute_tables()
+        states = self.states
+        number_of_states = len(states)
+        parsing_table = self.parsing_table
+
+        # Check for unreachable states and reductions
+        reachable = {entry for row in parsing_table for entry in row}
+        unreachable = [x for x in range(0, number_of_states+len(self.reductions)) if x not in reachable]
+
+        if len(unreachable) > 1:
+            print("Unreachable states:")
+            for x in [y for y in unreachable if y < len(states)]:
+                print("\t"+self.state_string(self._states_index[x]))
+            print("Unreachable reductions:")
+            for x in [y for y in unreachable if y >= len(states) and y < len(states)+len(productions_token)]:
+                print("\t"+self.productions[x-len(states)][0]+"-->"+str(self.productions[x-len(states)][1]))
+
+        return
+
+    def compute_tables(self):
+        """
+            Computes FIRST, FOLLOW, the states, the transitions and the parsing table.
+        """
+        productions_token = self.productions_token
+        productions_ids = self._productions_ids
+        non_terminals_token = self.non_terminals_token
+        symbols = self.symbols
+        symbol_ids = self._symbol_ids
+        number_of_terminals = self._number_of_terminals
+        start_token = self.start_token
+        end_token = self.end_token
+        end_id = symbol_ids[end_token.label]
+        null_id = symbol_ids[self.null_token.label]
+        null_bit = 1 << null_id
+
+        # Compute FIRST for all single tokens, each set is represented as an
+        # integer where bit j is set if symbol j is in the set
+        first_bits = [1 << j if j < number_of_terminals else 0 for j in range(0, len(symbols))]
         any_first_changed = True
         while any_first_changed:
             any_first_changed = False
-            for k, x in enumerate(non_terminals_token):
-                if lengths[k] != len(first_dict[x]):
-                    lengths[k] = len(first_dict[x])
+            for (head, body) in productions_ids:
+                bits = first_bits[head]
+                for token in body:
+                    bits |= first_bits[token]
+                    if not first_bits[token] & null_bit:
+                        break
+                if bits != first_bits[head]:
+                    first_bits[head] = bits
                     any_first_changed = True
-            for nt in non_terminals_token:
-                prods = [x[1] for x in productions_token if x[0] == nt]
-                for prod in prods:
-                    for token in prod:
-                        for x in first_dict[token]:
-                            if x not in first_dict[nt]:
-                                first_dict[nt].append(x)
-                        if null_token not in first_dict[token]:
+        self._first_dict = {x: [symbols[j] for j in range(0, len(symbols)) if first_bits[symbol_ids[x.label]] >> j & 1] for x in symbols}
+
+        # Compute FOLLOW for all non_terminals, for each occurrence of a non-terminal in a production
+        # the part of FIRST of the rest of the production that is added to FOLLOW is computed once
+        follow_rules = []
+        for (head, body) in productions_ids:
+            for k, token in enumerate(body):
+                if token >= number_of_terminals:
+                    rest = body[k+1:]
+                    if len(rest) == 1:
+                        inherits_follow = bool(first_bits[rest[0]] & null_bit)
+                    else:
+                        inherits_follow = len(rest) == 0
+                    first_of_rest = 0
+                    for rest_token in rest:
+                        first_of_rest |= first_bits[rest_token]
+                        if rest_token != null_id:
                             break
-        self._first_dict = first_dict
-
-        # Compute dictionary with FOLLOW for all non_terminals
-        first = self.first
-        follow = {x: [] for x in non_terminals_token}
-        follow[start_token].append(end_token)
-        lengths = [-1]*len(non_terminals_token)
-        while lengths != [len(follow[x]) for x in non_terminals_token]:
-            lengths = [len(follow[x]) for x in non_terminals_token]
-            for (head, body) in productions_token:
-                for k, token in enumerate(body):
-                    if token in non_terminals_token:
-                        if null_token in self.first(body[k+1:]) or len(body[k+1:]) == 0:
-                            for item in follow[head]:
-                                if item not in follow[token]:
-                                    follow[token].append(item)
-                        for item in first(body[k+1:]):
-                            if item != null_token and item not in follow[token]:
-                                follow[token].append(item)
-        self._follow = follow
-
-        # Compute all states and the transitions between them
-        closure = self.closure
-        compute_transitions = self.compute_transitions
+                    follow_rules.append((token, head, inherits_follow, first_of_rest & ~null_bit))
+        follow_bits = [0]*len(symbols)
+        follow_bits[symbol_ids[start_token.label]] |= 1 << end_id
+        any_follow_changed = True
+        while any_follow_changed:
+            any_follow_changed = False
+            for (token, head, inherits_follow, first_of_rest) in follow_rules:
+                bits = follow_bits[token] | first_of_rest
+                if inherits_follow:
+                    bits |= follow_bits[head]
+                if bits != follow_bits[token]:
+                    follow_bits[token] = bits
+                    any_follow_changed = True
+        self._follow = {x: [symbols[j] for j in range(0, len(symbols)) if follow_bits[symbol_ids[x.label]] >> j & 1] for x in non_terminals_token}
+
+        # Compute all states and the transitions between them, states are identified by
+        # their kernel (the items that are not added by the closure) in the order they
+        # were created, and the closure of each kernel is only computed once
         start_productions = tuple([(k, 0) for k in range(0, len(productions_token)) if productions_token[k][0] == start_token])
-        states = {start_productions: closure(start_productions)}
+        states = {start_productions: self.closure(start_productions)}
+        states_order = [start_productions]
+        state_ids = {start_productions: 0}
         transitions = {}
+        state_transitions = []
         new_states = [start_productions]
         while len(new_states) > 0:
             state = new_states.pop(0)
-            trans = compute_transitions(closure(list(state)))
+            trans = self.compute_transitions(states[state])
             transitions.update({state: trans})
+            targets = dict()
             for t in trans:
-                if tuple(t[1]) not in states.keys():
-                    states.update({tuple(t[1]): closure(t[1])})
-                    new_states.append(tuple(t[1]))
+                kernel = tuple(t[1])
+                if kernel not in state_ids:
+                    state_ids[kernel] = len(states_order)
+                    states_order.append(kernel)
+                    states.update({kernel: self.closure(kernel)})
+                    new_states.append(kernel)
+                targets.setdefault(symbol_ids[t[0].label], state_ids[kernel])
+            state_transitions.append(targets)
         self.states = states
         self.transitions = transitions
 
-        # Create index dictionaries to simplify state table construction
+        # Create index dictionary to simplify state table construction
         states_index = {}
-        for i, s in enumerate(states):
+        for i, s in enumerate(states_order):
             states_index.update({s: i, i: s})
         self._states_index = states_index
 
-        symbols_index = {}
-        symbols = terminals_token+non_terminals_token
-        for j, h in enumerate(symbols):
-            symbols_index.update({h: j, j: h})
-        self._symbols_index = symbols_index
+        # Compute parsing table, when there are several possible actions for an entry
+        # the action is chosen based on precedence, precedence is determined by location
+        # in productions array (higher index in array means higher precedence)
+        number_of_states = len(states_order)
+        start_id = symbol_ids[start_token.label]
+        follow_ids = [[j for j in range(0, len(symbols)) if bits >> j & 1] for bits in follow_bits]
+        chosen_actions = [[None]*len(symbols) for _ in states_order]
+        for (i, state) in enumerate(states_order):
+            row = chosen_actions[i]
+            for (production_index, dot_index) in states[state]:
+                (head, body) = productions_ids[production_index]
+                if dot_index < len(body):
+                    # Shift actions and goto table
+                    actions = [(body[dot_index], state_transitions[i][body[dot_index]])]
+                elif head == start_id:
+                    actions = [(end_id, number_of_states)]
+                else:
+                    # Reduce actions
+                    actions = [(a, number_of_states+production_index) for a in follow_ids[head]]
+                for (a, action) in actions:
+                    if row[a] is None or row[a][0] < production_index:
+                        row[a] = (production_index, action)
 
-        # Compute parsing table
+        # Entries without actions are errors, the error handlers decide which error action is used
         parsing_table = []
-        for i in range(0, len(states)):
+        for i in range(0, number_of_states):
+            items_token = None
             parsing_table.append([])
             for j in range(0, len(symbols)):
-                parsing_table[i].append([])
-
-        for state in states:
-            for (production_index, dot_index) in closure(state):
-                # Fill in shift actions and goto table
-                (head, body) = productions_token[production_index]
-                if dot_index < len(body):
-                    a = body[dot_index]
-                    table_entry = parsing_table[states_index[state]][symbols_index[a]]
-                    for (symbol, next_state) in transitions[state]:
-                        if symbol == a:
-                            table_entry.append((production_index, states_index[tuple(next_state)]))
-                            break
-                elif head == self.start_token:
-                    parsing_table[states_index[state]][symbols_index[self.end_token]].append((production_index, len(self.states)))
-                else:
-                    # Fill in reduce actions
-                    for a in follow[head]:
-                        table_entry = parsing_table[states_index[state]][symbols_index[a]]
-                        table_entry.append((production_index, len(states)+production_index))
-
-        # Choose correct table entry based on precedence,
-        # precedence is determined by location in productions
-        # array (higher index in array means higher precedence)
-        for i in range(0, len(states)):
-            for j in range(0, len(symbols)):
-                table_entry = parsing_table[i][j]
-                if len(table_entry) == 0:
+                if chosen_actions[i][j] is not None:
+                    parsing_table[i].append(chosen_actions[i][j][1])
+                    continue
+                parsing_table[i].append(-1)
+                if len(self.error_handler) > 0:
                     # items_token gives a list of pairs that contain the parts of the production before and after the current point
-                    items_token = [(productions_token[x[0]][1][0:x[1]], productions_token[x[0]][1][x[1]:]) for x in states_index[i]]
-                    next_symbol = symbols_index[j]
-                    parsing_table[i][j] = -1
+                    if items_token is None:
+                        items_token = [(productions_token[x[0]][1][0:x[1]], productions_token[x[0]][1][x[1]:]) for x in states_order[i]]
+                    next_symbol = symbols[j]
                     for (index, condition) in enumerate([x[0] for x in self.error_handler], 2):
                         if condition(items_token, next_symbol):
                             parsing_table[i][j] = -index
                             break
-                elif len(table_entry) == 1:
-                    parsing_table[i][j] = table_entry[0][1]
-                else:
-                    precedence = table_entry[0][0]
-                    index = 0
-                    for k, action in enumerate(table_entry[1:], 1):
-                        if precedence < action[0]:
-                            precedence = action[0]
-                            index = k
-                    parsing_table[i][j] = table_entry[index][1]
-        self.parsing_table = parsing_table
-
-        # Check for unreachable states and reductions
-        unreachable = list(range(0, len(states)+len(self.reductions)))
-        for i in range(0, len(states)):
-            for j in range(0, len(symbols)):
-                if parsing_table[i][j] in unreachable:
-                    unreachable.remove(parsing_table[i][j])
         self.parsing_table = parsing_table
 
-        if len(unreachable) > 1:
-            print("Unreachable states:")
-            for x in [y for y in unreachable if y < len(states)]:
-                print("\t"+self.state_string(self._states_index[x]))
-            print("Unreachable reductions:")
-            for x in [y for y in unreachable if y >= len(states) and y < len(states)+len(productions_token)]:
-                print("\t"+self.productions[x-len(states)][0]+"-->"+str(self.productions[x-len(states)][1]))
+    def load_tables(self, tables):
+        """
+            Restores FIRST, FOLLOW, the states, the transitions and the parsing
+            table from persisted tables (see `tables_data`).
+        """
+        symbols = self.symbols
+        productions_token = self.productions_token
+        states_order = [tuple(tuple(item) for item in kernel) for kernel in tables["states"]]
+        self._first_dict = {x: [symbols[j] for j in ids] for (x, ids) in zip(symbols, tables["first"])}
+        self._follow = {x: [symbols[j] for j in ids] for (x, ids) in zip(self.non_terminals_token, tables["follow"])}
+        self.states = {kernel: [tuple(item) for item in closure] for (kernel, closure) in zip(states_order, tables["closures"])}
 
-        return
+        # The token of a transition is the token before the dot in the first item of the kernel it leads to
+        transitions = {}
+        for (kernel, targets) in zip(states_order, tables["transitions"]):
+            transitions.update({kernel: []})
+            for target in targets:
+                (i, j) = states_order[target][0]
+                transitions[kernel].append((productions_token[i][1][j-1], list(states_order[target])))
+        self.transitions = transitions
 
-    def scan(self, expr, mode="expression"):
+        states_index = {}
+        for i, s in enumerate(states_order):
+            states_index.update({s: i, i: s})
+        self._states_index = states_index
+        self.parsing_table = tables["parsing_table"]
+
+    def tables_data(self):
+        """
+            Returns the tokenized productions, FIRST, FOLLOW, the states, the transitions
+            and the parsing table on a form that can be serialised as JSON.
+        """
+        symbol_ids = self._symbol_ids
+        states_order = [self._states_index[i] for i in range(0, len(self.states))]
+        return {
+            "productions": [
+                [[head.label, head.content, head.start, head.end], [[t.label, t.content, t.start, t.end] for t in body]]
+                for (head, body) in self.productions_token
+            ],
+            "first": [[symbol_ids[x.label] for x in self._first_dict[h]] for h in self.symbols],
+            "follow": [[symbol_ids[x.label] for x in self._follow[h]] for h in self.non_terminals_token],
+            "states": [[list(item) for item in kernel] for kernel in states_order],
+            "closures": [[list(item) for item in self.states[kernel]] for kernel in states_order],
+            "transitions": [[self._states_index[tuple(t[1])] for t in self.transitions[kernel]] for kernel in states_order],
+            "parsing_table": self.parsing_table,
+        }
+
+    def compile_scanner(self, mode):
+        """
+            Compiles the token patterns used in the given mode into a single regular expression.
+            Each pattern is put in an optional lookahead with its own group, so that matching
+            the combined expression once at a position gives the match for every pattern.
+            Returns the combined expression, the group number and label for each pattern,
+            an expression that matches any of the patterns (used to skip undefined lexemes),
+            the tokens that use rules and the token used to catch undefined lexemes.
+        """
         token_list = self.token_list
-        tokens = []
-
-        def new_token(token_label, token_content, token_start, token_end):
-            return Token(token_label, token_content, expr, token_start, token_end)
 
         token_catch_undefined = [x for x in token_list if len(x) > 2 and x[2] == catch_undefined]
         if len(token_catch_undefined) > 1:
@@ -657,19 +880,46 @@ class SLR_Parser:
             token_rules = []
             token_symbols = [(x[0], x[1]) for x in token_list]
 
+        combined_pattern = re.compile("".join(f"(?:(?=(?P<token{k}>{re_content})))?" for k, (re_content, _) in enumerate(token_symbols)))
+        token_groups = [(combined_pattern.groupindex[f"token{k}"], label) for k, (_, label) in enumerate(token_symbols)]
+        any_token_pattern = re.compile("|".join(f"(?:{re_content})" for (re_content, _) in token_symbols))
+        return combined_pattern, token_groups, any_token_pattern, token_rules, token_catch_undefined
+
+    def scan(self, expr, mode="expression"):
+        tokens = []
+
+        def new_token(token_label, token_content, token_start, token_end):
+            return Token(token_label, token_content, expr, token_start, token_end)
+
+        scanner = self._scanners.get(mode, None)
+        if scanner is None:
+            scanner = self.compile_scanner(mode)
+            self._scanners[mode] = scanner
+        combined_pattern, token_groups, any_token_pattern, token_rules, token_catch_undefined = scanner
+
+        def add_undefined(start, end):
+            if token_catch_undefined is not None:
+                tokens.append(token_catch_undefined[2](token_catch_undefined[1], expr[start:end+1], expr, start, end))
+            else:
+                raise Exception(f"Undefined input: {expr[start:end+1]}")
+
         index = 0
-        string = ""
-        while index-len(string) < len(expr):
-            end_token = None
+        undefined_start = 0
+        while index < len(expr):
+            # If there are no rules, skip ahead to the next position where some pattern matches
+            if len(token_rules) == 0:
+                next_match = any_token_pattern.search(expr, index)
+                if next_match is None:
+                    break
+                index = next_match.start()
             end_token_length = 0
             content = ""
             label = None
-            for (re_content, current_label) in token_symbols:
-                match_content = re.match(re_content, expr[index:])
-                if match_content is not None:
-                    current_content = match_content.group()
-                    if len(current_content) > end_token_length:
-                        content = current_content
+            match = combined_pattern.match(expr, index)
+            if match.lastindex is not None:
+                for (group, current_label) in token_groups:
+                    if match.end(group)-index > end_token_length:
+                        content = match.group(group)
                         end_token_length = len(content)
                         label = current_label
             for token in token_rules:
@@ -681,63 +931,48 @@ class SLR_Parser:
                         end_token_length = len(match_rule)
                         label = current_label
             if label is None:
-                string = string+expr[index]
                 index += 1
-            else:
-                end_token = new_token(label, content, index, index+end_token_length-1)
-            if len(string) > 0 and (end_token is not None or index >= len(expr)):
-                if token_catch_undefined is not None:
-                    tokens.append(token_catch_undefined[2](token_catch_undefined[1], string, expr, index-len(string), index-1))
-                else:
-                    raise Exception(f"Undefined input: {string}")
-                string = ""
-            if end_token is not None:
-                tokens.append(end_token)
-                index += end_token_length
+                continue
+            if index > undefined_start:
+                add_undefined(undefined_start, index-1)
+            tokens.append(new_token(label, content, index, index+end_token_length-1))
+            index += end_token_length
+            undefined_start = index
+        if undefined_start < len(expr):
+            add_undefined(undefined_start, len(expr)-1)
         return tokens
 
     def closure(self, item_set):
-        non_terminals = self.non_terminals_token
-        productions = self.productions_token
         # Items are represented as (i,j) where i indicates index
         # in production list and j position of inserted dot
-        closure_set = []
-        offset = -1
-        new_items = item_set
-        added_to_closure = [False]*len(non_terminals)
-        while len(new_items) > 0:
-            closure_set += new_items
-            offset += len(new_items)
-            new_items = []
-            for item in closure_set:
-                i = item[0]
-                j = item[1]
-                follow = None
-                if j < len(productions[i][1]):
-                    for k, nt in enumerate(non_terminals):
-                        if productions[i][1][j] == nt:
-                            follow = k
-                            break
-                    if follow is not None and not added_to_closure[follow]:
-                        for k, production in enumerate(productions):
-                            if production[0] == non_terminals[follow]:
-                                new_items.append((k, 0))
-                        added_to_closure[follow] = True
+        productions_ids = self._productions_ids
+        productions_of = self._productions_of
+        number_of_terminals = self._number_of_terminals
+        closure_set = list(item_set)
+        added_to_closure = set()
+        index = 0
+        while index < len(closure_set):
+            (i, j) = closure_set[index]
+            body = productions_ids[i][1]
+            if j < len(body) and body[j] >= number_of_terminals and body[j] not in added_to_closure:
+                closure_set += [(k, 0) for k in productions_of[body[j]]]
+                added_to_closure.add(body[j])
+            index += 1
         return closure_set
 
     def compute_transitions(self, item_set):
+        productions_ids = self._productions_ids
         productions_token = self.productions_token
-        transitions = []
-        for item in item_set:
-            i = item[0]
-            j = item[1]
-            if j < len(productions_token[i][1]):
-                token = productions_token[i][1][j]
-                if token not in [x[0] for x in transitions]:
-                    transitions.append((token, [(i, j+1)]))
+        transitions = dict()
+        for (i, j) in item_set:
+            body = productions_ids[i][1]
+            if j < len(body):
+                transition = transitions.get(body[j], None)
+                if transition is None:
+                    transitions[body[j]] = (productions_token[i][1][j], [(i, j+1)])
                 else:
-                    transitions[[x[0] for x in transitions].index(token)][1].append((i, j+1))
-        return transitions
+                    transition[1].append((i, j+1))
+        return list(transitions.values())
 
     def first(self, tokens):
         # Computes FIRST for strings of tokens
@@ -0,0 +1,103 @@
+import signal
+import threading
+import time
+from contextlib import contextmanager
+
+# Shortest time (in seconds) that the interval timer will be set to
+minimum_timer_delay = 1e-4
+
+# If the timeout is caught by some code that is being interrupted the
+# timeout is raised again after this many seconds until it propagates
+timeout_repeat_interval = 0.05
+
+
+class EvaluationTimeout(BaseException):
+    """
+        Raised when an evaluation runs past its time budget.
+        This is a subclass of BaseException rather than Exception so that
+        it is not caught by the `except Exception` clauses that are used
+        throughout the evaluation code (and in SymPy) to handle failed
+        comparisons.
+    """
+    pass
+
+
+class TimeBudget:
+    """
+        Keeps track of how much of a time budget (given in milliseconds) remains.
+    """
+
+    def __init__(self, milliseconds, deadline=None):
+        if deadline is None:
+            deadline = time.monotonic()+float(milliseconds)/1000
+        self.deadline = deadline
+
+    def remaining(self):
+        """
+            Returns the remaining time in seconds.
+        """
+        return max(0.0, self.deadline-time.monotonic())
+
+    def expired(self):
+        return self.remaining() <= 0
+
+    def share(self, parts):
+        """
+            Returns a new budget that holds an equal share of the remaining time
+            if the remaining time is split in the given number of parts.
+        """
+        now = time.monotonic()
+        remaining = max(0.0, self.deadline-now)
+        return TimeBudget(None, deadline=now+remaining/max(parts, 1))
+
+
+def can_interrupt():
+    """
+        Running code can only be interrupted when signals are available, i.e.
+        on Unix-like systems, and only in the main thread.
+    """
+    return hasattr(signal, "setitimer") and threading.current_thread() is threading.main_thread()
+
+
+@contextmanager
+def interrupt_after(seconds):
+    """
+        Raises EvaluationTimeout in the code running inside the with-block
+        if it has not finished after the given number of seconds.
+        If the code cannot be interrupted (see can_interrupt) the code
+        runs until it is finished.
+    """
+    if not can_interrupt():
+        yield
+        return
+    # The timer might fire after the code in the with-block has finished, the timeout
+    # is then ignored since the handler only raises it while the timer is armed
+    armed = [True]
+
+    def raise_timeout(signum, frame):
+        if armed[0]:
+            raise EvaluationTimeout()
+
+    start = time.monotonic()
+    previous_handler = signal.signal(signal.SIGALRM, raise_timeout)
+    previous_delay, previous_interval = signal.setitimer(
+        signal.ITIMER_REAL,
+        max(seconds, minimum_timer_delay),
+        timeout_repeat_interval
+    )
+    try:
+        yield
+    finally:
+        # If the timeout is raised before the timer has been disarmed the whole
+        # teardown is retried, so that the timer and handler are always restored
+        while True:
+            try:
+                armed[0] = False
+                signal.setitimer(signal.ITIMER_REAL, 0)
+                signal.signal(signal.SIGALRM, previous_handler if previous_handler is not None else signal.SIG_DFL)
+                if previous_delay > 0:
+                    elapsed = time.monotonic()-start
+                    signal.setitimer(signal.ITIMER_REAL, max(previous_delay-elapsed, minimum_timer_delay), previous_interval)
+                break
+            except EvaluationTimeout:
+                pass
@@ -0,0 +1,201 @@
+import json
+import sys
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Names of the stages of the evaluation pipeline, in the order they are executed
+evaluation_stages = [
+    "preprocess",
+    "parse",
+    "preview",
+    "criteria_parsing",
+    "graph_construction",
+    "graph_evaluation",
+]
+
+# Dictionary where the time spent in each stage is accumulated, None when stage times are not recorded
+_stage_times = ContextVar("stage_times", default=None)
+
+# Tracer that spans are sent to, None when tracing is not enabled
+_tracer = ContextVar("tracer", default=None)
+
+
+class MemorySink:
+    """
+        Stores all spans in a list.
+    """
+
+    def __init__(self):
+        self.spans = []
+
+    def __call__(self, span):
+        self.spans.append(span)
+
+
+class JSONLogSink:
+    """
+        Writes each span as a JSON line to a stream (stderr by default).
+    """
+
+    def __init__(self, stream=None):
+        self.stream = stream
+
+    def __call__(self, span):
+        stream = self.stream if self.stream is not None else sys.stderr
+        stream.write(json.dumps(span, default=str)+"\n")
+
+
+class CallbackSink:
+    """
+        Calls the given function with each span.
+    """
+
+    def __init__(self, callback):
+        self.callback = callback
+
+    def __call__(self, span):
+        self.callback(span)
+
+
+class Tracer:
+    """
+        Sends finished spans to the sink and to any listeners that are
+        currently registered, and counts the number of calls for each span name.
+    """
+
+    def __init__(self, sink=None):
+        if sink is None:
+            sink = MemorySink()
+        self.sink = sink
+        self.listeners = []
+        self.call_counts = dict()
+        self.depth = 0
+
+    def finish(self, span):
+        self.call_counts[span["name"]] = self.call_counts.get(span["name"], 0)+1
+        self.sink(span)
+        for listener in self.listeners:
+            listener.append(span)
+
+
+@contextmanager
+def tracing(sink=None):
+    """
+        Enables tracing while the with-block is running. Spans are sent to sink, which can
+        be any callable that takes a span (a dictionary) as its only argument, e.g. MemorySink,
+        JSONLogSink or CallbackSink. The context manager returns the Tracer.
+    """
+    tracer = Tracer(sink)
+    token = _tracer.set(tracer)
+    try:
+        yield tracer
+    finally:
+        _tracer.reset(token)
+
+
+def tracing_enabled():
+    return _tracer.get() is not None
+
+
+@contextmanager
+def collect_spans():
+    """
+        Returns a list that all spans that finish while the with-block is running are
+        added to, in addition to being sent to the sink. Does nothing unless tracing is enabled.
+    """
+    spans = []
+    tracer = _tracer.get()
+    if tracer is None:
+        yield spans
+        return
+    tracer.listeners.append(spans)
+    try:
+        yield spans
+    finally:
+        tracer.listeners.remove(spans)
+
+
+@contextmanager
+def span(name, category="evaluation", **attributes):
+    """
+        Records wall time and CPU time (in milliseconds) for the code in the with-block.
+        The returned dictionary can be used to add attributes while the span is running.
+        Does nothing unless tracing is enabled (see `tracing`).
+    """
+    tracer = _tracer.get()
+    if tracer is None:
+        yield attributes
+        return
+    depth = tracer.depth
+    tracer.depth += 1
+    wall_start = time.perf_counter()
+    cpu_start = time.thread_time()
+    try:
+        yield attributes
+    finally:
+        tracer.depth = depth
+        tracer.finish(
+            {
+                "name": name,
+                "category": category,
+                "wall_ms": 1000*(time.perf_counter()-wall_start),
+                "cpu_ms": 1000*(time.thread_time()-cpu_start),
+                "depth": depth,
+                "attributes": attributes,
+            }
+        )
+
+
+def summarise_spans(spans):
+    """
+        Returns the number of calls and the total wall time and CPU time for each span name.
+    """
+    summary = dict()
+    for finished_span in spans:
+        entry = summary.setdefault(finished_span["name"], {"calls": 0, "wall_ms": 0.0, "cpu_ms": 0.0})
+        entry["calls"] += 1
+        entry["wall_ms"] += finished_span["wall_ms"]
+        entry["cpu_ms"] += finished_span["cpu_ms"]
+    return summary
+
+
+@contextmanager
+def record_stage_times(stage_times=None):
+    """
+        While the with-block is running, the time (in seconds) spent in each stage
+        (see `stage`) is added to the dictionary that is returned by the context manager.
+    """
+    if stage_times is None:
+        stage_times = dict()
+    token = _stage_times.set(stage_times)
+    try:
+        yield stage_times
+    finally:
+        _stage_times.reset(token)
+
+
+@contextmanager
+def stage(name):
+    """
+        Marks the code in the with-block as part of the given stage. Does nothing
+        unless stage times are being recorded (see `record_stage_times`) or tracing
+        is enabled (see `tracing`), in the latter case a span is recorded for the stage.
+    """
+    stage_times = _stage_times.get()
+    if stage_times is None:
+        if _tracer.get() is None:
+            yield
+        else:
+            with span(name, category="stage"):
+                yield
+        return
+    start = time.perf_counter()
+    try:
+        if _tracer.get() is None:
+            yield
+        else:
+            with span(name, category="stage"):
+                yield
+    finally:
+        stage_times[name] = stage_times.get(name, 0.0)+time.perf_counter()-start